@@ -0,0 +1,189 @@
+"""
+このファイルは、同じ（または言い回しが近い）質問への回答を再利用する回答キャッシュを定義するファイルです。
+キーはモードと正規化した質問文で、任意でEmbeddingの類似度による一致も判定します。
+回答が参照した文書がインデックス上で更新・削除された場合、その回答は自動的に破棄されます。
+"""
+
+############################################################
+# 1. ライブラリの読み込み
+############################################################
+# 文字列の正規化を行うためのモジュール
+import unicodedata
+# 正規表現を扱うためのモジュール
+import re
+# 排他制御を行うためのモジュール
+import threading
+# 処理時間を扱うためのモジュール
+import time
+# 挿入順を保持する辞書（LRUの管理に使用）
+from collections import OrderedDict
+# 数値計算を行うためのモジュール
+import numpy as np
+# 固定値・変数を定義しているファイル
+import constants as ct
+
+
+############################################################
+# 2. 回答キャッシュ
+############################################################
+
+def normalize_query(query):
+    """
+    キャッシュのキーに使うため、質問文の表記ゆれを吸収する関数
+
+    Args:
+        query: ユーザーからの質問文
+
+    Returns:
+        str: 正規化した質問文
+    """
+    query = unicodedata.normalize("NFKC", query).lower()
+    query = re.sub(r"\s+", " ", query).strip()
+    return query.rstrip("?？!！。.")
+
+
+class AnswerCache:
+    """
+    TTL・LRUで管理する回答キャッシュ
+    - 完全一致: （モード, 正規化した質問文）
+    - 類似一致: 質問文のEmbeddingのコサイン類似度がしきい値以上（同じモードのみ）
+    - 無効化: 回答が参照したページの内容ハッシュが、インデックスのマニフェストと一致しなくなった場合
+    """
+
+    def __init__(self, max_entries=ct.ANSWER_CACHE_MAX_ENTRIES, ttl=ct.ANSWER_CACHE_TTL,
+                 similarity_threshold=ct.ANSWER_CACHE_SIMILARITY_THRESHOLD):
+        """
+        Args:
+            max_entries: キャッシュの最大件数
+            ttl: キャッシュの有効期間（秒）
+            similarity_threshold: 類似一致とみなすコサイン類似度（Noneの場合は類似一致を行わない）
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity_threshold = similarity_threshold
+        self.index_version = None
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, mode, query, query_vector=None):
+        """
+        キャッシュから回答を取得する
+
+        Args:
+            mode: 回答モード
+            query: ユーザーからの質問文
+            query_vector: 質問文のEmbedding（類似一致を行う場合）
+
+        Returns:
+            dict: キャッシュ済みの回答（answer, sources）。見つからない場合はNone
+        """
+        key = (mode, normalize_query(query))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._is_expired(entry):
+                del self._entries[key]
+                entry = None
+            if entry is None and query_vector is not None and self.similarity_threshold is not None:
+                entry = self._find_similar(mode, query_vector)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(entry["key"])
+            self.hits += 1
+            return {"answer": entry["answer"], "sources": entry["sources"]}
+
+    def put(self, mode, query, answer, sources, fingerprints, query_vector=None):
+        """
+        回答をキャッシュに保存する
+
+        Args:
+            mode: 回答モード
+            query: ユーザーからの質問文
+            answer: 回答本文
+            sources: 参照元のリスト
+            fingerprints: 参照したページIDと内容ハッシュの辞書
+            query_vector: 質問文のEmbedding（類似一致を行う場合）
+        """
+        key = (mode, normalize_query(query))
+        vector = None
+        if query_vector is not None:
+            vector = np.asarray(query_vector, dtype=np.float32)
+            vector /= np.linalg.norm(vector) or 1.0
+        with self._lock:
+            self._entries[key] = {
+                "key": key,
+                "mode": mode,
+                "answer": answer,
+                "sources": sources,
+                "fingerprints": fingerprints,
+                "vector": vector,
+                "created_at": time.monotonic(),
+            }
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def sync_index(self, index_version, manifest):
+        """
+        インデックスが切り替わった場合に、参照先が変わった回答を破棄する
+
+        Args:
+            index_version: インデックスを識別する値（世代のディレクトリなど）
+            manifest: インデックスの同期マニフェスト
+
+        Returns:
+            int: 破棄した件数
+        """
+        with self._lock:
+            if index_version == self.index_version:
+                return 0
+            pages = manifest["pages"] if manifest else {}
+            stale_keys = [
+                key for key, entry in self._entries.items()
+                if any(
+                    page_id not in pages or pages[page_id]["content_hash"] != content_hash
+                    for page_id, content_hash in entry["fingerprints"].items()
+                )
+            ]
+            for key in stale_keys:
+                del self._entries[key]
+            self.index_version = index_version
+            return len(stale_keys)
+
+    def stats(self):
+        """
+        キャッシュの利用状況を返す
+
+        Returns:
+            dict: 件数（entries）、ヒット数（hits）、ミス数（misses）、ヒット率（hit_rate）
+        """
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+    def _is_expired(self, entry):
+        """エントリが有効期間を過ぎているかを返す"""
+        return time.monotonic() - entry["created_at"] > self.ttl
+
+    def _find_similar(self, mode, query_vector):
+        """類似度がしきい値以上で最も近いエントリを返す（ロック取得済みで呼ぶ）"""
+        candidates = [
+            e for e in self._entries.values()
+            if e["mode"] == mode and e["vector"] is not None and not self._is_expired(e)
+        ]
+        if not candidates:
+            return None
+        query_vector = np.asarray(query_vector, dtype=np.float32)
+        query_vector /= np.linalg.norm(query_vector) or 1.0
+        scores = np.stack([e["vector"] for e in candidates]) @ query_vector
+        best = int(np.argmax(scores))
+        if scores[best] < self.similarity_threshold:
+            return None
+        return candidates[best]
@@ -0,0 +1,99 @@
+"""
+このファイルは、アプリのログ出力の設定を行う関数を定義するファイルです。
+ログはキューに積むだけで呼び出し元に戻り、ファイルへの書き込みは別スレッド（QueueListener）が行うため、
+リクエストの処理がディスクへの書き込みを待つことはありません。
+設定はプロセスにつき1度だけ行われ、Streamlitの再実行のたびにハンドラーが増えることはありません。
+"""
+
+############################################################
+# 1. ライブラリの読み込み
+############################################################
+# 環境変数・ファイルパスを操作するモジュール
+import os
+# スレッド間でデータを受け渡すためのモジュール
+import queue
+# 排他制御を行うためのモジュール
+import threading
+# プロセス終了時の処理を登録するためのモジュール
+import atexit
+# JSONデータを扱うためのモジュール
+import json
+# ログ出力を行うためのモジュール
+import logging
+# ログファイルをサイズで切り替えるハンドラー・キューを経由するハンドラー
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
+# 固定値・変数を定義しているファイル
+import constants as ct
+
+
+############################################################
+# 2. ログのフォーマット
+############################################################
+
+class StructuredFormatter(logging.Formatter):
+    """
+    辞書で渡されたログはJSONの1行として、それ以外は通常の書式で出力するフォーマッター
+    （会話ログなど、後から集計するイベントを辞書で出力する）
+    """
+
+    def format(self, record):
+        if not isinstance(record.msg, dict):
+            return super().format(record)
+        return json.dumps({
+            "time": self.formatTime(record),
+            "logger": record.name,
+            "level": record.levelname,
+            **record.msg,
+        }, ensure_ascii=False, default=str)
+
+
+############################################################
+# 3. ログ出力の設定
+############################################################
+
+_lock = threading.Lock()
+
+
+def configure_logging():
+    """
+    アプリのログ（application.log）とトレース（trace.jsonl）の出力を設定する関数
+    既に設定済みの場合は何もしない（モジュールが再読み込みされた場合もロガー側の目印で判定する）
+    """
+    with _lock:
+        os.makedirs(ct.LOG_DIR, exist_ok=True)
+        _add_queue_handler(
+            logging.getLogger(ct.LOGGER_NAME),
+            "application.log",
+            StructuredFormatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+        )
+        # トレースは1行に1件のJSONをそのまま出力し、アプリのログには出力しない
+        trace_logger = logging.getLogger(ct.TRACE_LOGGER_NAME)
+        _add_queue_handler(trace_logger, ct.TRACE_LOG_FILE, logging.Formatter("%(message)s"))
+        trace_logger.propagate = False
+
+
+def _add_queue_handler(logger, filename, formatter):
+    """ロガーにキュー経由でファイルに書き込むハンドラーを追加する（追加済みの場合は何もしない）"""
+    if getattr(logger, "_queue_listener", None) is not None:
+        return
+
+    file_handler = RotatingFileHandler(
+        filename=os.path.join(ct.LOG_DIR, filename),
+        maxBytes=ct.LOG_MAX_BYTES,
+        backupCount=ct.LOG_BACKUP_COUNT,
+        encoding="utf-8"
+    )
+    # 書式の整形は呼び出し元で行い（辞書のログもここで文字列になる）、書き込み側はそのまま出力する
+    file_handler.setFormatter(logging.Formatter("%(message)s"))
+    log_queue = queue.Queue()
+    queue_handler = QueueHandler(log_queue)
+    queue_handler.setFormatter(formatter)
+
+    listener = QueueListener(log_queue, file_handler, respect_handler_level=True)
+    listener.start()
+    # プロセス終了時に、キューに残ったログを書き出してから止める
+    atexit.register(listener.stop)
+
+    logger.addHandler(queue_handler)
+    logger.setLevel(logging.INFO)
+    logger._queue_listener = listener
@@ -0,0 +1,396 @@
+"""
+このファイルは、OpenAI・Notionに接続せずにアプリの性能を計測するベンチマークのコマンドです。
+Notionエクスポートのフィクスチャ・ローカルEmbeddingモデル・待ち時間を指定できる疑似チャットモデルを使い、
+アプリと同じ処理（refresh_index・initialize・get_llm_response）を実行して以下を計測します。
+- インデックス構築のスループット（ページ/秒・チャンク/秒）
+- コーパスのページ数・RETRIEVER_Kごとの検索時間
+- 質問から回答表示までの処理段ごとの時間
+- メモリ使用量（最大RSS）
+結果はJSONで保存し、--baselineで前回の結果と比較できます。
+
+使い方:
+    python benchmark.py                                   # 既定の条件で計測して benchmark_result.json に保存
+    python benchmark.py --sizes 100 500 --ks 5 10         # コーパスのページ数とRETRIEVER_Kを指定
+    python benchmark.py --baseline previous.json          # 前回の結果と比較
+"""
+
+############################################################
+# 1. ライブラリの読み込み
+############################################################
+# 環境変数・ファイルパスを操作するモジュール
+import os
+# コマンドライン引数を扱うためのモジュール
+import argparse
+# 一時ディレクトリを作成するためのモジュール
+import tempfile
+# ディレクトリの削除を行うためのモジュール
+import shutil
+# 日付・時刻を扱うためのモジュール
+import datetime
+# 処理時間を計測するためのモジュール
+import time
+# JSONデータを扱うためのモジュール
+import json
+# 実行環境の情報を取得するためのモジュール
+import platform
+# メモリ使用量を取得するためのモジュール
+import resource
+# ログ出力を行うためのモジュール
+import logging
+# 標準出力・終了コードを扱うためのモジュール
+import sys
+# streamlitアプリの表示を担当するモジュール（セッション変数の設定に使用）
+import streamlit as st
+# 固定値・変数を定義しているファイル
+import constants as ct
+# （自作）インデックスの世代管理を行うモジュール
+import index_store
+# （自作）Notionとベクターストアの差分同期を行うモジュール
+import notion_sync
+# （自作）アプリの初期化処理・共有リソースを取得する関数
+from initialize import initialize, get_shared_resources, get_active_index
+# （自作）処理段ごとの所要時間を記録するトレース
+import tracing
+# （自作）LLMの回答を取得する関数が定義されているモジュール
+import utils
+# （自作）Notionエクスポートのフィクスチャを読み込むローダー
+from fixture_loader import FixtureNotionLoader, load_fixture, expand_pages
+# （自作）トレースの集計に使う関数
+from trace_report import percentile, summarize
+
+# ロガーの設定
+logger = logging.getLogger(ct.LOGGER_NAME)
+
+
+############################################################
+# 2. 計測処理
+############################################################
+
+def get_peak_memory_mb():
+    """
+    プロセスの最大RSS（MB）を返す関数
+
+    Returns:
+        float: 最大RSS（MB）
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOSはバイト、Linuxはキロバイト単位
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def summarize_durations(durations_ms):
+    """
+    所要時間（ミリ秒）のリストを集計する関数
+
+    Args:
+        durations_ms: 所要時間（ミリ秒）のリスト
+
+    Returns:
+        dict: 件数・平均・p50・p95・p99・最大
+    """
+    values = sorted(durations_ms)
+    return {
+        "count": len(values),
+        "mean_ms": round(sum(values) / len(values), 3),
+        "p50_ms": round(percentile(values, 50), 3),
+        "p95_ms": round(percentile(values, 95), 3),
+        "p99_ms": round(percentile(values, 99), 3),
+        "max_ms": round(values[-1], 3),
+    }
+
+
+def get_directory_size(path):
+    """
+    ディレクトリ配下のファイルサイズの合計（バイト）を返す関数
+
+    Args:
+        path: ディレクトリのパス
+
+    Returns:
+        int: ファイルサイズの合計（バイト）
+    """
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            total += os.path.getsize(os.path.join(root, name))
+    return total
+
+
+def run_ingestion(pages, text_splitter=None):
+    """
+    空の状態からインデックスを構築し、スループットを計測する関数
+
+    Args:
+        pages: コーパスのページのリスト
+        text_splitter: チャンク分割に使うTextSplitter（省略時は設定ファイルの値）
+
+    Returns:
+        dict: ページ数・チャンク数・所要時間・スループット・インデックスのサイズ・処理段ごとの時間
+    """
+    # 前のコーパスのインデックスとEmbeddingキャッシュを消し、キャッシュなしの構築時間を計測する
+    shutil.rmtree(ct.CHROMA_DIR, ignore_errors=True)
+    shutil.rmtree(ct.DATA_DIR, ignore_errors=True)
+    os.makedirs(ct.CHROMA_DIR)
+    os.makedirs(ct.DATA_DIR)
+
+    started = time.perf_counter()
+    result = index_store.refresh_index(
+        index_store.create_embeddings(None),
+        FixtureNotionLoader(pages),
+        text_splitter or notion_sync.create_text_splitter(),
+        full_rebuild=True
+    )
+    elapsed = time.perf_counter() - started
+
+    return {
+        "pages": len(pages),
+        "chunks": result["chunk_count"],
+        "seconds": round(elapsed, 3),
+        "pages_per_sec": round(len(pages) / elapsed, 2),
+        "chunks_per_sec": round(result["chunk_count"] / elapsed, 2),
+        "index_bytes": get_directory_size(index_store.get_current_index_dir()),
+        "timings": {stage: round(seconds, 3) for stage, seconds in result["timings"].items()},
+        "peak_memory_mb": round(get_peak_memory_mb(), 1),
+    }
+
+
+def run_retrieval(queries, retriever_k, repeat):
+    """
+    共有リソースのRetrieverで検索時間を計測する関数
+
+    Args:
+        queries: 質問文のリスト
+        retriever_k: RETRIEVER_Kの値
+        repeat: 質問ごとの繰り返し回数
+
+    Returns:
+        dict: RETRIEVER_Kと検索時間の集計
+    """
+    # RETRIEVER_Kを変えて共有リソースを作り直す
+    ct.RETRIEVER_K = retriever_k
+    get_shared_resources.clear()
+    retriever = get_active_index()["retriever"]
+
+    # 初回のみ発生する読み込みを除くため、1度検索してから計測する
+    retriever.invoke(queries[0])
+    durations = []
+    for _ in range(repeat):
+        for query in queries:
+            started = time.perf_counter()
+            retriever.invoke(query)
+            durations.append((time.perf_counter() - started) * 1000)
+    return {"retriever_k": retriever_k, **summarize_durations(durations)}
+
+
+def run_answers(queries, retriever_k, repeat):
+    """
+    アプリと同じ処理で質問から回答表示までを実行し、処理段ごとの時間を計測する関数
+
+    Args:
+        queries: 質問文のリスト
+        retriever_k: RETRIEVER_Kの値
+        repeat: 質問ごとの繰り返し回数
+
+    Returns:
+        dict: モードごとの処理段ごとの時間の集計とトークン数の平均
+    """
+    ct.RETRIEVER_K = retriever_k
+    get_shared_resources.clear()
+    initialize()
+
+    results = {}
+    for mode in [ct.ANSWER_MODE_1, ct.ANSWER_MODE_2]:
+        st.session_state.mode = mode
+        traces = []
+        for _ in range(repeat):
+            for query in queries:
+                trace = tracing.RequestTrace(query, mode)
+                response = utils.get_llm_response(query, stream=ct.STREAMING_ENABLED, trace=trace)
+                # 画面表示の代わりに回答を最後まで受け取る
+                with trace.span("render"):
+                    answer = response["answer"]
+                    if not isinstance(answer, str):
+                        "".join(answer)
+                traces.append(trace.finish())
+
+        spans = summarize(traces)
+        results[mode] = {
+            "requests": len(traces),
+            "spans_ms": {
+                name: {key: round(value, 3) for key, value in stats.items()}
+                for name, stats in spans.items()
+            },
+            "mean_prompt_tokens": _mean(trace.get("prompt_tokens") for trace in traces),
+            "mean_context_tokens": _mean(trace.get("context_tokens") for trace in traces),
+        }
+    return results
+
+
+def _mean(values):
+    """Noneを除いた値の平均を求める（値がない場合はNone）"""
+    values = [value for value in values if value is not None]
+    return round(sum(values) / len(values), 1) if values else None
+
+
+############################################################
+# 3. 前回の結果との比較
+############################################################
+
+def compare_results(baseline, current, threshold):
+    """
+    前回の結果と比較し、悪化した指標を表示する関数
+
+    Args:
+        baseline: 前回の結果
+        current: 今回の結果
+        threshold: 悪化とみなす比率（1.2の場合、20%以上の悪化）
+
+    Returns:
+        list: 悪化した指標の説明のリスト
+    """
+    # 件数の少ないベンチマークではp95のばらつきが大きいため、中央値（p50）で比較する
+    metrics = []
+    # スループットは大きいほど良いため、逆数の比率で比較する
+    baseline_ingestion = {item["pages"]: item for item in baseline.get("ingestion", [])}
+    for item in current["ingestion"]:
+        before = baseline_ingestion.get(item["pages"])
+        if before:
+            metrics.append((f"ingestion[{item['pages']}ページ] pages_per_sec",
+                            item["pages_per_sec"], before["pages_per_sec"], before["pages_per_sec"] / item["pages_per_sec"]))
+
+    baseline_retrieval = {(item["pages"], item["retriever_k"]): item for item in baseline.get("retrieval", [])}
+    for item in current["retrieval"]:
+        before = baseline_retrieval.get((item["pages"], item["retriever_k"]))
+        if before:
+            metrics.append((f"retrieval[{item['pages']}ページ, k={item['retriever_k']}] p50_ms",
+                            item["p50_ms"], before["p50_ms"], item["p50_ms"] / before["p50_ms"]))
+
+    for mode, item in current["answer"].items():
+        before = baseline.get("answer", {}).get(mode)
+        if before:
+            for name, stats in item["spans_ms"].items():
+                before_stats = before["spans_ms"].get(name)
+                if before_stats and before_stats["p50"] > 0:
+                    metrics.append((f"answer[{mode}] {name} p50_ms",
+                                    stats["p50"], before_stats["p50"], stats["p50"] / before_stats["p50"]))
+
+    regressions = []
+    print("前回の結果との比較（比率 > 1 は悪化）:")
+    for name, value, before, ratio in metrics:
+        flag = " ← 悪化" if ratio > threshold else ""
+        print(f"  {name}: {before} → {value}（{ratio:.2f}）{flag}")
+        if flag:
+            regressions.append(name)
+    return regressions
+
+
+############################################################
+# 4. メイン処理
+############################################################
+
+def main():
+    """ベンチマークを実行して結果を保存する関数"""
+    parser = argparse.ArgumentParser(description="OpenAI・Notionに接続せずにアプリの性能を計測します")
+    parser.add_argument("--fixture", default=ct.BENCHMARK_FIXTURE_FILE, help="Notionエクスポートのフィクスチャ")
+    parser.add_argument("--sizes", type=int, nargs="+", default=ct.BENCHMARK_CORPUS_SIZES, help="コーパスのページ数")
+    parser.add_argument("--ks", type=int, nargs="+", default=ct.BENCHMARK_RETRIEVER_KS, help="RETRIEVER_Kの値")
+    parser.add_argument("--repeat", type=int, default=ct.BENCHMARK_REPEAT, help="質問ごとの繰り返し回数")
+    parser.add_argument("--llm-first-token-ms", type=float, default=ct.FAKE_LLM_FIRST_TOKEN_LATENCY * 1000,
+                        help="疑似チャットモデルの最初のトークンまでの待ち時間（ミリ秒）")
+    parser.add_argument("--llm-token-ms", type=float, default=ct.FAKE_LLM_TOKEN_LATENCY * 1000,
+                        help="疑似チャットモデルのトークンごとの待ち時間（ミリ秒）")
+    parser.add_argument("--vector-store", choices=["chroma", "local"], default=ct.VECTOR_STORE_BACKEND,
+                        help="ベクターストアの種類")
+    parser.add_argument("--vector-index", choices=["ivf", "flat"], default=ct.LOCAL_VECTOR_INDEX,
+                        help="ローカルのベクターストアの検索方式（flatは全件走査の基準値）")
+    parser.add_argument("--output", default="benchmark_result.json", help="結果の保存先")
+    parser.add_argument("--baseline", help="比較する前回の結果")
+    parser.add_argument("--threshold", type=float, default=1.2, help="悪化とみなす比率")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format="%(asctime)s - %(levelname)s - %(message)s")
+    # アプリのログは作業ディレクトリのログファイルにのみ出力し、計測結果の表示と混ぜない
+    logger.propagate = False
+    fixture = load_fixture(args.fixture)
+    # 回答時間の計測には設定ファイルのRETRIEVER_Kを使う
+    default_retriever_k = ct.RETRIEVER_K
+    queries = [item["query"] for item in fixture["queries"]]
+    output_path = os.path.abspath(args.output)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    # 外部APIを使わない設定（回答キャッシュは使わず、毎回すべての処理段を実行する）
+    # 会話ログはメモリに保存し、計測中にインデックスの定期更新は行わない
+    os.environ["EMBEDDING_BACKEND"] = "local"
+    os.environ["LLM_BACKEND"] = "fake"
+    os.environ["SESSION_STORE_BACKEND"] = "memory"
+    ct.INDEX_REFRESH_ENABLED = False
+    os.environ["VECTOR_STORE_BACKEND"] = args.vector_store
+    ct.LOCAL_VECTOR_INDEX = args.vector_index
+    for name in ("OPENAI_API_KEY", "NOTION_INTEGRATION_TOKEN", "NOTION_DATABASE_ID"):
+        os.environ.setdefault(name, "benchmark")
+    ct.FAKE_LLM_FIRST_TOKEN_LATENCY = args.llm_first_token_ms / 1000
+    ct.FAKE_LLM_TOKEN_LATENCY = args.llm_token_ms / 1000
+    ct.ANSWER_CACHE_ENABLED = False
+
+    results = {
+        "started_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "environment": {"python": platform.python_version(), "platform": platform.platform()},
+        "config": {
+            "fixture": args.fixture,
+            "sizes": args.sizes,
+            "retriever_ks": args.ks,
+            "repeat": args.repeat,
+            "queries": len(queries),
+            "llm_first_token_ms": args.llm_first_token_ms,
+            "llm_token_ms": args.llm_token_ms,
+            "retrieval_mode": ct.RETRIEVAL_MODE,
+            "vector_store": args.vector_store,
+            "vector_index": args.vector_index if args.vector_store == "local" else None,
+            "chunk_size": ct.CHUNK_SIZE,
+            "chunk_overlap": ct.CHUNK_OVERLAP,
+        },
+        "ingestion": [],
+        "retrieval": [],
+        "answer": {},
+    }
+
+    # インデックス・ログ・キャッシュは一時ディレクトリに作成する
+    original_dir = os.getcwd()
+    work_dir = tempfile.mkdtemp(prefix="benchmark-")
+    os.chdir(work_dir)
+    try:
+        for size in args.sizes:
+            pages = expand_pages(fixture["pages"], size)
+            ingestion = run_ingestion(pages)
+            results["ingestion"].append(ingestion)
+            print(f"[{size}ページ] 構築: {ingestion['seconds']}秒（{ingestion['pages_per_sec']}ページ/秒, "
+                  f"{ingestion['chunks_per_sec']}チャンク/秒）")
+            for retriever_k in args.ks:
+                retrieval = run_retrieval(queries, retriever_k, args.repeat)
+                results["retrieval"].append({"pages": size, **retrieval})
+                print(f"[{size}ページ] 検索 k={retriever_k}: p50 {retrieval['p50_ms']}ms / p95 {retrieval['p95_ms']}ms")
+
+        # 回答時間は最後（最大）のコーパスで計測する
+        results["answer"] = run_answers(queries, default_retriever_k, args.repeat)
+        for mode, item in results["answer"].items():
+            total = item["spans_ms"]["total"]
+            print(f"[{mode}] 回答: p50 {total['p50']:.1f}ms / p95 {total['p95']:.1f}ms")
+        results["peak_memory_mb"] = round(get_peak_memory_mb(), 1)
+    finally:
+        os.chdir(original_dir)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"最大メモリ使用量: {results['peak_memory_mb']}MB")
+    print(f"結果を保存しました: {output_path}")
+
+    if baseline and compare_results(baseline, results, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+このファイルは、Webアプリとは別にベクターストア（インデックス）を構築・更新するコマンドです。
+デプロイ前や定期実行でインデックスを用意しておくことで、Webアプリは構築済みのインデックスを開くだけになります。
+
+使い方:
+    python build_index.py           # 公開中のインデックスをNotionと差分同期して新しい世代を公開
+    python build_index.py --full    # 全件を再構築して新しい世代を公開
+"""
+
+############################################################
+# 1. ライブラリの読み込み
+############################################################
+# 「.env」ファイルから環境変数を読み込むための関数
+from dotenv import load_dotenv
+# 環境変数を操作するモジュール
+import os
+# コマンドライン引数を扱うためのモジュール
+import argparse
+# ログ出力を行うためのモジュール
+import logging
+# 標準出力・終了コードを扱うためのモジュール
+import sys
+# 処理時間を計測するためのモジュール
+import time
+# （自作）Notionとベクターストアの差分同期を行うモジュール
+import notion_sync
+# （自作）インデックスの世代管理を行うモジュール
+import index_store
+
+
+############################################################
+# 2. メイン処理
+############################################################
+
+def main():
+    """インデックスを構築し、完成した世代を公開する関数"""
+    parser = argparse.ArgumentParser(description="Notionデータベースからインデックスを構築します")
+    parser.add_argument("--full", action="store_true", help="差分同期ではなく全件を再構築する")
+    args = parser.parse_args()
+
+    # ログを標準出力にも表示
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+    # 環境変数の読み込み
+    load_dotenv()
+    openai_api_key = os.getenv("OPENAI_API_KEY")
+    notion_integration_token = os.getenv("NOTION_INTEGRATION_TOKEN")
+    notion_database_id = os.getenv("NOTION_DATABASE_ID")
+    if not openai_api_key:
+        sys.exit("OpenAI APIキーが設定されていません。.envファイルを確認してください。")
+    if not notion_integration_token or not notion_database_id:
+        sys.exit("Notion APIの設定が不足しています。.envファイルを確認してください。")
+
+    def print_progress(processed, total):
+        # 進捗を同じ行に上書き表示
+        print(f"\rページ処理中: {processed}/{total}", end="", file=sys.stderr, flush=True)
+        if processed == total:
+            print(file=sys.stderr)
+
+    started = time.perf_counter()
+    try:
+        result = index_store.refresh_index(
+            index_store.create_embeddings(openai_api_key),
+            notion_sync.create_notion_loader(notion_integration_token, notion_database_id),
+            notion_sync.create_text_splitter(),
+            full_rebuild=args.full,
+            on_progress=print_progress
+        )
+    except Exception as e:
+        sys.exit(f"インデックスの構築に失敗しました: {e}")
+
+    # 結果の表示
+    stats = result["stats"]
+    if result["published"]:
+        print(f"公開した世代: {result['generation']}")
+    else:
+        print(f"変更がないため公開を見送りました（公開中の世代: {result['generation']}）")
+    print(f"チャンク数: {result['chunk_count']}")
+    print(
+        f"追加{stats['added']}件 / 更新{stats['updated']}件 / "
+        f"変更なし{stats['unchanged']}件 / 削除{stats['deleted']}件"
+    )
+    for stage, elapsed in result["timings"].items():
+        print(f"  {stage}: {elapsed:.2f}秒")
+    print(f"合計: {time.perf_counter() - started:.2f}秒")
+
+
+if __name__ == "__main__":
+    main()
@@ -15,6 +15,8 @@ import re
 import constants as ct
 # ユーティリティ関数をインポート
 import utils
+# （自作）会話ログを一定の件数に抑えて保持するモジュール
+import conversation_history
 
 # ロガーの設定
 logger = logging.getLogger(ct.LOGGER_NAME)
@@ -55,9 +57,10 @@ def display_select_mode():
     if selected_mode != st.session_state.mode:
         st.session_state.mode = selected_mode
         # モード変更ログの出力
-        logger.info(f"モードが変更されました: {selected_mode}")
-        # モード変更時は会話ログをクリア
-        st.session_state.messages = []
+        logger.info({"event": "mode_changed", "application_mode": selected_mode})
+        # モード変更時は会話ログをクリアし、新しいセッションにモードを保存
+        conversation_history.clear_messages()
+        conversation_history.save_state("mode", selected_mode)
         # 画面を更新
         st.rerun()
 
@@ -72,34 +75,68 @@ def display_initial_ai_message():
             initial_message = ct.INITIAL_MESSAGE_MODE_2
         
         # 初期メッセージをセッション変数に追加
-        st.session_state.messages.append({"role": "assistant", "content": initial_message})
+        conversation_history.append_message("assistant", initial_message)
 
 
 def display_conversation_log():
-    """会話ログを表示する関数"""
-    # セッション変数からメッセージを取得して表示
+    """
+    会話ログを表示する関数
+    表示するのはセッション変数に保持している直近のメッセージと、「以前の会話を表示」で読み込んだ過去のページのみ
+    （会話が長くなっても、再実行ごとの表示件数は変わらない）
+    """
+    # 書き出した過去のページを、読み込んだ分だけ古い順に表示
+    archived_pages = conversation_history.get_archived_page_count()
+    pages_shown = min(st.session_state.history_pages_shown, archived_pages)
+    if pages_shown < archived_pages:
+        st.button(ct.LOAD_EARLIER_BUTTON_LABEL, on_click=conversation_history.show_earlier_page)
+    for page in range(archived_pages - pages_shown, archived_pages):
+        st.markdown(conversation_history.render_archived_page(st.session_state.session_id, page))
+        st.divider()
+
+    # セッション変数から直近のメッセージを取得して表示
     for message in st.session_state.messages:
         with st.chat_message(message["role"]):
             st.markdown(message["content"])
 
 
+def display_answer(answer):
+    """
+    LLMの回答を表示する関数
+    ストリーム（ジェネレーター）の場合は、届いた分から逐次表示する
+    
+    Args:
+        answer: 回答の文字列、または回答の断片を返すジェネレーター
+        
+    Returns:
+        str: 表示した回答の全文
+    """
+    if isinstance(answer, str):
+        st.markdown(answer)
+        return answer
+    return st.write_stream(answer)
+
+
 def display_search_llm_response(llm_response):
     """
     社内文書検索モードにおけるLLM回答を表示する関数
+    LLMを使わない検索結果の一覧の場合は、ページごとの抜粋・スコアと要約ボタンを表示する
     
     Args:
-        llm_response: LLMからの回答（辞書形式）
+        llm_response: LLMからの回答（辞書形式。回答はストリームでもよい）
         
     Returns:
         str: 表示用の整形されたコンテンツ
     """
+    if llm_response.get("search_only"):
+        return display_search_results(llm_response)
+
     # 検索モードの場合の表示内容
     answer = llm_response.get("answer", "回答が見つかりませんでした。")
     sources = llm_response.get("sources", [])
     
-    # 回答を表示
+    # 回答の表示エリアを確保（参照元は回答の生成を待たずに表示する）
     st.markdown("### 関連文書")
-    st.markdown(answer)
+    answer_area = st.container()
     
     # 参照元を表示
     if sources:
@@ -111,6 +148,10 @@ def display_search_llm_response(llm_response):
             page_info = f" (ページ: {source_page})" if source_page else ""
             
             st.markdown(f"{i}. [{source_name}]({source_url}){page_info}")
+
+    # 回答を表示
+    with answer_area:
+        answer = display_answer(answer)
     
     # 回答と参照元を結合して返す（ログ用）
     content = f"{answer}\n\n**参照元:**\n"
@@ -122,12 +163,62 @@ def display_search_llm_response(llm_response):
     return content
 
 
+def display_search_results(llm_response):
+    """
+    LLMを使わない検索結果の一覧（ページごとのリンク・スコア・抜粋）を表示する関数
+    
+    Args:
+        llm_response: 検索結果（utils.get_search_responseの戻り値）
+        
+    Returns:
+        str: 表示した内容（会話ログにそのまま保存し、再表示にも使う）
+    """
+    sources = llm_response.get("sources", [])
+    
+    # 一覧をMarkdownとして組み立てて表示
+    content = f"{llm_response.get('answer', '')}\n"
+    for i, source in enumerate(sources, 1):
+        source_name = source.get("name", "不明")
+        source_url = source.get("url", "#")
+        source_page = source.get("page", "")
+        page_info = f" (ページ: {source_page})" if source_page else ""
+        score = source.get("score")
+        score_info = f" ／ 関連度: {score:.2f}" if score is not None else ""
+        hits = source.get("hits", 1)
+        hits_info = f" ／ 該当箇所: {hits}件" if hits > 1 else ""
+        content += f"\n{i}. [{source_name}]({source_url}){page_info}{score_info}{hits_info}\n"
+        if source.get("snippet"):
+            content += f"   > {source['snippet']}\n"
+    st.markdown(content)
+    
+    # 要約ボタン（押された場合は、次の再実行でこの質問をLLMに要約させる）
+    if sources:
+        st.button(
+            ct.SUMMARIZE_BUTTON_LABEL,
+            key=f"summarize_{st.session_state.message_count}",
+            on_click=request_summary,
+            args=(llm_response.get("query", ""),)
+        )
+    
+    return content
+
+
+def request_summary(query):
+    """
+    要約ボタンが押された際に、要約する質問をセッション変数に記録する関数
+    
+    Args:
+        query: 要約する質問文
+    """
+    st.session_state.summary_query = query
+
+
 def display_contact_llm_response(llm_response):
     """
     社内問い合わせモードにおけるLLM回答を表示する関数
     
     Args:
-        llm_response: LLMからの回答（辞書形式）
+        llm_response: LLMからの回答（辞書形式。回答はストリームでもよい）
         
     Returns:
         str: 表示用の整形されたコンテンツ
@@ -136,9 +227,9 @@ def display_contact_llm_response(llm_response):
     answer = llm_response.get("answer", "回答が見つかりませんでした。")
     sources = llm_response.get("sources", [])
     
-    # 回答を表示
+    # 回答の表示エリアを確保（参照元は回答の生成を待たずに表示する）
     st.markdown("### 回答")
-    st.markdown(answer)
+    answer_area = st.container()
     
     # 参照元を表示
     if sources:
@@ -156,6 +247,10 @@ def display_contact_llm_response(llm_response):
                     st.markdown("内容抜粋:")
                     st.markdown(source_content)
                 st.divider()
+
+    # 回答を表示
+    with answer_area:
+        answer = display_answer(answer)
     
     # 回答と参照元を結合して返す（ログ用）
     content = f"{answer}\n\n**参照元:**\n"
@@ -164,4 +259,21 @@ def display_contact_llm_response(llm_response):
         source_url = source.get("url", "#")
         content += f"{i}. {source_name} ({source_url})\n"
     
-    return content
\ No newline at end of file
+    return content
+
+
+def display_trace(trace_record):
+    """
+    1回の質問に対する処理段ごとの所要時間と属性を表示する関数（デバッグ用）
+    
+    Args:
+        trace_record: トレースの内容（RequestTrace.finish()の戻り値）
+    """
+    with st.expander("処理時間の内訳（デバッグ用）", expanded=False):
+        spans = trace_record.get("spans_ms", {})
+        st.table({"処理": list(spans.keys()), "時間（ミリ秒）": [f"{ms:.1f}" for ms in spans.values()]})
+        attributes = {
+            key: value for key, value in trace_record.items()
+            if key not in ("spans_ms", "trace_id", "started_at")
+        }
+        st.json(attributes)
@@ -0,0 +1,327 @@
+"""
+このファイルは、外部API（チャット・Embedding）の呼び出しを制御する仕組みを定義するファイルです。
+- SingleFlight: 同じ質問が同時に届いた場合に、1回の呼び出しの結果を共有する
+- SharedStream: ストリーミングの回答を、同じ質問をした複数の利用者に配信する
+- RequestLimiter: 同時実行数（セマフォ）と呼び出し頻度（トークンバケット）を制限し、
+  待ちが上限を超えた呼び出しはBusyErrorで断る（OpenAIへの429の連鎖を防ぐ）
+"""
+
+############################################################
+# 1. ライブラリの読み込み
+############################################################
+# 排他制御・スレッドを扱うためのモジュール
+import threading
+# 処理時間を扱うためのモジュール
+import time
+# with文で使う処理を定義するためのモジュール
+from contextlib import contextmanager
+# ログ出力を行うためのモジュール
+import logging
+# 固定値・変数を定義しているファイル
+import constants as ct
+
+# ロガーの設定
+logger = logging.getLogger(ct.LOGGER_NAME)
+
+
+############################################################
+# 2. 同じ呼び出しの共有
+############################################################
+
+class _Call:
+    """実行中の呼び出しの結果を、待っている呼び出し元に渡すための入れ物"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    同じキーの呼び出しが実行中の場合、新たに実行せずにその結果を待って共有する仕組み
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, func, hold=False):
+        """
+        キーに対応する呼び出しを実行する（実行中の場合はその結果を待つ）
+
+        Args:
+            key: 呼び出しを識別するキー
+            func: 実行する関数（引数なし）
+            hold: Trueの場合、関数が戻った後もrelease(key)が呼ばれるまで結果を共有し続ける
+                  （ストリーミングの回答を配信し終えるまで、後から来た呼び出しにも共有する場合に使う）
+
+        Returns:
+            tuple: （結果, 自分が実行したかどうか）
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, False
+
+        try:
+            call.result = func()
+        except BaseException as e:
+            call.error = e
+            self.release(key)
+            raise
+        finally:
+            call.done.set()
+        if not hold:
+            self.release(key)
+        return call.result, True
+
+    def release(self, key):
+        """
+        キーの呼び出しの共有を終える（以降の同じキーの呼び出しは新たに実行される）
+
+        Args:
+            key: 呼び出しを識別するキー
+        """
+        with self._lock:
+            self._calls.pop(key, None)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._calls)
+
+
+class SharedStream:
+    """
+    ストリームを別スレッドで最後まで読み進め、届いた断片を複数の読み手に配信する仕組み
+    読み手は途中から参加しても、最初の断片から受け取れる
+    """
+
+    def __init__(self, source, on_finish=None):
+        """
+        Args:
+            source: 元のストリーム（断片を返すイテレーター）
+            on_finish: ストリームの読み込みが終わった（失敗した場合も含む）後に呼ぶ関数
+        """
+        self._parts = []
+        self._finished = False
+        self._error = None
+        self._condition = threading.Condition()
+        threading.Thread(target=self._run, args=(source, on_finish), daemon=True).start()
+
+    def _run(self, source, on_finish):
+        """元のストリームを読み進め、断片を蓄積して読み手に知らせる"""
+        try:
+            for part in source:
+                with self._condition:
+                    self._parts.append(part)
+                    self._condition.notify_all()
+        except BaseException as e:
+            self._error = e
+        finally:
+            with self._condition:
+                self._finished = True
+                self._condition.notify_all()
+            if on_finish:
+                on_finish()
+
+    def subscribe(self):
+        """
+        ストリームの断片を最初から順に返すジェネレーター
+
+        Yields:
+            ストリームの断片
+        """
+        position = 0
+        while True:
+            with self._condition:
+                while position >= len(self._parts) and not self._finished:
+                    self._condition.wait()
+                parts = self._parts[position:]
+                finished = self._finished
+            position += len(parts)
+            yield from parts
+            if finished:
+                if self._error is not None:
+                    raise self._error
+                return
+
+
+############################################################
+# 3. 呼び出しの流量制御
+############################################################
+
+class BusyError(Exception):
+    """呼び出しの待ちが上限を超えたため、呼び出しを断ったことを表す例外"""
+
+
+class RequestLimiter:
+    """
+    同時実行数（セマフォ）と呼び出し頻度（トークンバケット）を制限する仕組み
+    待っている呼び出しの数が上限を超えた場合や、待ち時間が上限を超えた場合はBusyErrorを送出する
+    """
+
+    def __init__(self, name, max_concurrency, requests_per_minute, burst, max_queue=None, timeout=None):
+        """
+        Args:
+            name: ログに表示する名前
+            max_concurrency: 同時実行数の上限
+            requests_per_minute: 1分あたりの呼び出し数の上限
+            burst: 連続して呼び出せる数の上限（トークンバケットの容量）
+            max_queue: 待っている呼び出しの数の上限（Noneの場合は無制限）
+            timeout: 待ち時間の上限（秒。Noneの場合は無制限）
+        """
+        self.name = name
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self._semaphore = threading.BoundedSemaphore(max_concurrency)
+        self._lock = threading.Lock()
+        self._rate = requests_per_minute / 60
+        self._capacity = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._queued = 0
+        self._in_flight = 0
+        self._max_queued = 0
+        self._rejected = 0
+        self._completed = 0
+        self._total_wait = 0.0
+
+    def acquire(self):
+        """
+        呼び出しの許可を得る（許可が得られるまで待つ）
+
+        Returns:
+            float: 待ち時間（秒）
+        """
+        started = time.monotonic()
+        deadline = None if self.timeout is None else started + self.timeout
+        with self._lock:
+            if self.max_queue is not None and self._queued >= self.max_queue:
+                self._reject("待ち行列が上限に達しました")
+            self._queued += 1
+            self._max_queued = max(self._max_queued, self._queued)
+
+        try:
+            if not self._semaphore.acquire(timeout=self._remaining(deadline)):
+                with self._lock:
+                    self._reject("同時実行数の空きを待つ時間が上限に達しました")
+            try:
+                self._take_token(deadline)
+            except BusyError:
+                self._semaphore.release()
+                raise
+        finally:
+            with self._lock:
+                self._queued -= 1
+
+        waited = time.monotonic() - started
+        with self._lock:
+            self._in_flight += 1
+            self._total_wait += waited
+        return waited
+
+    def release(self):
+        """呼び出しの終了を知らせる"""
+        with self._lock:
+            self._in_flight -= 1
+            self._completed += 1
+        self._semaphore.release()
+
+    @contextmanager
+    def limit(self):
+        """with文で囲んだ処理の間、呼び出しの許可を得る"""
+        self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self):
+        """
+        待ち行列の状況を返す
+
+        Returns:
+            dict: 待っている数・実行中の数・待ちの最大数・断った数・完了数・平均待ち時間（ミリ秒）
+        """
+        with self._lock:
+            started = self._completed + self._in_flight
+            return {
+                "queued": self._queued,
+                "in_flight": self._in_flight,
+                "max_queued": self._max_queued,
+                "rejected": self._rejected,
+                "completed": self._completed,
+                "mean_wait_ms": round(self._total_wait / started * 1000, 1) if started else 0.0,
+            }
+
+    def _take_token(self, deadline):
+        """トークンバケットからトークンを1つ取り出す（足りない場合は補充を待つ）"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self._capacity, self._tokens + (now - self._updated) * self._rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self._rate
+                if deadline is not None and now + wait > deadline:
+                    self._reject("呼び出し頻度の上限に達しました")
+            time.sleep(wait)
+
+    def _remaining(self, deadline):
+        """期限までの残り時間を返す（期限なしの場合はNone）"""
+        if deadline is None:
+            return None
+        return max(deadline - time.monotonic(), 0)
+
+    def _reject(self, reason):
+        """呼び出しを断る（ロックを取得した状態で呼ぶ）"""
+        self._rejected += 1
+        logger.warning(f"{self.name}の呼び出しを断りました: {reason}（待ち{self._queued}件 / 実行中{self._in_flight}件）")
+        raise BusyError(reason)
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(name):
+    """
+    プロセスで共有する流量制御を返す関数
+
+    Args:
+        name: "chat"（チャットモデル）または "embedding"（Embeddingモデル）
+
+    Returns:
+        RequestLimiter: 流量制御
+    """
+    with _limiters_lock:
+        if name not in _limiters:
+            if name == "chat":
+                _limiters[name] = RequestLimiter(
+                    "チャットモデル",
+                    ct.LLM_MAX_CONCURRENCY,
+                    ct.LLM_REQUESTS_PER_MINUTE,
+                    ct.LLM_BURST,
+                    max_queue=ct.LLM_MAX_QUEUE,
+                    timeout=ct.LLM_QUEUE_TIMEOUT
+                )
+            else:
+                # Embeddingはインデックス構築でも使うため、断らずに順番を待たせる
+                _limiters[name] = RequestLimiter(
+                    "Embeddingモデル",
+                    ct.EMBEDDING_MAX_CONCURRENCY,
+                    ct.EMBEDDING_REQUESTS_PER_MINUTE,
+                    ct.EMBEDDING_BURST
+                )
+        return _limiters[name]
@@ -32,6 +32,8 @@ LOG_DIR = "logs"
 DATA_DIR = "data"
 # ベクターストアディレクトリ
 CHROMA_DIR = ".chroma"
+# 会話ログ（セッションストア）を保存するディレクトリ
+HISTORY_DIR = ".history"
 
 ############################################################
 # 4. ログ設定
@@ -40,6 +42,12 @@ CHROMA_DIR = ".chroma"
 LOG_MAX_BYTES = 10 * 1024 * 1024  # 10MB
 # ログのバックアップファイル数
 LOG_BACKUP_COUNT = 5
+# リクエストごとの処理時間（トレース）を出力するロガー名
+TRACE_LOGGER_NAME = "notion_chatbot.trace"
+# トレースの出力先ファイル名（LOG_DIR配下、1行1リクエストのJSON）
+TRACE_LOG_FILE = "trace.jsonl"
+# 回答の下に処理時間の内訳（デバッグ用）を表示するか
+TRACE_DEBUG_PANEL = False
 
 ############################################################
 # 5. LLM設定
@@ -50,12 +58,39 @@ MODEL_NAME = "gpt-4o"
 TEMPERATURE = 0.0
 # 最大トークン数
 MAX_TOKENS = 1000
+# チャットモデルの種類（"openai": OpenAI API、"fake": 外部APIを使わない疑似モデル（ベンチマーク用））
+# 環境変数「LLM_BACKEND」で上書きできる
+LLM_BACKEND = "openai"
+# 疑似モデルの最初のトークンまでの待ち時間（秒）
+FAKE_LLM_FIRST_TOKEN_LATENCY = 0.5
+# 疑似モデルのトークンごとの待ち時間（秒）
+FAKE_LLM_TOKEN_LATENCY = 0.02
+# 疑似モデルの回答のトークン数
+FAKE_LLM_ANSWER_TOKENS = 100
+# OpenAI APIのベースURL（Noneの場合はOpenAIの既定値。環境変数「OPENAI_BASE_URL」で上書きできる）
+OPENAI_API_BASE_URL = None
+# OpenAIリクエストのタイムアウト（秒）
+OPENAI_REQUEST_TIMEOUT = 60
+# OpenAIリクエストが429・5xxを返した場合のリトライ回数（チャットモデル。EmbeddingはEmbedding設定を参照）
+OPENAI_MAX_RETRIES = 2
 
 ############################################################
 # 6. Notion設定
 ############################################################
 # Notionリクエストのタイムアウト（秒）
 NOTION_REQUEST_TIMEOUT = 30
+# Notion APIのベースURL（環境変数「NOTION_API_BASE_URL」で上書きできる）
+NOTION_API_BASE_URL = "https://api.notion.com/v1"
+# Notion APIのバージョン
+NOTION_API_VERSION = "2022-06-28"
+# Notionへ同時に送るリクエスト数の上限
+NOTION_MAX_CONCURRENCY = 3
+# Notionへの1秒あたりのリクエスト数の上限（Notionのレート制限は平均3リクエスト/秒）
+NOTION_REQUESTS_PER_SECOND = 3
+# Notionリクエストが429・5xxを返した場合・通信に失敗した場合のリトライ回数
+NOTION_MAX_RETRIES = 5
+# Retry-Afterが指定されていない場合のリトライ間隔の初期値（秒）。リトライごとに2倍になる
+NOTION_RETRY_BASE_DELAY = 1.0
 
 ############################################################
 # 7. テキスト分割設定
@@ -70,6 +105,38 @@ CHUNK_OVERLAP = 100
 ############################################################
 # 検索結果の取得数
 RETRIEVER_K = 5
+# 検索方式（"hybrid": ベクトル検索とBM25の転置インデックス検索を統合、"vector": ベクトル検索のみ）
+RETRIEVAL_MODE = "hybrid"
+# ハイブリッド検索で、統合前にそれぞれの検索で取得する件数
+HYBRID_FETCH_K = 20
+# ベクトル検索のみの場合に、ページ単位にまとめる前に取得する件数
+RETRIEVER_FETCH_K = 20
+# 検索結果に含める、1ページあたりのチャンク数の上限（上位RETRIEVER_K件が異なるページになるよう多めに取得して絞る）
+# LLMに渡すコンテキストでは同じページの隣接チャンクを結合し、検索結果の一覧・参照元はページ単位にまとめて表示する
+RETRIEVER_MAX_CHUNKS_PER_PAGE = 3
+# 検索結果をリランキングするか（多めに取得した候補を採点し直し、上位RETRIEVER_K件に絞る）
+RERANK_ENABLED = False
+# リランキングする候補の件数
+RERANK_CANDIDATES = 20
+# 1回の質問でリランキングにかけられる時間の上限（ミリ秒）。超えた場合は検索順のまま返す
+RERANK_TIME_BUDGET_MS = 50
+# リランキングの特徴量ごとの重み（検索時のスコア・本文に含まれる質問の語の割合・タイトルに含まれる質問の語の割合）
+RERANK_WEIGHTS = {"retrieval": 0.5, "coverage": 0.35, "title": 0.15}
+# Reciprocal Rank Fusionの平滑化定数
+RRF_K = 60
+# 転置インデックスのファイル名（インデックスの世代ディレクトリ配下）
+# 以前のJSON形式の世代は、次回の差分更新時にベクターストアの内容から作り直す
+LEXICAL_INDEX_FILE = "lexical_index.sqlite3"
+# BM25のパラメータ
+LEXICAL_BM25_K1 = 1.2
+LEXICAL_BM25_B = 0.75
+# この割合を超えるチャンクに出現する語は、転置インデックス検索で読み飛ばす
+LEXICAL_MAX_DF_RATIO = 0.5
+# 社内文書検索モードで、LLMを使わずに検索結果（ページ単位の一覧）をそのまま返すか
+# （要約が必要な場合は、結果の下のボタンからLLMに要約させる。既定は従来どおりLLMで回答を作成する）
+SEARCH_FAST_PATH_ENABLED = False
+# 検索結果の一覧に表示する抜粋の文字数
+SEARCH_SNIPPET_LENGTH = 160
 
 ############################################################
 # 9. UI関連設定
@@ -80,6 +147,22 @@ CHAT_INPUT_HELPER_TEXT = "質問を入力してください..."
 SPINNER_TEXT = "回答を生成中..."
 # エラーアイコン
 ERROR_ICON = "❌"
+# 警告アイコン
+WARNING_ICON = "⚠️"
+# 回答をトークン単位で逐次表示するか
+STREAMING_ENABLED = True
+# 検索結果の一覧の見出し（{count}は見つかったページ数）
+SEARCH_RESULTS_MESSAGE = "関連するページが{count}件見つかりました。"
+# 検索結果をLLMに要約させるボタンの表示文言
+SUMMARIZE_BUTTON_LABEL = "検索結果を要約する"
+# 検索結果がない場合のメッセージ
+NO_RELEVANT_DOCUMENTS_MESSAGE = "申し訳ありませんが、ご質問に関連する情報が見つかりませんでした。\n質問の表現を変えるか、別のトピックについてお尋ねください。"
+# 要約ボタンが押された場合に、ユーザーメッセージとして表示する文言（{query}は元の質問文）
+SUMMARIZE_REQUEST_MESSAGE = "「{query}」の検索結果を要約してください"
+# 書き出した過去の会話を1ページ分読み込むボタンの表示文言
+LOAD_EARLIER_BUTTON_LABEL = "以前の会話を表示"
+# 過去の会話を表示する際の発言者の表示名
+HISTORY_ROLE_LABELS = {"user": "ユーザー", "assistant": "アシスタント"}
 
 ############################################################
 # 10. 初期メッセージ
@@ -109,6 +192,8 @@ CONVERSATION_LOG_ERROR_MESSAGE = "会話ログの表示中にエラーが発生
 GET_LLM_RESPONSE_ERROR_MESSAGE = "回答の取得中にエラーが発生しました"
 # 回答表示エラーメッセージ
 DISP_ANSWER_ERROR_MESSAGE = "回答の表示中にエラーが発生しました"
+# アクセスが集中し、LLMの呼び出しを待ちきれなかった場合に表示するメッセージ
+LLM_BUSY_MESSAGE = "ただいまアクセスが集中しています。少し時間をおいてから、もう一度お試しください。"
 
 ############################################################
 # 12. プロンプトテンプレート
@@ -143,8 +228,257 @@ CONTACT_PROMPT_TEMPLATE = """
 ### 回答 (マークダウン形式):
 """
 
+# 会話の流れを踏まえて、検索に使う独立した質問文に書き換えるプロンプトテンプレート
+CONDENSE_PROMPT_TEMPLATE = """
+以下の会話の続きとしてユーザーが質問しました。
+会話を読まなくても意味が分かるように、省略された話題を補った質問文に書き換えてください。
+書き換えた質問文のみを出力し、回答はしないでください。
+
+### 会話:
+{history}
+
+### 質問:
+{question}
+
+### 書き換えた質問文:
+"""
+
 ############################################################
 # 13. アプリ起動メッセージ
 ############################################################
 # アプリ起動メッセージ
-APP_BOOT_MESSAGE = "アプリケーションが起動しました"
\ No newline at end of file
+APP_BOOT_MESSAGE = "アプリケーションが起動しました"
+
+
+############################################################
+# 14. ベクターストア同期設定
+############################################################
+# 同期マニフェスト（ページごとの最終更新日時・ハッシュ値・チャンクID）のファイル名
+SYNC_MANIFEST_FILE = "notion_manifest.json"
+# インデックスの世代（ベクターストア一式）を格納するディレクトリ名（CHROMA_DIR配下）
+INDEX_GENERATIONS_DIR = "generations"
+# 現在公開中の世代名を記録するファイル名（CHROMA_DIR配下）
+INDEX_CURRENT_FILE = "CURRENT"
+# 公開中の世代がNotionの内容と一致することを最後に確認した日時を記録するファイル名（CHROMA_DIR配下）
+# 変更がなく新しい世代を公開しなかった場合に更新し、次の定期構築までの間隔はここから数える
+INDEX_CHECKED_FILE = "CHECKED"
+# インデックス構築の多重実行を防ぐロックファイル名（CHROMA_DIR配下）
+INDEX_LOCK_FILE = "build.lock"
+# 保持する世代数（公開中の世代を含む）
+INDEX_KEEP_GENERATIONS = 3
+
+
+############################################################
+# 15. Embedding設定
+############################################################
+# Embeddingモデルの種類（"openai": OpenAI API、"local": ローカルの決定的モデル（テスト・ベンチマーク用））
+# 環境変数「EMBEDDING_BACKEND」で上書きできる
+EMBEDDING_BACKEND = "openai"
+# OpenAIのEmbeddingモデル名
+EMBEDDING_MODEL_NAME = "text-embedding-ada-002"
+# ローカルEmbeddingモデルの次元数
+LOCAL_EMBEDDING_DIMENSIONS = 256
+# Embeddingキャッシュを使用するか
+EMBEDDING_CACHE_ENABLED = True
+# Embeddingキャッシュのファイル名（DATA_DIR配下）
+EMBEDDING_CACHE_FILE = "embedding_cache.sqlite3"
+# Embeddingキャッシュの最大件数（超えた場合は最後に使われた日時が古いものから削除）
+EMBEDDING_CACHE_MAX_ENTRIES = 200000
+# Embeddingキャッシュの最終利用日時の更新を、この件数分たまるまでメモリ上で保留する
+EMBEDDING_CACHE_TOUCH_BATCH = 1000
+# 検索クエリのEmbeddingをプロセス内に保持する件数（ディスクのキャッシュは使わない）
+EMBEDDING_QUERY_CACHE_SIZE = 256
+# 1回のEmbeddingリクエストで送るテキスト数
+EMBEDDING_BATCH_SIZE = 100
+# 同時に送るEmbeddingリクエスト数の上限
+EMBEDDING_MAX_CONCURRENCY = 4
+# Embeddingリクエスト失敗時のリトライ回数
+EMBEDDING_MAX_RETRIES = 3
+# リトライ間隔の初期値（秒）。リトライごとに2倍になる
+EMBEDDING_RETRY_BASE_DELAY = 1.0
+
+
+############################################################
+# 16. 回答キャッシュ設定
+############################################################
+# 回答キャッシュを使用するか
+ANSWER_CACHE_ENABLED = True
+# 回答キャッシュの最大件数（超えた場合は最後に使われたのが古いものから削除）
+ANSWER_CACHE_MAX_ENTRIES = 1000
+# 回答キャッシュの有効期間（秒）
+ANSWER_CACHE_TTL = 24 * 60 * 60
+# 言い回しの近い質問を同一とみなすコサイン類似度（Noneの場合は完全一致のみ。既定値）
+# 設定した場合、キャッシュの確認のたびに質問文のEmbeddingを求める（例: 0.97）
+ANSWER_CACHE_SIMILARITY_THRESHOLD = None
+
+
+############################################################
+# 17. コンテキスト設定
+############################################################
+# LLMに渡すコンテキストのトークン数の上限
+CONTEXT_MAX_TOKENS = 3000
+# 採用済みの内容にこの割合以上含まれている内容は、重複として除外する（文字3-gram単位）
+CONTEXT_DEDUP_THRESHOLD = 0.9
+
+
+############################################################
+# 18. 取り込み（インデックス構築）設定
+############################################################
+# 取り込みパイプラインの段と段の間のキューに溜められる件数の上限
+INGEST_QUEUE_SIZE = 8
+# 1バッチとしてまとめてEmbedding・登録するチャンク数の目安
+INGEST_BATCH_SIZE = 256
+# 取り込み途中の内容を保存（コミット）する間隔（秒）。中断時はここから再開する
+INGEST_COMMIT_INTERVAL = 30
+# 構築中の世代に置く目印ファイル名（中断した構築の再開に使用）
+INDEX_BUILDING_MARKER = "BUILDING"
+
+
+############################################################
+# 19. ベンチマーク・評価設定
+############################################################
+# ベンチマークに使うNotionエクスポートのフィクスチャ（ページ本文と評価用の質問）
+BENCHMARK_FIXTURE_FILE = "fixtures/notion_export.json"
+# 検索時間を計測するコーパスのページ数（フィクスチャのページを複製して水増しする）
+BENCHMARK_CORPUS_SIZES = [50, 200, 1000]
+# 検索時間を計測するRETRIEVER_Kの値
+BENCHMARK_RETRIEVER_KS = [3, 5, 10]
+# 計測を繰り返す回数（質問ごと）
+BENCHMARK_REPEAT = 3
+# 検索品質の評価で比較するチャンクサイズ
+EVALUATION_CHUNK_SIZES = [200, 400, 1000]
+# 検索品質の評価で比較するチャンクオーバーラップ
+EVALUATION_CHUNK_OVERLAPS = [0, 50, 100]
+# 検索品質の評価で比較するRETRIEVER_Kの値
+EVALUATION_RETRIEVER_KS = [3, 5, 10]
+# 検索品質の評価で満たすべきrecall@k（これを満たす中で最もプロンプトの短い設定を推奨する）
+EVALUATION_RECALL_TARGET = 0.9
+
+
+############################################################
+# 20. ヘルスチェック設定
+############################################################
+# ヘルスチェックの結果をキャッシュする時間（秒）
+HEALTH_CHECK_TTL = 300
+# ヘルスチェックで問題があった場合に、結果をキャッシュする時間（秒）
+HEALTH_CHECK_FAILURE_TTL = 30
+
+
+############################################################
+# 21. HTTP接続設定
+############################################################
+# 接続先（OpenAI・Notion）ごとの同時接続数の上限
+HTTP_MAX_CONNECTIONS = 20
+# 接続先ごとにKeep-Aliveで保持する接続数の上限
+HTTP_MAX_KEEPALIVE_CONNECTIONS = 10
+# 使われていない接続を保持する時間（秒）
+HTTP_KEEPALIVE_EXPIRY = 30
+# 接続確立のタイムアウト（秒）
+HTTP_CONNECT_TIMEOUT = 5
+# 接続確立に失敗した場合のリトライ回数
+HTTP_CONNECT_RETRIES = 2
+
+
+############################################################
+# 22. 外部API呼び出しの流量制御設定
+############################################################
+# チャットモデルを同時に呼び出す数の上限（プロセス全体）
+LLM_MAX_CONCURRENCY = 8
+# チャットモデルを1分あたりに呼び出す数の上限（OpenAIのレート制限より低く設定する）
+LLM_REQUESTS_PER_MINUTE = 300
+# チャットモデルを続けて呼び出せる数の上限（トークンバケットの容量）
+LLM_BURST = 10
+# チャットモデルの呼び出しを待てる数の上限（超えた場合は待たずに混雑中と表示する）
+LLM_MAX_QUEUE = 32
+# チャットモデルの呼び出しを待つ時間の上限（秒。超えた場合は混雑中と表示する）
+LLM_QUEUE_TIMEOUT = 20
+# Embeddingモデルを1分あたりに呼び出す数の上限（同時に呼び出す数の上限はEMBEDDING_MAX_CONCURRENCY）
+EMBEDDING_REQUESTS_PER_MINUTE = 1000
+# Embeddingモデルを続けて呼び出せる数の上限（トークンバケットの容量）
+EMBEDDING_BURST = 20
+
+
+############################################################
+# 23. ベクターストア設定
+############################################################
+# ベクターストアの種類（"chroma": Chroma、"local": メモリマップで読み込むローカルのベクターストア）
+# 環境変数「VECTOR_STORE_BACKEND」で上書きできる。切り替えた後の初回の構築は全件再構築になる
+VECTOR_STORE_BACKEND = "chroma"
+# ローカルのベクターストアの検索方式（"ivf": 近いクラスタのみを走査、"flat": 全件走査）
+LOCAL_VECTOR_INDEX = "ivf"
+# ローカルのベクターストアの保存形式を記録するファイル名（インデックスの世代ディレクトリ配下）
+LOCAL_VECTOR_MANIFEST_FILE = "vector_store.json"
+# IVFを使うチャンク数の下限（これより少ない場合は全件走査の方が速いため、IVFを作らない）
+LOCAL_VECTOR_IVF_MIN_ROWS = 2000
+# IVFで走査するクラスタ数（多いほど検索漏れが減り、検索時間は長くなる）
+LOCAL_VECTOR_IVF_NPROBE = 8
+# IVFのクラスタを作るk-meansの反復回数
+LOCAL_VECTOR_IVF_ITERATIONS = 10
+# IVFのクラスタを作るk-meansに使う行数の上限（これを超える場合は抽出した行で作り、全行の割り当ては分割して計算する）
+LOCAL_VECTOR_IVF_TRAIN_SAMPLE = 50000
+
+
+############################################################
+# 24. 質問文の書き換え設定
+############################################################
+# 会話の流れを踏まえて、検索に使う質問文を書き換えるか（書き換えた質問文は検索にのみ使い、回答・キャッシュには元の質問文を使う）
+CONDENSE_ENABLED = False
+# 書き換えの方式（"heuristic": ルールで直前の話題を補う（外部APIを使わない）、"llm": チャットモデルで書き換える）
+CONDENSE_METHOD = "heuristic"
+# 書き換えに使うチャットモデル（回答用のモデルより安価なモデル）
+CONDENSE_MODEL_NAME = "gpt-4o-mini"
+# 書き換えに使う直近のユーザーの発言数の上限（アシスタントの回答は、その間のものを含める）
+CONDENSE_HISTORY_TURNS = 3
+# 書き換えに使う会話の1メッセージあたりの文字数の上限
+CONDENSE_HISTORY_MESSAGE_CHARS = 300
+# この語で始まる質問は、直前の話題を前提とした質問とみなす（正規化後の質問文で判定）
+# 「この」「その」のように、単独の質問でも使われる語は含めない
+CONDENSE_FOLLOWUP_PREFIXES = ["では、", "それでは", "それなら", "じゃあ", "だったら", "他には", "ほかには", "what about", "how about"]
+# この語で終わる質問は、直前の話題を前提とした質問とみなす（正規化後の質問文で判定）
+CONDENSE_FOLLOWUP_SUFFIXES = ["の場合は", "だと", "はどう", "はどうですか"]
+# 書き換え結果を保持する最大件数（超えた場合は最後に使われたのが古いものから削除）
+CONDENSE_CACHE_MAX_ENTRIES = 1000
+
+
+############################################################
+# 25. 会話ログ設定
+############################################################
+# セッション変数に保持し、画面の再実行ごとに表示するメッセージ数の上限（ユーザー・アシスタントの合計）
+HISTORY_MAX_IN_MEMORY_MESSAGES = 20
+# 上限を超えた場合に、まとめてセッション変数から手放すメッセージ数（1ページの件数。上限以下にする）
+HISTORY_PAGE_SIZE = 10
+# 表示用に組み立てたMarkdownを保持するページ数（プロセス全体）
+HISTORY_RENDER_CACHE_PAGES = 256
+# 会話ログを保持する日数（最後の更新から超えたセッションはアプリの起動時に削除する）
+HISTORY_RETENTION_DAYS = 7
+
+
+############################################################
+# 26. セッションストア設定
+############################################################
+# セッションストアの種類（"sqlite": SQLiteのファイル（複数のプロセスで共有できる）、"memory": プロセス内のメモリ）
+# 環境変数「SESSION_STORE_BACKEND」で上書きできる
+SESSION_STORE_BACKEND = "sqlite"
+# SQLiteのセッションストアのファイル（複数のレプリカで共有する場合は、共有のディスク上のパスにする）
+SESSION_STORE_PATH = ".history/sessions.sqlite3"
+# この件数の書き込みが溜まった時点で、まとめてセッションストアに書き込む
+SESSION_STORE_BATCH_SIZE = 100
+# 書き込みを溜めておく時間の上限（秒。プロセスが異常終了した場合は、この間の書き込みが失われうる）
+SESSION_STORE_FLUSH_INTERVAL = 0.5
+# 他のプロセスが書き込み中の場合に待つ時間の上限（秒）
+SESSION_STORE_BUSY_TIMEOUT = 5
+# セッションIDを持たせるURLのクエリパラメータ名
+SESSION_QUERY_PARAM = "session"
+
+
+############################################################
+# 27. インデックスの定期更新設定
+############################################################
+# Webアプリの実行中に、別スレッドでインデックスの更新・切り替えを行うか
+INDEX_REFRESH_ENABLED = True
+# 定期更新でインデックスを構築するか（Falseの場合は、build_index.pyや他のプロセスが公開した世代への切り替えのみ行う）
+INDEX_REFRESH_BUILD_ENABLED = True
+# 公開中の世代がこの秒数より古くなった場合に、Notionと差分同期した新しい世代を構築する
+INDEX_REFRESH_INTERVAL = 60 * 60
+# 構築・切り替えの要否を確認する間隔（秒）
+INDEX_REFRESH_POLL_INTERVAL = 30
@@ -0,0 +1,186 @@
+"""
+このファイルは、検索結果からLLMに渡すコンテキストを組み立てる関数を定義するファイルです。
+同じページの隣接チャンクをオーバーラップ部分を除いて結合し、ほぼ重複する内容を除いたうえで、
+関連度の高い順にトークン数の上限まで詰め込みます。
+"""
+
+############################################################
+# 1. ライブラリの読み込み
+############################################################
+# 関数の結果をキャッシュするためのモジュール
+from functools import lru_cache
+# 正規表現を扱うためのモジュール
+import re
+# ログ出力を行うためのモジュール
+import logging
+# トークン数を数えるためのモジュール
+import tiktoken
+# 固定値・変数を定義しているファイル
+import constants as ct
+
+# ロガーの設定
+logger = logging.getLogger(ct.LOGGER_NAME)
+
+# トークナイザーを使えない場合の見積もりの単位（ASCII文字は4文字まで、それ以外の文字は1文字を1トークンとする）
+ESTIMATED_TOKEN_PATTERN = re.compile(r"[\x00-\x7f]{1,4}|[^\x00-\x7f]")
+
+
+############################################################
+# 2. トークン数の計測
+############################################################
+
+@lru_cache(maxsize=None)
+def get_encoding(model_name=ct.MODEL_NAME):
+    """
+    モデルに対応するトークナイザーを取得する関数
+
+    Args:
+        model_name: モデル名
+
+    Returns:
+        tiktoken.Encoding: トークナイザー（読み込めない場合は文字数から見積もるCharacterEncoding）
+    """
+    try:
+        try:
+            return tiktoken.encoding_for_model(model_name)
+        except KeyError:
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        # 初回はトークナイザーのファイルをダウンロードするため、ネットワークがない環境では読み込めない
+        logger.warning(f"トークナイザーを読み込めないため、文字数からトークン数を見積もります: {e}")
+        return CharacterEncoding()
+
+
+class CharacterEncoding:
+    """
+    トークナイザーを読み込めない場合に、文字数からトークン数を見積もる仕組み（tiktoken.Encodingと同じ使い方ができる）
+    ASCII文字は4文字まで、それ以外の文字（日本語など）は1文字を1トークンとみなす
+    """
+
+    def encode(self, text):
+        return ESTIMATED_TOKEN_PATTERN.findall(text)
+
+    def decode(self, tokens):
+        return "".join(tokens)
+
+
+def count_tokens(text, model_name=ct.MODEL_NAME):
+    """
+    テキストのトークン数を数える関数
+
+    Args:
+        text: トークン数を数えるテキスト
+        model_name: モデル名
+
+    Returns:
+        int: トークン数
+    """
+    return len(get_encoding(model_name).encode(text))
+
+
+############################################################
+# 3. コンテキストの組み立て
+############################################################
+
+def build_context(documents, max_tokens=ct.CONTEXT_MAX_TOKENS):
+    """
+    検索結果からトークン数の上限に収まるコンテキストを組み立てる関数
+
+    Args:
+        documents: 関連度の高い順に並んだ検索結果（Documentのリスト）
+        max_tokens: コンテキストのトークン数の上限
+
+    Returns:
+        tuple: （コンテキスト文字列, コンテキストのトークン数）
+    """
+    encoding = get_encoding()
+    separator_tokens = len(encoding.encode("\n\n"))
+    selected = []
+    selected_shingles = []
+    used_tokens = 0
+
+    for text in merge_adjacent_chunks(documents):
+        # 採用済みの内容にほぼ含まれているものは除外
+        shingles = _shingles(text)
+        if any(_containment(shingles, other) >= ct.CONTEXT_DEDUP_THRESHOLD for other in selected_shingles):
+            continue
+
+        remaining = max_tokens - used_tokens - (separator_tokens if selected else 0)
+        if remaining <= 0:
+            break
+        tokens = encoding.encode(text)
+        if len(tokens) > remaining:
+            # 最も関連度の高い内容が上限を超える場合のみ、切り詰めて採用する
+            if selected:
+                continue
+            tokens = tokens[:remaining]
+            text = encoding.decode(tokens)
+
+        selected.append(text)
+        selected_shingles.append(shingles)
+        used_tokens += len(tokens) + (separator_tokens if len(selected) > 1 else 0)
+
+    return "\n\n".join(selected), used_tokens
+
+
+def merge_adjacent_chunks(documents):
+    """
+    同じページの連続するチャンクを、オーバーラップ部分を除いて1つのテキストに結合する関数
+    結合後のテキストは、含まれるチャンクのうち最も関連度の高い順位で並べる
+
+    Args:
+        documents: 関連度の高い順に並んだ検索結果（Documentのリスト）
+
+    Returns:
+        list: 結合後のテキストのリスト（関連度の高い順）
+    """
+    # ページごとにチャンクを集める（チャンク番号のないものは単独で扱う）
+    groups = {}
+    for rank, doc in enumerate(documents):
+        page_id = doc.metadata.get("page_id")
+        chunk_index = doc.metadata.get("chunk_index")
+        if page_id is None or chunk_index is None:
+            groups[("rank", rank)] = [(rank, 0, doc.page_content)]
+        else:
+            groups.setdefault(page_id, []).append((rank, chunk_index, doc.page_content))
+
+    merged = []
+    for chunks in groups.values():
+        chunks.sort(key=lambda c: c[1])
+        best_rank, last_index, text = chunks[0]
+        for rank, chunk_index, content in chunks[1:]:
+            if chunk_index == last_index:
+                continue
+            if chunk_index == last_index + 1:
+                text = _merge_overlap(text, content)
+                best_rank = min(best_rank, rank)
+            else:
+                merged.append((best_rank, text))
+                best_rank, text = rank, content
+            last_index = chunk_index
+        merged.append((best_rank, text))
+
+    merged.sort(key=lambda m: m[0])
+    return [text for _, text in merged]
+
+
+def _merge_overlap(head, tail):
+    """前のチャンクの末尾と次のチャンクの先頭の重なりを除いて結合する"""
+    # 句読点などの短い一致を重なりと誤認しないよう、10文字未満の一致は重なりとみなさない
+    for size in range(min(len(head), len(tail), ct.CHUNK_OVERLAP), 9, -1):
+        if head.endswith(tail[:size]):
+            return head + tail[size:]
+    return head + "\n" + tail
+
+
+def _shingles(text, size=3):
+    """ほぼ重複の判定に使う文字n-gramの集合を作る"""
+    text = "".join(text.split())
+    return {text[i:i + size] for i in range(max(len(text) - size + 1, 1))}
+
+
+def _containment(a, b):
+    """集合aのうち集合bにも含まれる要素の割合を計算する"""
+    if not a:
+        return 1.0
+    return len(a & b) / len(a)
@@ -0,0 +1,194 @@
+"""
+このファイルは、会話ログを一定の件数に抑えて保持するための関数を定義するファイルです。
+会話ログ・モードはセッションストア（session_store.py）に保存し、セッションIDを画面のURL（クエリパラメータ）に持たせるため、
+アプリの再起動後や別のプロセス（レプリカ）に接続した場合も、同じURLを開けば会話を続けられます。
+セッション変数には直近のメッセージ（HISTORY_MAX_IN_MEMORY_MESSAGES件まで）のみを保持し、
+上限を超えた場合はHISTORY_PAGE_SIZE件ずつ古いメッセージを手放します（手放したメッセージを「ページ」と呼びます）。
+ページの内容は変更されないため、表示用のMarkdownはページ単位で組み立てて使い回します。
+画面の再実行ごとに表示するのは直近のメッセージと、利用者が読み込んだ過去のページのみです。
+"""
+
+############################################################
+# 1. ライブラリの読み込み
+############################################################
+# streamlitアプリの表示を担当するモジュール
+import streamlit as st
+# 一意なIDを生成するためのモジュール
+import uuid
+# 正規表現を扱うためのモジュール
+import re
+# 排他制御を行うためのモジュール
+import threading
+# ログ出力を行うためのモジュール
+import logging
+# 関数の結果を保持するためのモジュール
+from functools import lru_cache
+# （自作）セッションごとの会話ログ・状態を保存するセッションストア
+from session_store import get_session_store
+# 固定値・変数を定義しているファイル
+import constants as ct
+
+# ロガーの設定
+logger = logging.getLogger(ct.LOGGER_NAME)
+
+# セッションIDの形式（URLで受け取った値の検証に使用）
+SESSION_ID_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+
+
+############################################################
+# 2. セッションの会話ログ
+############################################################
+
+def init_session():
+    """
+    会話ログに関するセッション変数を初期化する関数（初回のみ）
+    URLのセッションIDに保存済みの会話がある場合は、直近のメッセージとモードを読み込む
+    """
+    if "session_id" in st.session_state:
+        return
+
+    session_id = st.query_params.get(ct.SESSION_QUERY_PARAM, "")
+    if not SESSION_ID_PATTERN.match(session_id):
+        session_id = _start_new_session()
+    st.session_state.session_id = session_id
+
+    store = get_session_store()
+    message_count = store.count_messages(session_id)
+    archived = get_archived_message_count(message_count)
+    st.session_state.messages = store.get_messages(session_id, archived, message_count)
+    st.session_state.message_count = message_count
+    st.session_state.history_pages_shown = 0
+
+    state = store.get_state(session_id)
+    if state.get("mode") in (ct.ANSWER_MODE_1, ct.ANSWER_MODE_2):
+        st.session_state.mode = state["mode"]
+    if message_count:
+        logger.info(f"保存済みの会話を読み込みました: {message_count}件")
+
+
+def _start_new_session():
+    """新しいセッションIDを発行し、URLに設定する"""
+    session_id = uuid.uuid4().hex
+    st.query_params[ct.SESSION_QUERY_PARAM] = session_id
+    return session_id
+
+
+def get_archived_message_count(message_count):
+    """
+    会話ログのメッセージ数のうち、セッション変数に保持せずページとして手放している数を返す関数
+
+    Args:
+        message_count: 会話ログのメッセージ数
+
+    Returns:
+        int: ページとして手放しているメッセージ数（HISTORY_PAGE_SIZEの倍数）
+    """
+    overflow = message_count - ct.HISTORY_MAX_IN_MEMORY_MESSAGES
+    if overflow <= 0:
+        return 0
+    return -(-overflow // ct.HISTORY_PAGE_SIZE) * ct.HISTORY_PAGE_SIZE
+
+
+def get_archived_page_count():
+    """
+    手放したページの数を返す関数
+
+    Returns:
+        int: ページ数
+    """
+    return (st.session_state.message_count - len(st.session_state.messages)) // ct.HISTORY_PAGE_SIZE
+
+
+def append_message(role, content):
+    """
+    会話ログにメッセージを追加する関数
+    セッションストアへの書き込みはまとめて行われ、ここでは待たない
+    保持する件数の上限を超えた場合は、古いメッセージをセッション変数から手放す
+
+    Args:
+        role: "user" または "assistant"
+        content: メッセージの本文（Markdown）
+    """
+    message = {"role": role, "content": content}
+    get_session_store().append_messages(st.session_state.session_id, [message])
+    messages = st.session_state.messages
+    messages.append(message)
+    st.session_state.message_count += 1
+
+    while len(messages) > ct.HISTORY_MAX_IN_MEMORY_MESSAGES:
+        del messages[:ct.HISTORY_PAGE_SIZE]
+
+
+def save_state(key, value):
+    """
+    セッションの状態（モードなど）をセッションストアに保存する関数
+
+    Args:
+        key: 状態の名前
+        value: 状態の値（JSONにできる値）
+    """
+    get_session_store().set_state(st.session_state.session_id, key, value)
+
+
+def clear_messages():
+    """
+    会話ログを空にする関数（保存済みの会話も削除する）
+    以降は新しいセッションIDで保存するため、組み立て済みのMarkdownと取り違えることはない
+    """
+    get_session_store().delete_session(st.session_state.session_id)
+    st.session_state.session_id = _start_new_session()
+    st.session_state.messages = []
+    st.session_state.message_count = 0
+    st.session_state.history_pages_shown = 0
+
+
+def show_earlier_page():
+    """過去のページを1ページ分多く表示する関数（「以前の会話を表示」ボタンから呼ぶ）"""
+    st.session_state.history_pages_shown = min(
+        st.session_state.history_pages_shown + 1,
+        get_archived_page_count()
+    )
+
+
+############################################################
+# 3. 過去のページの表示
+############################################################
+
+@lru_cache(maxsize=ct.HISTORY_RENDER_CACHE_PAGES)
+def render_archived_page(session_id, page):
+    """
+    手放したページを表示用の1つのMarkdownに組み立てる関数（ページは変更されないため結果を使い回す）
+
+    Args:
+        session_id: セッションID
+        page: ページ番号（古い順に0から）
+
+    Returns:
+        str: ページのMarkdown
+    """
+    start = page * ct.HISTORY_PAGE_SIZE
+    blocks = []
+    for message in get_session_store().get_messages(session_id, start, start + ct.HISTORY_PAGE_SIZE):
+        label = ct.HISTORY_ROLE_LABELS.get(message["role"], message["role"])
+        blocks.append(f"**{label}**\n\n{message['content']}")
+    return "\n\n---\n\n".join(blocks)
+
+
+_purged = False
+_purge_lock = threading.Lock()
+
+
+def purge_expired_sessions():
+    """
+    最後の更新からHISTORY_RETENTION_DAYS日を過ぎたセッションの会話ログを削除する関数
+    （プロセスにつき1度だけ実行する）
+    """
+    global _purged
+    with _purge_lock:
+        if _purged:
+            return
+        _purged = True
+
+    removed = get_session_store().purge_expired(ct.HISTORY_RETENTION_DAYS * 24 * 60 * 60)
+    if removed:
+        logger.info(f"保持期間を過ぎた会話ログを削除しました: {removed}件")
@@ -0,0 +1,293 @@
+"""
+このファイルは、Embeddingの永続キャッシュとローカルEmbeddingモデルを定義するファイルです。
+チャンク本文とモデル名のハッシュ値をキーにEmbeddingをSQLiteへ保存し、
+キャッシュにないチャンクのみをバッチ単位・並列数上限付きでEmbeddingモデルに送ります。
+"""
+
+############################################################
+# 1. ライブラリの読み込み
+############################################################
+# 環境変数・ファイルパスを操作するモジュール
+import os
+# ハッシュ値を計算するためのモジュール
+import hashlib
+# 文字列の正規化を行うためのモジュール
+import unicodedata
+# 数値計算を行うためのモジュール
+import math
+# float32配列をバイト列に変換するためのモジュール
+from array import array
+# SQLiteを扱うためのモジュール
+import sqlite3
+# 排他制御を行うためのモジュール
+import threading
+# 並列処理を行うためのモジュール
+from concurrent.futures import ThreadPoolExecutor
+# 順序付き辞書（検索クエリのLRUキャッシュ）を扱うためのモジュール
+from collections import OrderedDict
+# 処理時間を扱うためのモジュール
+import time
+# ログ出力を行うためのモジュール
+import logging
+# LangChainのEmbeddingsの基底クラス
+from langchain_core.embeddings import Embeddings
+# （自作）外部APIの呼び出しを制御するモジュール
+import concurrency
+# 固定値・変数を定義しているファイル
+import constants as ct
+
+# ロガーの設定
+logger = logging.getLogger(ct.LOGGER_NAME)
+
+
+############################################################
+# 2. Embeddingキャッシュ
+############################################################
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddingの結果をディスクにキャッシュするEmbeddingsのラッパー
+    - キー: モデル名とテキストのSHA-256
+    - 上限件数を超えた場合は、最後に使われた日時が古いものから削除
+      （最終利用日時の更新はメモリ上にためておき、保存時か一定件数ごとにまとめて書き込む）
+    - キャッシュにないテキストはバッチに分け、並列数の上限付きでリトライしながらEmbeddingする
+    - 検索クエリはディスクのキャッシュを通さず、プロセス内の小さなLRUキャッシュのみを使う
+    """
+
+    def __init__(self, embeddings, model_name, cache_path,
+                 max_entries=ct.EMBEDDING_CACHE_MAX_ENTRIES,
+                 batch_size=ct.EMBEDDING_BATCH_SIZE,
+                 max_concurrency=ct.EMBEDDING_MAX_CONCURRENCY,
+                 max_retries=ct.EMBEDDING_MAX_RETRIES,
+                 query_cache_size=ct.EMBEDDING_QUERY_CACHE_SIZE):
+        """
+        Args:
+            embeddings: 実際にEmbeddingを行うモデル
+            model_name: キャッシュのキーに含めるモデル名
+            cache_path: キャッシュを保存するSQLiteファイルのパス
+            max_entries: キャッシュの最大件数
+            batch_size: 1回のリクエストで送るテキスト数
+            max_concurrency: 同時に送るリクエスト数の上限
+            max_retries: 失敗時のリトライ回数
+            query_cache_size: プロセス内に保持する検索クエリのEmbeddingの件数
+        """
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self.batch_size = batch_size
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.query_cache_size = query_cache_size
+        self._lock = threading.Lock()
+        # 最終利用日時の更新待ち（キー → 利用日時）
+        self._touched = {}
+        self._query_cache = OrderedDict()
+        self._query_lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(cache_path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(cache_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_last_used ON embeddings(last_used)")
+        self._conn.commit()
+
+    def embed_documents(self, texts):
+        """
+        複数のテキストをEmbeddingする（キャッシュにあるものは再利用）
+
+        Args:
+            texts: Embeddingするテキストのリスト
+
+        Returns:
+            list: Embeddingのリスト
+        """
+        keys = [self._make_key(text) for text in texts]
+        cached = self._get_many(keys)
+
+        # キャッシュにないテキストを重複なしで抽出
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in cached and key not in missing:
+                missing[key] = text
+        if missing:
+            logger.debug(f"Embeddingキャッシュ: ヒット{len(texts) - len(missing)}件、ミス{len(missing)}件")
+            cached.update(self._embed_missing(missing))
+
+        return [cached[key] for key in keys]
+
+    def embed_query(self, text):
+        """
+        検索クエリをEmbeddingする
+        回答時の処理を遅らせないよう、ディスクのキャッシュは読み書きせず、
+        同じプロセスで最近Embeddingしたクエリのみを再利用する
+
+        Args:
+            text: 検索クエリ
+
+        Returns:
+            list: Embedding
+        """
+        with self._query_lock:
+            vector = self._query_cache.get(text)
+            if vector is not None:
+                self._query_cache.move_to_end(text)
+                return vector
+        vector = self._embed_batch_with_retry([text])[0]
+        with self._query_lock:
+            self._query_cache[text] = vector
+            while len(self._query_cache) > self.query_cache_size:
+                self._query_cache.popitem(last=False)
+        return vector
+
+    def _make_key(self, text):
+        """モデル名とテキストからキャッシュのキーを作成する"""
+        return hashlib.sha256(f"{self.model_name}\0{text}".encode("utf-8")).hexdigest()
+
+    def _get_many(self, keys):
+        """キャッシュからEmbeddingを取得する（最終利用日時の更新は保留し、ここでは読み込みのみ行う）"""
+        found = {}
+        unique_keys = list(dict.fromkeys(keys))
+        now = time.time()
+        with self._lock:
+            # SQLiteの変数上限を超えないよう分割して問い合わせる
+            for i in range(0, len(unique_keys), 500):
+                part = unique_keys[i:i + 500]
+                placeholders = ",".join("?" * len(part))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", part
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = array("f", blob).tolist()
+                    self._touched[key] = now
+            if len(self._touched) >= ct.EMBEDDING_CACHE_TOUCH_BATCH:
+                self._write_touched()
+                self._conn.commit()
+        return found
+
+    def flush(self):
+        """保留している最終利用日時の更新を書き込む"""
+        with self._lock:
+            if self._touched:
+                self._write_touched()
+                self._conn.commit()
+
+    def _write_touched(self):
+        """保留している最終利用日時の更新を実行する（ロックを取得した状態で呼び、コミットは呼び出し側で行う）"""
+        self._conn.executemany(
+            "UPDATE embeddings SET last_used = ? WHERE key = ?",
+            [(used_at, key) for key, used_at in self._touched.items()]
+        )
+        self._touched = {}
+
+    def _embed_missing(self, missing):
+        """キャッシュにないテキストをバッチ・並列でEmbeddingし、キャッシュに保存する"""
+        items = list(missing.items())
+        batches = [items[i:i + self.batch_size] for i in range(0, len(items), self.batch_size)]
+
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            batch_vectors = list(executor.map(self._embed_batch_with_retry, [[t for _, t in b] for b in batches]))
+
+        results = {}
+        for batch, vectors in zip(batches, batch_vectors):
+            for (key, _), vector in zip(batch, vectors):
+                results[key] = vector
+        self._put_many(results)
+        return results
+
+    def _embed_batch_with_retry(self, texts):
+        """1バッチ分のテキストを、指数バックオフでリトライしながらEmbeddingする"""
+        for attempt in range(self.max_retries + 1):
+            try:
+                return self.embeddings.embed_documents(texts)
+            except Exception as e:
+                if attempt == self.max_retries:
+                    raise
+                delay = ct.EMBEDDING_RETRY_BASE_DELAY * (2 ** attempt)
+                logger.warning(f"Embeddingに失敗したため{delay:.1f}秒後にリトライします: {e}")
+                time.sleep(delay)
+
+    def _put_many(self, vectors):
+        """Embeddingをキャッシュに保存し、上限件数を超えた分を古い順に削除する"""
+        now = time.time()
+        rows = [(key, array("f", vector).tobytes(), now) for key, vector in vectors.items()]
+        with self._lock:
+            # 古い順に削除する前に、保留している最終利用日時の更新を反映する
+            self._write_touched()
+            self._conn.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?)", rows)
+            count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            if count > self.max_entries:
+                self._conn.execute(
+                    "DELETE FROM embeddings WHERE key IN "
+                    "(SELECT key FROM embeddings ORDER BY last_used LIMIT ?)",
+                    (count - self.max_entries,)
+                )
+            self._conn.commit()
+
+
+############################################################
+# 3. 流量制御付きEmbeddingモデル
+############################################################
+
+class RateLimitedEmbeddings(Embeddings):
+    """
+    プロセスで共有する流量制御（同時実行数・呼び出し頻度）の範囲内でEmbeddingを行うラッパー
+    検索時のクエリとインデックス構築時のバッチが、同じ上限の中で順番に送られる
+    """
+
+    def __init__(self, embeddings, limiter=None):
+        """
+        Args:
+            embeddings: 実際にEmbeddingを行うモデル
+            limiter: 流量制御（省略時はプロセスで共有するEmbedding用のもの）
+        """
+        self.embeddings = embeddings
+        self.limiter = limiter or concurrency.get_limiter("embedding")
+
+    def embed_documents(self, texts):
+        with self.limiter.limit():
+            return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text):
+        with self.limiter.limit():
+            return self.embeddings.embed_query(text)
+
+
+############################################################
+# 4. ローカルEmbeddingモデル
+############################################################
+
+class LocalHashEmbeddings(Embeddings):
+    """
+    外部APIを使わない決定的なEmbeddingモデル（テスト・ベンチマーク用）
+    文字n-gramを特徴量ハッシングで固定次元のベクトルにするため、
+    表記が近いテキストほど類似度が高くなる（日本語にもそのまま使える）
+    """
+
+    def __init__(self, dimensions=ct.LOCAL_EMBEDDING_DIMENSIONS, ngram=2):
+        """
+        Args:
+            dimensions: ベクトルの次元数
+            ngram: 特徴量に使う文字n-gramの長さ
+        """
+        self.dimensions = dimensions
+        self.ngram = ngram
+
+    def embed_documents(self, texts):
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text):
+        return self._embed(text)
+
+    def _embed(self, text):
+        """テキストを正規化済みのベクトルに変換する"""
+        text = unicodedata.normalize("NFKC", text).lower()
+        vector = [0.0] * self.dimensions
+        for i in range(max(len(text) - self.ngram + 1, 1)):
+            digest = hashlib.md5(text[i:i + self.ngram].encode("utf-8")).digest()
+            index = int.from_bytes(digest[:4], "little") % self.dimensions
+            vector[index] += 1.0 if digest[4] & 1 else -1.0
+        norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+        return [v / norm for v in vector]
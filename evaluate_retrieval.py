@@ -0,0 +1,273 @@
+"""
+このファイルは、チャンク分割の設定とRETRIEVER_Kの組み合わせごとに、検索品質とコストを評価するコマンドです。
+フィクスチャの「質問 → 正解ページ」の組を使い、ローカルEmbeddingモデルで組み合わせごとにインデックスを構築して、
+以下を比較します（OpenAI・Notionには接続しません）。
+- recall@k: 正解ページのうち、検索結果（上位k件）に含まれた割合
+- MRR: 最初に見つかった正解ページの順位の逆数の平均
+- インデックスのサイズ・チャンク数・Embeddingするトークン数・構築時間
+- プロンプトのトークン数の平均
+recall@kの目標値を満たす組み合わせのうち、プロンプトのトークン数が最も少ないものを推奨として表示します。
+
+使い方:
+    python evaluate_retrieval.py                                           # 既定の組み合わせで評価
+    python evaluate_retrieval.py --chunk-sizes 300 600 --chunk-overlaps 0 50 --ks 3 5
+    python evaluate_retrieval.py --fixture my_queries.json --recall-target 0.95
+    python evaluate_retrieval.py --rerank                                  # リランキングありで評価
+"""
+
+############################################################
+# 1. ライブラリの読み込み
+############################################################
+# 環境変数・ファイルパスを操作するモジュール
+import os
+# コマンドライン引数を扱うためのモジュール
+import argparse
+# 一時ディレクトリを作成するためのモジュール
+import tempfile
+# ディレクトリの削除を行うためのモジュール
+import shutil
+# JSONデータを扱うためのモジュール
+import json
+# ログ出力を行うためのモジュール
+import logging
+# 標準出力・終了コードを扱うためのモジュール
+import sys
+# LangChainのPromptTemplateを使用するためのモジュール
+from langchain.prompts import PromptTemplate
+# 固定値・変数を定義しているファイル
+import constants as ct
+# （自作）Notionとベクターストアの差分同期を行うモジュール
+import notion_sync
+# （自作）共有リソースを取得する関数
+from initialize import get_shared_resources, get_active_index
+# （自作）検索結果からコンテキストを組み立てる関数・トークン数を数える関数
+from context_builder import build_context, count_tokens
+# （自作）Notionエクスポートのフィクスチャを読み込む関数
+from fixture_loader import load_fixture, expand_pages
+# （自作）ベンチマークのインデックス構築処理
+from benchmark import run_ingestion
+
+# ロガーの設定
+logger = logging.getLogger(ct.LOGGER_NAME)
+
+
+############################################################
+# 2. 評価指標
+############################################################
+
+def rank_pages(documents):
+    """
+    検索結果のチャンクをページ単位の順位に変換する関数（同じページは最初の順位のみ残す）
+
+    Args:
+        documents: 検索結果（Documentのリスト）
+
+    Returns:
+        list: ページIDのリスト（順位順）
+    """
+    page_ids = []
+    for doc in documents:
+        page_id = doc.metadata.get("page_id")
+        if page_id not in page_ids:
+            page_ids.append(page_id)
+    return page_ids
+
+
+def recall(ranked_page_ids, relevant_page_ids):
+    """
+    正解ページのうち、検索結果に含まれた割合を求める関数
+
+    Args:
+        ranked_page_ids: 検索結果のページIDのリスト
+        relevant_page_ids: 正解ページIDのリスト
+
+    Returns:
+        float: recall
+    """
+    relevant = set(relevant_page_ids)
+    return len(relevant & set(ranked_page_ids)) / len(relevant)
+
+
+def reciprocal_rank(ranked_page_ids, relevant_page_ids):
+    """
+    最初に見つかった正解ページの順位の逆数を求める関数
+
+    Args:
+        ranked_page_ids: 検索結果のページIDのリスト
+        relevant_page_ids: 正解ページIDのリスト
+
+    Returns:
+        float: 順位の逆数（正解ページがない場合は0）
+    """
+    for rank, page_id in enumerate(ranked_page_ids, 1):
+        if page_id in relevant_page_ids:
+            return 1.0 / rank
+    return 0.0
+
+
+############################################################
+# 3. 評価処理
+############################################################
+
+def evaluate_retriever(queries, retriever_k):
+    """
+    公開中のインデックスに対して、評価用の質問で検索品質とプロンプトのトークン数を測る関数
+
+    Args:
+        queries: 評価用の質問（query, relevant_page_ids）のリスト
+        retriever_k: RETRIEVER_Kの値
+
+    Returns:
+        dict: recall@k・MRR・プロンプトのトークン数の平均
+    """
+    # RETRIEVER_Kを変えて共有リソースを作り直す
+    ct.RETRIEVER_K = retriever_k
+    get_shared_resources.clear()
+    retriever = get_active_index()["retriever"]
+    prompt_template = PromptTemplate.from_template(ct.CONTACT_PROMPT_TEMPLATE)
+
+    recalls = []
+    reciprocal_ranks = []
+    prompt_tokens = []
+    for item in queries:
+        documents = retriever.invoke(item["query"])
+        ranked_page_ids = rank_pages(documents)
+        recalls.append(recall(ranked_page_ids, item["relevant_page_ids"]))
+        reciprocal_ranks.append(reciprocal_rank(ranked_page_ids, item["relevant_page_ids"]))
+        context, _ = build_context(documents)
+        prompt_tokens.append(count_tokens(prompt_template.format(context=context, question=item["query"])))
+
+    return {
+        "retriever_k": retriever_k,
+        "recall_at_k": round(sum(recalls) / len(recalls), 4),
+        "mrr": round(sum(reciprocal_ranks) / len(reciprocal_ranks), 4),
+        "mean_prompt_tokens": round(sum(prompt_tokens) / len(prompt_tokens), 1),
+    }
+
+
+def count_embedding_tokens():
+    """
+    公開中のインデックスの全チャンクのトークン数（Embeddingのコストの目安）を数える関数
+
+    Returns:
+        int: トークン数の合計
+    """
+    vectorstore = get_active_index()["vectorstore"]
+    return sum(count_tokens(text) for text in vectorstore.get(include=["documents"])["documents"])
+
+
+def choose_configuration(results, recall_target):
+    """
+    recall@kの目標値を満たす組み合わせのうち、プロンプトのトークン数が最も少ないものを選ぶ関数
+    （同じ場合はインデックスのサイズが小さいものを選ぶ）
+
+    Args:
+        results: 組み合わせごとの評価結果のリスト
+        recall_target: recall@kの目標値
+
+    Returns:
+        dict: 推奨する組み合わせ（目標値を満たすものがない場合はNone）
+    """
+    candidates = [result for result in results if result["recall_at_k"] >= recall_target]
+    if not candidates:
+        return None
+    return min(candidates, key=lambda result: (result["mean_prompt_tokens"], result["index_bytes"]))
+
+
+############################################################
+# 4. メイン処理
+############################################################
+
+def main():
+    """チャンク分割の設定とRETRIEVER_Kの組み合わせを評価して結果を表示する関数"""
+    parser = argparse.ArgumentParser(description="チャンク分割の設定とRETRIEVER_Kごとに検索品質とコストを評価します")
+    parser.add_argument("--fixture", default=ct.BENCHMARK_FIXTURE_FILE, help="ページと評価用の質問のフィクスチャ")
+    parser.add_argument("--chunk-sizes", type=int, nargs="+", default=ct.EVALUATION_CHUNK_SIZES, help="チャンクサイズ")
+    parser.add_argument("--chunk-overlaps", type=int, nargs="+", default=ct.EVALUATION_CHUNK_OVERLAPS,
+                        help="チャンクオーバーラップ")
+    parser.add_argument("--ks", type=int, nargs="+", default=ct.EVALUATION_RETRIEVER_KS, help="RETRIEVER_Kの値")
+    parser.add_argument("--pages", type=int, help="フィクスチャのページを複製して、このページ数のコーパスで評価する")
+    parser.add_argument("--recall-target", type=float, default=ct.EVALUATION_RECALL_TARGET, help="recall@kの目標値")
+    parser.add_argument("--rerank", action="store_true", help="検索結果をリランキングして評価する")
+    parser.add_argument("--output", help="結果をJSONで保存するファイル")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format="%(asctime)s - %(levelname)s - %(message)s")
+    logger.propagate = False
+    fixture = load_fixture(args.fixture)
+    pages = expand_pages(fixture["pages"], args.pages)
+    queries = fixture["queries"]
+    output_path = os.path.abspath(args.output) if args.output else None
+
+    # 外部APIを使わない設定
+    os.environ["EMBEDDING_BACKEND"] = "local"
+    os.environ["LLM_BACKEND"] = "fake"
+    ct.RERANK_ENABLED = args.rerank
+
+    # インデックス・キャッシュは一時ディレクトリに作成する
+    results = []
+    original_dir = os.getcwd()
+    work_dir = tempfile.mkdtemp(prefix="evaluation-")
+    os.chdir(work_dir)
+    try:
+        print(f"{'size':>6}{'overlap':>8}{'k':>4}{'recall@k':>10}{'MRR':>8}{'prompt':>8}"
+              f"{'chunks':>8}{'index(KB)':>11}{'build(s)':>10}")
+        for chunk_size in args.chunk_sizes:
+            for chunk_overlap in args.chunk_overlaps:
+                if chunk_overlap >= chunk_size:
+                    continue
+                # コンテキスト構築時のオーバーラップの除去も、評価する設定に合わせる
+                ct.CHUNK_SIZE, ct.CHUNK_OVERLAP = chunk_size, chunk_overlap
+                ingestion = run_ingestion(pages, notion_sync.create_text_splitter(chunk_size, chunk_overlap))
+                get_shared_resources.clear()
+                embedding_tokens = count_embedding_tokens()
+
+                for retriever_k in args.ks:
+                    result = {
+                        "chunk_size": chunk_size,
+                        "chunk_overlap": chunk_overlap,
+                        **evaluate_retriever(queries, retriever_k),
+                        "chunks": ingestion["chunks"],
+                        "embedding_tokens": embedding_tokens,
+                        "index_bytes": ingestion["index_bytes"],
+                        "build_seconds": ingestion["seconds"],
+                    }
+                    results.append(result)
+                    print(
+                        f"{chunk_size:>6}{chunk_overlap:>8}{retriever_k:>4}{result['recall_at_k']:>10.3f}"
+                        f"{result['mrr']:>8.3f}{result['mean_prompt_tokens']:>8.0f}{result['chunks']:>8}"
+                        f"{result['index_bytes'] / 1024:>11.0f}{result['build_seconds']:>10.2f}"
+                    )
+    finally:
+        os.chdir(original_dir)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    recommended = choose_configuration(results, args.recall_target)
+    if recommended:
+        print(
+            f"推奨: CHUNK_SIZE={recommended['chunk_size']}, CHUNK_OVERLAP={recommended['chunk_overlap']}, "
+            f"RETRIEVER_K={recommended['retriever_k']}（recall@k {recommended['recall_at_k']:.3f}, "
+            f"プロンプト {recommended['mean_prompt_tokens']:.0f}トークン）"
+        )
+    else:
+        print(f"recall@k {args.recall_target} を満たす組み合わせはありませんでした。")
+
+    if output_path:
+        with open(output_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "fixture": args.fixture,
+                "pages": len(pages),
+                "queries": len(queries),
+                "recall_target": args.recall_target,
+                "rerank": args.rerank,
+                "results": results,
+                "recommended": recommended,
+            }, f, ensure_ascii=False, indent=2)
+        print(f"結果を保存しました: {output_path}")
+
+    if recommended is None:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
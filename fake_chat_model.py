@@ -0,0 +1,58 @@
+"""
+このファイルは、外部APIを使わずに応答する疑似チャットモデルを定義するファイルです。
+最初のトークンまでの待ち時間とトークンごとの待ち時間を指定でき、
+OpenAIを呼ばずにアプリ全体の処理時間を計測する（ベンチマーク・動作確認）ために使います。
+"""
+
+############################################################
+# 1. ライブラリの読み込み
+############################################################
+# 処理の待ち時間を扱うためのモジュール
+import time
+# 型ヒントを扱うためのモジュール
+from typing import Any, Iterator, List, Optional
+# LangChainのチャットモデルの基底クラス
+from langchain_core.language_models.chat_models import BaseChatModel
+# LangChainのメッセージ・生成結果のクラス
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+# 固定値・変数を定義しているファイル
+import constants as ct
+
+
+############################################################
+# 2. 疑似チャットモデル
+############################################################
+
+class FakeChatModel(BaseChatModel):
+    """
+    決まった形式の回答を、指定した待ち時間をかけて返す疑似チャットモデル
+    回答はプロンプトの長さから決まる固定のトークン列で、同じプロンプトには同じ回答を返す
+    """
+
+    first_token_latency: float = ct.FAKE_LLM_FIRST_TOKEN_LATENCY
+    token_latency: float = ct.FAKE_LLM_TOKEN_LATENCY
+    answer_tokens: int = ct.FAKE_LLM_ANSWER_TOKENS
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    def _tokens(self, messages: List[BaseMessage]) -> List[str]:
+        """プロンプトに対する回答のトークン列を作る"""
+        prompt_length = sum(len(str(message.content)) for message in messages)
+        return [f"回答{(prompt_length + i) % 100}。" for i in range(self.answer_tokens)]
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        tokens = self._tokens(messages)
+        time.sleep(self.first_token_latency + self.token_latency * max(len(tokens) - 1, 0))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content="".join(tokens)))])
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager: Any = None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        time.sleep(self.first_token_latency)
+        for i, token in enumerate(self._tokens(messages)):
+            if i:
+                time.sleep(self.token_latency)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
@@ -0,0 +1,129 @@
+"""
+このファイルは、Notionデータベースのエクスポート（JSON）をNotion APIの代わりに読み込むローダーを定義するファイルです。
+AsyncNotionDBLoaderと同じインターフェースを持つため、ネットワークに接続せずに
+インデックス構築・検索・回答の処理をそのまま実行できます（ベンチマーク・評価用）。
+
+エクスポートの形式:
+    {
+        "pages": [{"id", "title", "url", "last_edited_time", "content"}, ...],
+        "queries": [{"query", "relevant_page_ids": [...]}, ...]
+    }
+"""
+
+############################################################
+# 1. ライブラリの読み込み
+############################################################
+# JSONデータを扱うためのモジュール
+import json
+# LangChainのDocumentクラス
+from langchain_core.documents import Document
+
+
+############################################################
+# 2. フィクスチャの読み込み
+############################################################
+
+def load_fixture(path):
+    """
+    Notionエクスポートのフィクスチャを読み込む関数
+
+    Args:
+        path: フィクスチャのファイルパス
+
+    Returns:
+        dict: ページ（pages）と評価用の質問（queries）
+    """
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def expand_pages(pages, page_count):
+    """
+    ページを複製して指定したページ数のコーパスを作る関数
+    複製したページはIDと本文の末尾を変えるため、別のページとして登録される
+
+    Args:
+        pages: フィクスチャのページのリスト
+        page_count: 作成するページ数（Noneの場合は元のページのみ）
+
+    Returns:
+        list: ページのリスト
+    """
+    if page_count is None:
+        return list(pages)
+    expanded = []
+    for n in range(page_count):
+        page = pages[n % len(pages)]
+        copy_number = n // len(pages)
+        if copy_number == 0:
+            expanded.append(page)
+            continue
+        expanded.append({
+            **page,
+            "id": f"{page['id']}-copy{copy_number}",
+            "title": f"{page['title']}（{copy_number}）",
+            "content": f"{page['content']}\n\n（複製{copy_number}）",
+        })
+    return expanded
+
+
+############################################################
+# 3. フィクスチャのローダー
+############################################################
+
+class FixtureNotionLoader:
+    """
+    フィクスチャのページをNotionデータベースのページとして返すローダー
+    - retrieve_page_summaries(): 全ページの概要（プロパティ・最終更新日時）を返す
+    - lazy_load_pages(page_summaries): ページ本文をDocumentとして返す
+    """
+
+    def __init__(self, pages):
+        """
+        Args:
+            pages: フィクスチャのページのリスト
+        """
+        self.pages = {page["id"]: page for page in pages}
+
+    def retrieve_page_summaries(self):
+        """
+        全ページの概要を返す
+
+        Returns:
+            list: ページ概要のリスト
+        """
+        return [
+            {
+                "id": page["id"],
+                "url": page.get("url"),
+                "last_edited_time": page.get("last_edited_time"),
+                "properties": {},
+            }
+            for page in self.pages.values()
+        ]
+
+    def lazy_load_pages(self, page_summaries):
+        """
+        ページ本文をDocumentとして返すジェネレーター
+
+        Args:
+            page_summaries: 読み込むページの概要のリスト
+
+        Yields:
+            Document: ページ本文とメタデータ
+        """
+        for page_summary in page_summaries:
+            page = self.pages[page_summary["id"]]
+            yield Document(
+                page_content=page["content"],
+                metadata={"id": page["id"], "title": page["title"]}
+            )
+
+    def load(self):
+        """
+        全ページを読み込む
+
+        Returns:
+            list: Documentのリスト
+        """
+        return list(self.lazy_load_pages(self.retrieve_page_summaries()))
@@ -0,0 +1,179 @@
+"""
+このファイルは、アプリが利用する外部サービス・インデックスの状態を確認するヘルスチェックを定義するファイルです。
+確認結果は一定時間キャッシュするため、画面の再実行ごとに外部への通信が発生することはありません。
+単独で実行すると、デプロイ時などに使うReadinessチェックのコマンドになります。
+
+使い方:
+    python health.py    # 確認結果をJSONで表示し、問題がなければ終了コード0、あれば1で終了
+"""
+
+############################################################
+# 1. ライブラリの読み込み
+############################################################
+# 「.env」ファイルから環境変数を読み込むための関数
+from dotenv import load_dotenv
+# 環境変数を操作するモジュール
+import os
+# 処理時間を計測するためのモジュール
+import time
+# 日付・時刻を扱うためのモジュール
+import datetime
+# 排他制御を行うためのモジュール
+import threading
+# JSONデータを扱うためのモジュール
+import json
+# 標準出力・終了コードを扱うためのモジュール
+import sys
+# HTTPリクエストを行うためのモジュール
+import httpx
+# （自作）外部サービスとの通信に使う共有HTTPクライアント
+import http_clients
+# （自作）インデックスの世代管理を行うモジュール
+import index_store
+# 固定値・変数を定義しているファイル
+import constants as ct
+
+
+############################################################
+# 2. 個別の確認処理
+############################################################
+
+def check_notion(token, database_id):
+    """
+    Notionの統合トークンが有効で、データベースを参照できるかを確認する関数
+
+    Args:
+        token: Notion統合トークン
+        database_id: NotionデータベースID
+
+    Returns:
+        dict: 確認結果（ok, detail）
+    """
+    if not token or not database_id:
+        return {"ok": False, "detail": "Notion APIの設定が不足しています"}
+    headers = {"Authorization": f"Bearer {token}"}
+    client = http_clients.get_notion_http_client()
+    try:
+        response = client.get("/users/me", headers=headers)
+        if response.status_code != 200:
+            return {"ok": False, "detail": f"Notionの認証に失敗しました（{response.status_code}）"}
+        response = client.get(f"/databases/{database_id}", headers=headers)
+        if response.status_code != 200:
+            return {"ok": False, "detail": f"Notionデータベースを参照できません（{response.status_code}）"}
+    except httpx.HTTPError as e:
+        return {"ok": False, "detail": f"Notionに接続できません（{type(e).__name__}）"}
+    return {"ok": True, "detail": "Notionに接続できます"}
+
+
+def check_index():
+    """
+    公開中のインデックスがあるかを確認する関数
+
+    Returns:
+        dict: 確認結果（ok, detail）
+    """
+    index_dir = index_store.get_current_index_dir()
+    if index_dir is None or not os.path.isdir(index_dir):
+        return {"ok": False, "detail": "インデックスが構築されていません"}
+    return {"ok": True, "detail": f"公開中の世代: {index_store.get_current_generation()}"}
+
+
+def check_openai(api_key):
+    """
+    OpenAI APIキーが設定されているかを確認する関数（キーを使う通信は行わない）
+
+    Args:
+        api_key: OpenAI APIキー
+
+    Returns:
+        dict: 確認結果（ok, detail）
+    """
+    if not api_key:
+        return {"ok": False, "detail": "OpenAI APIキーが設定されていません"}
+    return {"ok": True, "detail": "OpenAI APIキーが設定されています"}
+
+
+############################################################
+# 3. ヘルスチェック
+############################################################
+
+_status = None
+_status_expires_at = 0.0
+_status_lock = threading.Lock()
+_refreshing = False
+
+
+def run_health_checks():
+    """
+    全ての確認処理を実行する関数（キャッシュは使わない）
+
+    Returns:
+        dict: 全体の結果（ok）、確認日時（checked_at）、確認処理ごとの結果と所要時間（checks）
+    """
+    load_dotenv()
+    checks = {
+        "openai": lambda: check_openai(os.getenv("OPENAI_API_KEY")),
+        "notion": lambda: check_notion(os.getenv("NOTION_INTEGRATION_TOKEN"), os.getenv("NOTION_DATABASE_ID")),
+        "index": check_index,
+    }
+    results = {}
+    for name, check in checks.items():
+        started = time.perf_counter()
+        results[name] = check()
+        results[name]["latency_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    return {
+        "ok": all(result["ok"] for result in results.values()),
+        "checked_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "checks": results,
+    }
+
+
+def get_health_status():
+    """
+    ヘルスチェックの結果を返す関数
+    結果はHEALTH_CHECK_TTL秒（問題があった場合はHEALTH_CHECK_FAILURE_TTL秒）キャッシュする
+    期限切れの場合は前回の結果を返しつつ別スレッドで確認し直すため、待たされるのは初回のみ
+
+    Returns:
+        dict: ヘルスチェックの結果
+    """
+    global _refreshing
+    with _status_lock:
+        if _status is None:
+            _refresh_status()
+        elif time.monotonic() >= _status_expires_at and not _refreshing:
+            _refreshing = True
+            threading.Thread(target=_refresh_in_background, daemon=True).start()
+        return _status
+
+
+def _refresh_status():
+    """確認処理を実行して結果をキャッシュする"""
+    global _status, _status_expires_at
+    status = run_health_checks()
+    ttl = ct.HEALTH_CHECK_TTL if status["ok"] else ct.HEALTH_CHECK_FAILURE_TTL
+    _status, _status_expires_at = status, time.monotonic() + ttl
+
+
+def _refresh_in_background():
+    """別スレッドで確認し直す（完了後に結果を差し替える）"""
+    global _refreshing
+    try:
+        _refresh_status()
+    finally:
+        _refreshing = False
+
+
+############################################################
+# 4. Readinessチェックのコマンド
+############################################################
+
+def main():
+    """ヘルスチェックを実行し、結果を表示して終了コードで返す関数"""
+    status = run_health_checks()
+    print(json.dumps(status, ensure_ascii=False, indent=2))
+    sys.exit(0 if status["ok"] else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""
+このファイルは、外部サービス（OpenAI・Notion）との通信に使うHTTPクライアントを定義するファイルです。
+クライアントは接続先ごとにプロセスで1つだけ作成して全セッションで共有するため、
+接続（TCP・TLSのハンドシェイク）が使い回され、同時利用者が増えても接続数は上限内に保たれます。
+接続先のURLは環境変数で変更でき、テスト用のローカルサーバーにも向けられます。
+"""
+
+############################################################
+# 1. ライブラリの読み込み
+############################################################
+# 環境変数を操作するモジュール
+import os
+# 排他制御を行うためのモジュール
+import threading
+# プロセス終了時の処理を登録するためのモジュール
+import atexit
+# HTTPリクエストを行うためのモジュール
+import httpx
+# 固定値・変数を定義しているファイル
+import constants as ct
+
+
+############################################################
+# 2. 接続先・接続設定
+############################################################
+
+def get_openai_base_url():
+    """
+    OpenAI APIのベースURLを返す関数（環境変数「OPENAI_BASE_URL」で上書きできる）
+
+    Returns:
+        str: ベースURL（Noneの場合はOpenAIの既定値）
+    """
+    return os.getenv("OPENAI_BASE_URL", ct.OPENAI_API_BASE_URL)
+
+
+def get_notion_base_url():
+    """
+    Notion APIのベースURLを返す関数（環境変数「NOTION_API_BASE_URL」で上書きできる）
+
+    Returns:
+        str: ベースURL
+    """
+    return os.getenv("NOTION_API_BASE_URL", ct.NOTION_API_BASE_URL)
+
+
+def create_limits():
+    """
+    接続プールの設定を作成する関数
+
+    Returns:
+        httpx.Limits: 同時接続数・Keep-Aliveの接続数と保持時間
+    """
+    return httpx.Limits(
+        max_connections=ct.HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=ct.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=ct.HTTP_KEEPALIVE_EXPIRY
+    )
+
+
+def create_timeout(read_timeout):
+    """
+    タイムアウトの設定を作成する関数
+
+    Args:
+        read_timeout: 応答を待つ時間（秒）
+
+    Returns:
+        httpx.Timeout: タイムアウト
+    """
+    return httpx.Timeout(read_timeout, connect=ct.HTTP_CONNECT_TIMEOUT)
+
+
+############################################################
+# 3. 共有クライアント
+############################################################
+
+_clients = {}
+_lock = threading.Lock()
+
+
+def get_openai_http_client():
+    """
+    OpenAI APIとの通信に使う共有HTTPクライアントを返す関数
+    （ChatOpenAI・OpenAIEmbeddingsに渡して使う。ステータスに応じたリトライはOpenAIのSDK側で行う）
+
+    Returns:
+        httpx.Client: HTTPクライアント
+    """
+    return _get_or_create("openai", lambda: httpx.Client(
+        timeout=create_timeout(ct.OPENAI_REQUEST_TIMEOUT),
+        transport=httpx.HTTPTransport(limits=create_limits(), retries=ct.HTTP_CONNECT_RETRIES)
+    ))
+
+
+def get_notion_http_client():
+    """
+    Notion APIとの通信に使う共有HTTPクライアントを返す関数
+
+    Returns:
+        httpx.Client: HTTPクライアント
+    """
+    return _get_or_create("notion", lambda: httpx.Client(
+        base_url=get_notion_base_url(),
+        headers={"Notion-Version": ct.NOTION_API_VERSION},
+        timeout=create_timeout(ct.NOTION_REQUEST_TIMEOUT),
+        transport=httpx.HTTPTransport(limits=create_limits(), retries=ct.HTTP_CONNECT_RETRIES)
+    ))
+
+
+def create_notion_async_client(base_url, headers, timeout=ct.NOTION_REQUEST_TIMEOUT):
+    """
+    Notion APIとの非同期通信に使うHTTPクライアントを作成する関数
+    （非同期クライアントはイベントループをまたいで使えないため共有せず、接続設定のみ共通にする）
+
+    Args:
+        base_url: Notion APIのベースURL
+        headers: 全てのリクエストに付けるヘッダー
+        timeout: 応答を待つ時間（秒）
+
+    Returns:
+        httpx.AsyncClient: 非同期HTTPクライアント
+    """
+    return httpx.AsyncClient(
+        base_url=base_url,
+        headers=headers,
+        timeout=create_timeout(timeout),
+        transport=httpx.AsyncHTTPTransport(limits=create_limits(), retries=ct.HTTP_CONNECT_RETRIES)
+    )
+
+
+def _get_or_create(name, factory):
+    """名前ごとに1つだけクライアントを作成して返す（プロセス終了時に閉じる）"""
+    with _lock:
+        client = _clients.get(name)
+        if client is None:
+            client = factory()
+            _clients[name] = client
+            atexit.register(client.close)
+        return client
@@ -0,0 +1,173 @@
+"""
+このファイルは、Webアプリの実行中にインデックスを更新し、検索に使うインデックスを差し替える仕組みを定義するファイルです。
+- ActiveIndex: 検索に使うインデックス（ベクターストア・Retriever）の組を保持し、1度の代入で丸ごと差し替える。
+  質問ごとに処理の開始時点の組を受け取るため、実行中の質問は差し替え前の組のまま最後まで処理される。
+- IndexRefresher: 別スレッドで一定時間ごとに以下を行う（利用者の操作がインデックスの構築を待つことはない）
+  1. 公開中の世代がINDEX_REFRESH_INTERVAL秒より古い場合、Notionと差分同期した新しい世代を構築・検証して公開する
+     （同じインデックスを共有する他のプロセスが構築中・構築済みの場合は構築しない）
+  2. 公開中の世代が検索に使っている世代と異なる場合、新しい世代を読み込んでから差し替える
+     （build_index.pyや他のプロセスが公開した世代にも切り替わる）
+"""
+
+############################################################
+# 1. ライブラリの読み込み
+############################################################
+# 排他制御・スレッドを扱うためのモジュール
+import threading
+# 処理時間を扱うためのモジュール
+import time
+# ログ出力を行うためのモジュール
+import logging
+# （自作）インデックスの世代管理を行うモジュール
+import index_store
+# 固定値・変数を定義しているファイル
+import constants as ct
+
+# ロガーの設定
+logger = logging.getLogger(ct.LOGGER_NAME)
+
+
+############################################################
+# 2. 検索に使うインデックスの保持
+############################################################
+
+class ActiveIndex:
+    """
+    検索に使うインデックスの組（index_dir, vectorstore, retrieverを含む辞書）を保持する仕組み
+    組は変更せずに丸ごと差し替えるため、読み手はロックを取らずに一貫した組を受け取れる
+    """
+
+    def __init__(self, snapshot):
+        """
+        Args:
+            snapshot: 最初に使うインデックスの組
+        """
+        self._snapshot = snapshot
+        self._lock = threading.Lock()
+        self.swapped_at = None
+
+    @property
+    def current(self):
+        """現在のインデックスの組（1回の質問の間は同じ組を使い続けること）"""
+        return self._snapshot
+
+    def swap(self, snapshot):
+        """
+        インデックスの組を差し替える
+
+        Args:
+            snapshot: 新しいインデックスの組
+
+        Returns:
+            dict: 差し替え前のインデックスの組
+        """
+        with self._lock:
+            previous, self._snapshot = self._snapshot, snapshot
+            self.swapped_at = time.time()
+        return previous
+
+
+############################################################
+# 3. インデックスの定期更新
+############################################################
+
+class IndexRefresher:
+    """
+    別スレッドでインデックスの構築と、検索に使うインデックスの差し替えを行う仕組み
+    """
+
+    def __init__(self, get_active_index, load_index, build_index=None,
+                 interval=ct.INDEX_REFRESH_INTERVAL, poll_interval=ct.INDEX_REFRESH_POLL_INTERVAL):
+        """
+        Args:
+            get_active_index: 差し替える対象のActiveIndexを返す関数
+            load_index: 世代のディレクトリを受け取り、インデックスの組を読み込む関数
+            build_index: 新しい世代を構築・検証して公開する関数（Noneの場合は構築せず、差し替えのみ行う）
+            interval: 公開中の世代がこの秒数より古くなった場合に構築する
+            poll_interval: 構築・差し替えの要否を確認する間隔（秒）
+        """
+        self.get_active_index = get_active_index
+        self.load_index = load_index
+        self.build_index = build_index
+        self.interval = interval
+        self.poll_interval = poll_interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """別スレッドで定期更新を開始する"""
+        self._thread = threading.Thread(target=self._run, name="index-refresher", daemon=True)
+        self._thread.start()
+        logger.info(
+            f"インデックスの定期更新を開始しました（構築: {'あり' if self.build_index else 'なし'} / "
+            f"間隔: {self.interval}秒 / 確認間隔: {self.poll_interval}秒）"
+        )
+
+    def stop(self):
+        """定期更新を止める（実行中の構築は最後まで行われる）"""
+        self._stop.set()
+
+    def _run(self):
+        """確認間隔ごとに構築・差し替えを行う（失敗しても次の確認で再度試みる）"""
+        while not self._stop.wait(self.poll_interval):
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error(f"インデックスの定期更新に失敗しました: {e}")
+
+    def run_once(self):
+        """
+        構築・差し替えを1度行う
+
+        Returns:
+            bool: 検索に使うインデックスを差し替えた場合はTrue
+        """
+        if self.build_index is not None and self._build_due():
+            self._build()
+        return self._swap_if_published()
+
+    def _build_due(self):
+        """公開中の世代の更新・変更の確認が構築の間隔より古いかを返す（未構築の場合も構築する）"""
+        refreshed_at = index_store.get_refreshed_at()
+        return refreshed_at is None or time.time() - refreshed_at >= self.interval
+
+    def _build(self):
+        """新しい世代を構築・検証して公開する（失敗した場合は公開中の世代を使い続ける）"""
+        started = time.perf_counter()
+        try:
+            result = self.build_index()
+        except index_store.BuildInProgressError:
+            logger.info("別のプロセスがインデックスを構築中のため、構築を見送りました")
+            return
+        except Exception as e:
+            logger.error(f"インデックスの構築に失敗したため、公開中の世代を使い続けます: {e}")
+            return
+        if not result["published"]:
+            logger.info(f"Notionに変更がないため、公開中の世代（{result['generation']}）を使い続けます")
+            return
+        stats = result["stats"]
+        logger.info(
+            f"インデックスを構築しました: {result['generation']}（{result['chunk_count']}チャンク / "
+            f"追加{stats['added']}件・更新{stats['updated']}件・削除{stats['deleted']}件 / "
+            f"{time.perf_counter() - started:.1f}秒）"
+        )
+
+    def _swap_if_published(self):
+        """公開中の世代が検索に使っている世代と異なる場合、読み込んでから差し替える"""
+        index_dir = index_store.get_current_index_dir()
+        active_index = self.get_active_index()
+        if index_dir is None or index_dir == active_index.current["index_dir"]:
+            return False
+
+        started = time.perf_counter()
+        try:
+            snapshot = self.load_index(index_dir)
+        except Exception as e:
+            logger.error(f"新しい世代（{index_dir}）を読み込めないため、現在の世代を使い続けます: {e}")
+            return False
+        previous = active_index.swap(snapshot)
+        logger.info(
+            f"検索に使うインデックスを切り替えました: {previous['index_dir']} → {index_dir}"
+            f"（読み込み{(time.perf_counter() - started) * 1000:.0f}ミリ秒）"
+        )
+        return True
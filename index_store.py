@@ -0,0 +1,437 @@
+"""
+このファイルは、ベクターストア（インデックス）の世代管理を行う関数を定義するファイルです。
+インデックスは世代ごとのディレクトリに構築し、完成後に公開中の世代を指すファイルを
+アトミックに書き換えることで切り替えます。Webアプリは公開中の世代を読み込むだけで、書き込みは行いません。
+"""
+
+############################################################
+# 1. ライブラリの読み込み
+############################################################
+# 環境変数・ファイルパスを操作するモジュール
+import os
+# ディレクトリのコピー・削除を行うためのモジュール
+import shutil
+# 日付・時刻を扱うためのモジュール
+import datetime
+# 処理時間を計測するためのモジュール
+import time
+# ファイルロックを行うためのモジュール
+import fcntl
+# コンテキストマネージャを定義するためのモジュール
+from contextlib import contextmanager
+# ログ出力を行うためのモジュール
+import logging
+# LangChainのOpenAIEmbeddingsを使用するためのモジュール
+from langchain_openai import OpenAIEmbeddings
+# （自作）ベクターストア（Chroma・ローカルのベクターストア）を定義したモジュール
+import vector_stores
+# （自作）外部サービスとの通信に使う共有HTTPクライアント
+import http_clients
+# （自作）Embeddingキャッシュ・ローカルEmbeddingモデルを定義したモジュール
+from embedding_cache import CachedEmbeddings, LocalHashEmbeddings, RateLimitedEmbeddings
+# （自作）Notionとベクターストアの差分同期を行うモジュール
+import notion_sync
+# （自作）BM25の転置インデックスを定義したモジュール
+from lexical_index import LexicalIndex, get_lexical_index_path
+# 固定値・変数を定義しているファイル
+import constants as ct
+
+# ロガーの設定
+logger = logging.getLogger(ct.LOGGER_NAME)
+
+
+############################################################
+# 2. Embeddingモデル・ベクターストアの生成
+############################################################
+
+def create_embeddings(openai_api_key):
+    """
+    インデックス構築と検索で共通して使うEmbeddingモデルを生成する関数
+    - 環境変数「EMBEDDING_BACKEND」（既定値はEMBEDDING_BACKEND）でモデルの種類を選択
+    - OpenAIのモデルは、プロセスで共有する流量制御の範囲内で呼び出す
+    - EMBEDDING_CACHE_ENABLEDの場合、ディスク上のEmbeddingキャッシュを経由させる
+
+    Args:
+        openai_api_key: OpenAI APIキー
+
+    Returns:
+        Embeddings: Embeddingモデル
+    """
+    backend = os.getenv("EMBEDDING_BACKEND", ct.EMBEDDING_BACKEND)
+    if backend == "local":
+        embeddings = LocalHashEmbeddings()
+        model_name = f"local-hash-{ct.LOCAL_EMBEDDING_DIMENSIONS}"
+    else:
+        # リトライはキャッシュ側のバックオフに任せ、接続はプロセスで共有するHTTPクライアントで使い回す
+        embeddings = RateLimitedEmbeddings(OpenAIEmbeddings(
+            api_key=openai_api_key,
+            model=ct.EMBEDDING_MODEL_NAME,
+            base_url=http_clients.get_openai_base_url(),
+            http_client=http_clients.get_openai_http_client(),
+            timeout=ct.OPENAI_REQUEST_TIMEOUT,
+            max_retries=0
+        ))
+        model_name = ct.EMBEDDING_MODEL_NAME
+
+    if not ct.EMBEDDING_CACHE_ENABLED:
+        return embeddings
+    return CachedEmbeddings(
+        embeddings,
+        model_name,
+        os.path.join(ct.DATA_DIR, ct.EMBEDDING_CACHE_FILE)
+    )
+
+
+def open_vectorstore(persist_directory, embeddings):
+    """
+    指定したディレクトリのベクターストアを開く関数（種類はVECTOR_STORE_BACKENDで選択）
+
+    Args:
+        persist_directory: ベクターストアの保存先ディレクトリ
+        embeddings: Embeddingモデル
+
+    Returns:
+        VectorStore: ベクターストア
+    """
+    # Chromaは終了時にも保存を行うため、作業ディレクトリが変わっても同じ場所に保存されるよう絶対パスで渡す
+    return vector_stores.open_store(os.path.abspath(persist_directory), embeddings)
+
+
+############################################################
+# 3. 世代の管理
+############################################################
+
+def get_generations_dir():
+    """世代ディレクトリの格納先を返す関数"""
+    return os.path.join(ct.CHROMA_DIR, ct.INDEX_GENERATIONS_DIR)
+
+
+def get_current_generation():
+    """
+    公開中の世代名を返す関数
+
+    Returns:
+        str: 公開中の世代名（未構築の場合はNone）
+    """
+    current_path = os.path.join(ct.CHROMA_DIR, ct.INDEX_CURRENT_FILE)
+    if not os.path.exists(current_path):
+        return None
+    with open(current_path, encoding="utf-8") as f:
+        generation = f.read().strip()
+    return generation or None
+
+
+def get_published_at():
+    """
+    公開中の世代に切り替えた日時を返す関数
+
+    Returns:
+        float: 切り替えた日時（UNIX時間。未構築の場合はNone）
+    """
+    current_path = os.path.join(ct.CHROMA_DIR, ct.INDEX_CURRENT_FILE)
+    try:
+        return os.path.getmtime(current_path)
+    except FileNotFoundError:
+        return None
+
+
+def record_checked():
+    """
+    公開中の世代がNotionの内容と一致することを確認した日時を記録する関数
+    変更がなく新しい世代を公開しなかった場合に呼び、次の定期構築をこの日時から数える
+    """
+    checked_path = os.path.join(ct.CHROMA_DIR, ct.INDEX_CHECKED_FILE)
+    tmp_path = f"{checked_path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(datetime.datetime.now(datetime.timezone.utc).isoformat())
+    os.replace(tmp_path, checked_path)
+
+
+def get_refreshed_at():
+    """
+    公開中の世代を最後に更新・確認した日時を返す関数
+
+    Returns:
+        float: 世代の切り替えと変更の確認のうち新しい方の日時（UNIX時間。未構築の場合はNone）
+    """
+    published_at = get_published_at()
+    if published_at is None:
+        return None
+    try:
+        return max(published_at, os.path.getmtime(os.path.join(ct.CHROMA_DIR, ct.INDEX_CHECKED_FILE)))
+    except FileNotFoundError:
+        return published_at
+
+
+def get_current_index_dir():
+    """
+    公開中の世代のディレクトリを返す関数
+
+    Returns:
+        str: 公開中の世代のディレクトリ（未構築の場合はNone）
+    """
+    generation = get_current_generation()
+    if generation is None:
+        return None
+    return os.path.join(get_generations_dir(), generation)
+
+
+def publish_generation(generation):
+    """
+    指定した世代を公開中の世代に切り替える関数
+    一時ファイルに書き込んでから置き換えるため、読み込み側が中途半端な状態を見ることはない
+
+    Args:
+        generation: 公開する世代名
+    """
+    current_path = os.path.join(ct.CHROMA_DIR, ct.INDEX_CURRENT_FILE)
+    tmp_path = f"{current_path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(generation)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, current_path)
+    logger.info(f"インデックスの世代を切り替えました: {generation}")
+
+
+def prune_generations():
+    """公開中の世代を残し、保持数を超えた古い世代を削除する関数"""
+    current = get_current_generation()
+    generations = sorted(os.listdir(get_generations_dir()), reverse=True)
+    for generation in generations[ct.INDEX_KEEP_GENERATIONS:]:
+        if generation == current:
+            continue
+        shutil.rmtree(os.path.join(get_generations_dir(), generation), ignore_errors=True)
+        logger.info(f"古いインデックスの世代を削除しました: {generation}")
+
+
+def find_resumable_generation(mode):
+    """
+    中断した構築のうち、再開できる世代を探す関数
+    （公開中の世代より新しく、同じモードで構築中の目印が残っているもの）
+
+    Args:
+        mode: 構築のモード（"full" または "incremental"）
+
+    Returns:
+        str: 再開できる世代名（存在しない場合はNone）
+    """
+    generations_dir = get_generations_dir()
+    if not os.path.isdir(generations_dir):
+        return None
+    current = get_current_generation() or ""
+    for generation in sorted(os.listdir(generations_dir), reverse=True):
+        if generation <= current:
+            break
+        marker_path = os.path.join(generations_dir, generation, ct.INDEX_BUILDING_MARKER)
+        if not os.path.exists(marker_path):
+            continue
+        with open(marker_path, encoding="utf-8") as f:
+            if f.read().strip() == mode:
+                return generation
+    return None
+
+
+class BuildInProgressError(RuntimeError):
+    """別のプロセスがインデックスを構築中であることを表す例外"""
+
+
+@contextmanager
+def build_lock():
+    """
+    インデックス構築の多重実行を防ぐロックを取得するコンテキストマネージャ
+
+    Raises:
+        BuildInProgressError: 別のプロセスがインデックスを構築中の場合
+    """
+    os.makedirs(ct.CHROMA_DIR, exist_ok=True)
+    with open(os.path.join(ct.CHROMA_DIR, ct.INDEX_LOCK_FILE), "w") as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            raise BuildInProgressError("別のプロセスがインデックスを構築中です")
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+############################################################
+# 4. インデックスの構築・更新
+############################################################
+
+def refresh_index(embeddings, notion_loader, text_splitter, full_rebuild=False, on_progress=None):
+    """
+    新しい世代のインデックスを構築し、検証後に公開中の世代を切り替える関数
+    - 差分更新: 公開中の世代をコピーし、Notionと差分同期する
+    - 全件再構築: 空の世代にNotionの全ページを登録する
+    - 前回の構築が同期の途中で中断していた場合は、その世代をコミット済みの位置から再開する
+    - 差分更新でNotionに変更がない場合は、新しい世代を公開せずに確認した日時のみ記録する
+
+    Args:
+        embeddings: Embeddingモデル
+        notion_loader: Notionデータベースのローダー
+        text_splitter: チャンク分割に使うTextSplitter
+        full_rebuild: Trueの場合、公開中の世代を使わずに全件再構築する
+        on_progress: 変更のあったページを1件処理するごとに（処理済み件数, 件数）で呼ばれる関数
+
+    Returns:
+        dict: 構築結果（generation, published, stats, chunk_count, timings）
+    """
+    with build_lock():
+        timings = {}
+        current_dir = get_current_index_dir()
+        mode = "full" if full_rebuild or not current_dir else "incremental"
+        # 公開中の世代が別の種類のベクターストアで構築されている場合は、差分更新できないため全件再構築する
+        if mode == "incremental" and not vector_stores.store_exists(current_dir):
+            logger.info(f"公開中の世代に{vector_stores.get_backend()}のベクターストアがないため、全件再構築します")
+            mode = "full"
+        generation = find_resumable_generation(mode)
+        resumed = generation is not None
+
+        # 差分更新では、公開中の世代をコピーする前にページ一覧をマニフェストと比べ、
+        # 変更がなければ世代を作らずに終える（各プロセスがインデックスを読み込み直すこともない）
+        page_summaries = None
+        if mode == "incremental" and not resumed:
+            started = time.perf_counter()
+            page_summaries = notion_loader.retrieve_page_summaries()
+            manifest = notion_sync.load_manifest(notion_sync.get_manifest_path(current_dir))
+            timings["check"] = time.perf_counter() - started
+            if not notion_sync.has_changes(page_summaries, manifest):
+                record_checked()
+                logger.info("Notionに変更がないため、新しい世代の公開を見送りました")
+                return {
+                    "generation": get_current_generation(),
+                    "published": False,
+                    "stats": {"added": 0, "updated": 0, "unchanged": 0, "deleted": 0},
+                    "chunk_count": sum(len(entry["chunk_ids"]) for entry in manifest["pages"].values()),
+                    "timings": timings,
+                }
+
+        if not resumed:
+            generation = datetime.datetime.now().strftime("gen-%Y%m%d-%H%M%S-%f")
+        generation_dir = os.path.join(get_generations_dir(), generation)
+        marker_path = os.path.join(generation_dir, ct.INDEX_BUILDING_MARKER)
+
+        # 新しい世代のディレクトリを用意（中断した構築がある場合は、その続きから再開する）
+        started = time.perf_counter()
+        if resumed:
+            logger.info(f"中断したインデックスの構築を再開します: {generation}")
+        elif mode == "incremental":
+            shutil.copytree(current_dir, generation_dir)
+        else:
+            os.makedirs(generation_dir)
+        if not resumed:
+            with open(marker_path, "w", encoding="utf-8") as f:
+                f.write(mode)
+        timings["prepare"] = time.perf_counter() - started
+
+        # Notionと同期（転置インデックスも同じ内容に更新する）
+        # 失敗した場合も世代は残し、次回はコミット済みのページ以降から再開する
+        started = time.perf_counter()
+        vectorstore = open_vectorstore(generation_dir, embeddings)
+        lexical_index = LexicalIndex.open(get_lexical_index_path(generation_dir))
+        if mode == "incremental" and not resumed and len(lexical_index) == 0:
+            backfill_lexical_index(vectorstore, lexical_index)
+        stats = notion_sync.sync_vectorstore(
+            vectorstore,
+            notion_loader,
+            text_splitter,
+            notion_sync.get_manifest_path(generation_dir),
+            full_rebuild=mode == "full" and not resumed,
+            on_progress=on_progress,
+            lexical_index=lexical_index,
+            page_summaries=page_summaries
+        )
+        timings["sync"] = time.perf_counter() - started
+
+        # 変更のあったページの本文を取得できなかった場合など、結果として何も変わらなかった場合も公開しない
+        if mode == "incremental" and not resumed and not any(stats.values()):
+            lexical_index.close()
+            shutil.rmtree(generation_dir, ignore_errors=True)
+            record_checked()
+            logger.info("Notionに変更がないため、新しい世代の公開を見送りました")
+            return {
+                "generation": get_current_generation(),
+                "published": False,
+                "stats": stats,
+                "chunk_count": vectorstore.count(),
+                "timings": timings,
+            }
+
+        # 同期中に書き足したベクトルを1つにまとめ、検索用の索引を作り直す（公開前の1度のみ）
+        started = time.perf_counter()
+        vectorstore.compact()
+        timings["compact"] = time.perf_counter() - started
+
+        # 公開前の検証（空のインデックス・マニフェストとの不整合を公開しない）
+        try:
+            started = time.perf_counter()
+            chunk_count = validate_index(vectorstore, lexical_index, generation_dir)
+            timings["validate"] = time.perf_counter() - started
+        except Exception:
+            lexical_index.close()
+            shutil.rmtree(generation_dir, ignore_errors=True)
+            raise
+        lexical_index.close()
+        os.remove(marker_path)
+
+        # 公開中の世代を切り替え
+        started = time.perf_counter()
+        publish_generation(generation)
+        prune_generations()
+        timings["publish"] = time.perf_counter() - started
+
+    return {
+        "generation": generation,
+        "published": True,
+        "stats": stats,
+        "chunk_count": chunk_count,
+        "timings": timings,
+    }
+
+
+def validate_index(vectorstore, lexical_index, persist_directory):
+    """
+    構築したインデックスが公開可能かを検証する関数
+
+    Args:
+        vectorstore: 検証するベクターストア
+        lexical_index: 検証する転置インデックス
+        persist_directory: ベクターストアの保存先ディレクトリ
+
+    Returns:
+        int: インデックス内のチャンク数
+
+    Raises:
+        ValueError: インデックスが空、またはマニフェスト・転置インデックスとチャンク数が一致しない場合
+    """
+    chunk_count = vectorstore.count()
+    if chunk_count == 0:
+        raise ValueError("構築したインデックスが空のため、切り替えを中止しました")
+
+    manifest = notion_sync.load_manifest(notion_sync.get_manifest_path(persist_directory))
+    manifest_count = sum(len(page["chunk_ids"]) for page in manifest["pages"].values())
+    if manifest_count != chunk_count:
+        raise ValueError(
+            f"インデックスのチャンク数({chunk_count})がマニフェスト({manifest_count})と一致しないため、切り替えを中止しました"
+        )
+    if len(lexical_index) != chunk_count:
+        raise ValueError(
+            f"インデックスのチャンク数({chunk_count})が転置インデックス({len(lexical_index)})と一致しないため、切り替えを中止しました"
+        )
+    return chunk_count
+
+
+def backfill_lexical_index(vectorstore, lexical_index):
+    """
+    転置インデックスのない既存の世代から、ベクターストアの内容で転置インデックスを作成する関数
+
+    Args:
+        vectorstore: 作成元のベクターストア
+        lexical_index: 作成先の転置インデックス
+    """
+    results = vectorstore.get(include=["documents", "metadatas"])
+    for chunk_id, text, metadata in zip(results["ids"], results["documents"], results["metadatas"]):
+        lexical_index.add(chunk_id, text, metadata or {})
+    logger.info(f"ベクターストアから転置インデックスを作成しました: {len(lexical_index)}件")
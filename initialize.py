@@ -13,8 +13,6 @@ import os
 import datetime
 # ログ出力を行うためのモジュール
 import logging
-# ログのフォーマットを設定するためのモジュール
-from logging.handlers import RotatingFileHandler
 # streamlitアプリの表示を担当するモジュール
 import streamlit as st
 # OpenAIのAPIを呼び出すためのモジュール
@@ -23,14 +21,32 @@ import openai
 from langchain_openai import ChatOpenAI
 # LangChainのPromptTemplateを使用するためのモジュール
 from langchain.prompts import PromptTemplate
-# LangChainのNotionDBLoaderを使用するためのモジュール
-from langchain_community.document_loaders import NotionDBLoader
-# LangChainのTextSplitterを使用するためのモジュール
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-# LangChainのOpenAIEmbeddingsを使用するためのモジュール
-from langchain_openai import OpenAIEmbeddings
-# LangChainのChromaを使用するためのモジュール
-from langchain_community.vectorstores import Chroma
+# （自作）ログ出力の設定を行うモジュール
+import app_logging
+# （自作）外部サービスとの通信に使う共有HTTPクライアント
+import http_clients
+# （自作）インデックスの世代管理を行うモジュール
+import index_store
+# （自作）Notionとベクターストアの差分同期を行うモジュール（定期更新での構築に使用）
+import notion_sync
+# （自作）検索に使うインデックスの保持・定期更新を行う仕組み
+from index_refresher import ActiveIndex, IndexRefresher
+# （自作）会話ログを一定の件数に抑えて保持するモジュール
+import conversation_history
+# （自作）外部APIを使わない疑似チャットモデル（ベンチマーク用）
+from fake_chat_model import FakeChatModel
+# （自作）回答キャッシュを定義したモジュール
+from answer_cache import AnswerCache
+# （自作）実行中の同じ呼び出しを共有する仕組み
+from concurrency import SingleFlight
+# （自作）会話の流れを踏まえて検索に使う質問文を作る仕組み
+from query_condenser import QueryCondenser
+# （自作）BM25の転置インデックスを定義したモジュール
+from lexical_index import LexicalIndex, get_lexical_index_path
+# （自作）ハイブリッド検索・ベクトル検索のRetriever
+from retrievers import HybridRetriever, VectorRetriever
+# （自作）検索結果をリランキングするRetriever
+from rerankers import RerankingRetriever, FeatureReranker
 # 固定値・変数を定義しているファイル
 import constants as ct
 
@@ -45,9 +61,7 @@ def initialize():
     - 各種ディレクトリの作成
     - ログ設定
     - セッション変数の初期化
-    - LLMの初期化
-    - Notion連携の初期化
-    - ベクターストアの初期化
+    - 共有リソース（LLM・ベクターストア・Retriever）の取得
     """
     # ==========================================
     # 2-1. 環境変数の読み込み
@@ -74,122 +88,247 @@ def initialize():
     os.makedirs(ct.LOG_DIR, exist_ok=True)
     os.makedirs(ct.DATA_DIR, exist_ok=True)
     os.makedirs(ct.CHROMA_DIR, exist_ok=True)
+    os.makedirs(ct.HISTORY_DIR, exist_ok=True)
 
     # ==========================================
     # 2-3. ログ設定
     # ==========================================
-    # ロガーの取得
-    logger = logging.getLogger(ct.LOGGER_NAME)
-    # ログレベルの設定
-    logger.setLevel(logging.INFO)
-    # ログハンドラーの設定（ファイル出力）
-    log_handler = RotatingFileHandler(
-        filename=os.path.join(ct.LOG_DIR, "application.log"),
-        maxBytes=ct.LOG_MAX_BYTES,
-        backupCount=ct.LOG_BACKUP_COUNT,
-        encoding="utf-8"
-    )
-    # ログのフォーマット設定
-    log_format = logging.Formatter(
-        "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
-    )
-    # ハンドラーにフォーマットを設定
-    log_handler.setFormatter(log_format)
-    # ロガーにハンドラーを追加
-    logger.addHandler(log_handler)
+    # ログの出力先はプロセスにつき1度だけ設定する（再実行のたびにハンドラーを追加しない）
+    # ファイルへの書き込みは別スレッドで行われ、リクエストの処理を待たせない
+    app_logging.configure_logging()
 
     # ==========================================
     # 2-4. セッション変数の初期化
     # ==========================================
-    # セッション変数の初期化（初回のみ）
-    if "messages" not in st.session_state:
-        st.session_state.messages = []
+    # 会話ログのセッション変数の初期化（初回のみ）
+    conversation_history.init_session()
+    # 保持期間を過ぎた会話ログの削除（プロセスにつき1度のみ）
+    conversation_history.purge_expired_sessions()
     
     # モード選択のセッション変数初期化（初回のみ）
     if "mode" not in st.session_state:
         st.session_state.mode = ct.ANSWER_MODE_1
 
     # ==========================================
-    # 2-5. LLMの初期化
+    # 2-5. 共有リソースの取得
     # ==========================================
-    # OpenAI ChatGPT APIクライアントの初期化
-    st.session_state.llm = ChatOpenAI(
-        api_key=openai_api_key,
-        model=ct.MODEL_NAME,
-        temperature=ct.TEMPERATURE,
-        max_tokens=ct.MAX_TOKENS
-    )
+    # LLM・ベクターストア・Retrieverはプロセス内で1度だけ構築され、全セッションで共有される
+    # （2回目以降の再実行ではキャッシュ済みのリソースが即座に返る）
+    get_shared_resources()
+    # インデックスの定期更新を開始（プロセスにつき1度のみ。利用者の操作は構築を待たない）
+    start_index_refresher()
+
+
+############################################################
+# 3. 共有リソースの構築
+############################################################
+@st.cache_resource(show_spinner=False)
+def get_shared_resources():
+    """
+    プロセス内で共有するリソースを構築する関数
+    Streamlitの再実行やセッションをまたいで、プロセスごとに1度だけ実行される
+    - LLMの初期化
+    - ベクターストアの初期化（構築済みのインデックスを読み込み）
+    インデックスに依存するリソースは、定期更新で丸ごと差し替えられるActiveIndexに保持する
+    （質問ごとにget_active_index()で取得し、1回の質問の間は同じ組を使う）
+
+    Returns:
+        dict: LLM（llm）、Embeddingモデル（embeddings）、検索に使うインデックス（index: ActiveIndex）を含む辞書
+    """
+    # ロガーの取得
+    logger = logging.getLogger(ct.LOGGER_NAME)
+
+    # 「.env」ファイルから環境変数を読み込む
+    load_dotenv()
+    openai_api_key = os.getenv("OPENAI_API_KEY")
 
     # ==========================================
-    # 2-6. Notion連携の初期化
+    # 3-1. LLMの初期化
     # ==========================================
-    # NotionDBLoader インスタンスの初期化
-    notion_loader = NotionDBLoader(
-        integration_token=notion_integration_token,
-        database_id=notion_database_id
-    )
-
-    # Notionからドキュメントを読み込み
-    try:
-        notion_docs = notion_loader.load()
-        logger.info(f"Notionから{len(notion_docs)}件のドキュメントを読み込みました")
-    except Exception as e:
-        logger.error(f"Notionドキュメントの読み込みに失敗しました: {e}")
-        raise ValueError(f"Notionドキュメントの読み込みに失敗しました: {e}")
-    
-    # テキスト分割の設定
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=ct.CHUNK_SIZE,
-        chunk_overlap=ct.CHUNK_OVERLAP
-    )
-    
-    # ドキュメントをチャンクに分割
-    chunks = text_splitter.split_documents(notion_docs)
-    logger.info(f"ドキュメントを{len(chunks)}個のチャンクに分割しました")
+    # チャットモデルの初期化（通常はOpenAI ChatGPT APIクライアント）
+    llm = create_llm(openai_api_key)
 
     # ==========================================
-    # 2-7. ベクターストアの初期化
+    # 3-2. ベクターストアの初期化
     # ==========================================
-    # Embeddingモデルのインスタンス化
-    embeddings = OpenAIEmbeddings(api_key=openai_api_key)
+    # Embeddingモデルのインスタンス化（インデックス構築時と同じ設定）
+    embeddings = index_store.create_embeddings(openai_api_key)
+
+    # 構築済み（公開中）のインデックスを読み込む
+    # インデックスの構築・更新は「build_index.py」またはインデックスの定期更新（別スレッド）で行う
+    index_dir = index_store.get_current_index_dir()
+    if index_dir is None:
+        raise ValueError("インデックスが構築されていません。`python build_index.py` を実行してください。")
+    active_index = ActiveIndex(load_index(index_dir, embeddings))
+    
+    logger.info("共有リソースの構築が完了しました")
+
+    return {
+        "llm": llm,
+        "embeddings": embeddings,
+        "index": active_index,
+    }
+
+
+def get_active_index():
+    """
+    検索に使うインデックスの組を返す関数
+    定期更新で差し替えられても、受け取った組は実行中の質問の間そのまま使える
+
+    Returns:
+        dict: ベクターストア（vectorstore）、Retriever（retriever）、インデックスのディレクトリ（index_dir）を含む辞書
+    """
+    return get_shared_resources()["index"].current
+
+
+def load_index(index_dir, embeddings):
+    """
+    世代のディレクトリからベクターストアを開き、Retrieverを作成する関数
+
+    Args:
+        index_dir: インデックスの世代のディレクトリ
+        embeddings: Embeddingモデル
+
+    Returns:
+        dict: ベクターストア（vectorstore）、Retriever（retriever）、インデックスのディレクトリ（index_dir）を含む辞書
+    """
+    # ロガーの取得
+    logger = logging.getLogger(ct.LOGGER_NAME)
+
+    vectorstore = index_store.open_vectorstore(index_dir, embeddings)
+    logger.info(f"インデックス（{index_dir}）から{vectorstore.count()}件のドキュメントを読み込みました")
     
-    # Chromaベクターストアの初期化（または既存のものを読み込み）
-    try:
-        # 既存のベクターストアがあれば読み込み
-        vectorstore = Chroma(
-            persist_directory=ct.CHROMA_DIR,
-            embedding_function=embeddings
+    # Retrieverを作成（リランキングする場合は、候補として多めに取得する）
+    retrieval_k = ct.RERANK_CANDIDATES if ct.RERANK_ENABLED else ct.RETRIEVER_K
+    if ct.RETRIEVAL_MODE == "hybrid":
+        # ベクトル検索とBM25の転置インデックス検索を統合するRetriever
+        lexical_index = LexicalIndex.open(get_lexical_index_path(index_dir))
+        logger.info(f"転置インデックスから{len(lexical_index)}件のチャンクを読み込みました")
+        retriever = HybridRetriever(vectorstore=vectorstore, lexical_index=lexical_index, k=retrieval_k)
+    else:
+        # ベクトル検索のみのRetriever
+        retriever = VectorRetriever(vectorstore=vectorstore, k=retrieval_k)
+    if ct.RERANK_ENABLED:
+        # 候補をリランキングして上位RETRIEVER_K件に絞るRetriever
+        retriever = RerankingRetriever(
+            base_retriever=retriever,
+            reranker=FeatureReranker(),
+            k=ct.RETRIEVER_K,
+            time_budget_ms=ct.RERANK_TIME_BUDGET_MS
         )
-        
-        # ベクターストア内のドキュメント数を確認
-        collection_count = vectorstore._collection.count()
-        logger.info(f"既存のベクターストアから{collection_count}件のドキュメントを読み込みました")
-        
-        # 更新が必要な場合は再構築
-        if collection_count == 0 or os.getenv("REBUILD_VECTORSTORE", "false").lower() == "true":
-            # ベクターストアを再構築
-            vectorstore = Chroma.from_documents(
-                documents=chunks,
-                embedding=embeddings,
-                persist_directory=ct.CHROMA_DIR
-            )
-            vectorstore.persist()
-            logger.info("ベクターストアを再構築しました")
-    except Exception as e:
-        # 初回またはエラー時は新規作成
-        logger.info(f"ベクターストアを新規作成します: {e}")
-        vectorstore = Chroma.from_documents(
-            documents=chunks,
-            embedding=embeddings,
-            persist_directory=ct.CHROMA_DIR
+
+    return {
+        "vectorstore": vectorstore,
+        "retriever": retriever,
+        "index_dir": index_dir,
+    }
+
+
+@st.cache_resource(show_spinner=False)
+def start_index_refresher():
+    """
+    インデックスの定期更新を別スレッドで開始する関数（プロセスにつき1度だけ実行される）
+    INDEX_REFRESH_BUILD_ENABLEDがFalseの場合は構築せず、他のプロセスが公開した世代への切り替えのみ行う
+
+    Returns:
+        IndexRefresher: インデックスの定期更新（無効の場合はNone）
+    """
+    if not ct.INDEX_REFRESH_ENABLED:
+        return None
+
+    openai_api_key = os.getenv("OPENAI_API_KEY")
+    notion_integration_token = os.getenv("NOTION_INTEGRATION_TOKEN")
+    notion_database_id = os.getenv("NOTION_DATABASE_ID")
+
+    def build():
+        return index_store.refresh_index(
+            index_store.create_embeddings(openai_api_key),
+            notion_sync.create_notion_loader(notion_integration_token, notion_database_id),
+            notion_sync.create_text_splitter()
         )
-        vectorstore.persist()
-        logger.info("ベクターストアを新規作成しました")
-    
-    # ベクターストアからRetrieverを作成
-    st.session_state.retriever = vectorstore.as_retriever(
-        search_type="similarity",
-        search_kwargs={"k": ct.RETRIEVER_K}
+
+    # 差し替える対象は、その時点の共有リソースのActiveIndex（共有リソースが作り直された場合も追従する）
+    refresher = IndexRefresher(
+        get_active_index=lambda: get_shared_resources()["index"],
+        load_index=lambda index_dir: load_index(index_dir, get_shared_resources()["embeddings"]),
+        build_index=build if ct.INDEX_REFRESH_BUILD_ENABLED else None
     )
-    
-    logger.info("初期化処理が完了しました")
\ No newline at end of file
+    refresher.start()
+    return refresher
+
+
+def create_llm(openai_api_key):
+    """
+    チャットモデルを生成する関数
+    環境変数「LLM_BACKEND」（既定値はLLM_BACKEND）が"fake"の場合は、外部APIを使わない疑似モデルを使う
+
+    Args:
+        openai_api_key: OpenAI APIキー
+
+    Returns:
+        BaseChatModel: チャットモデル
+    """
+    if os.getenv("LLM_BACKEND", ct.LLM_BACKEND) == "fake":
+        return FakeChatModel(
+            first_token_latency=ct.FAKE_LLM_FIRST_TOKEN_LATENCY,
+            token_latency=ct.FAKE_LLM_TOKEN_LATENCY,
+            answer_tokens=ct.FAKE_LLM_ANSWER_TOKENS
+        )
+    # 接続はプロセスで共有するHTTPクライアントで使い回す
+    return ChatOpenAI(
+        api_key=openai_api_key,
+        model=ct.MODEL_NAME,
+        temperature=ct.TEMPERATURE,
+        max_tokens=ct.MAX_TOKENS,
+        base_url=http_clients.get_openai_base_url(),
+        http_client=http_clients.get_openai_http_client(),
+        timeout=ct.OPENAI_REQUEST_TIMEOUT,
+        max_retries=ct.OPENAI_MAX_RETRIES
+    )
+
+
+@st.cache_resource(show_spinner=False)
+def get_answer_cache():
+    """
+    プロセス内で共有する回答キャッシュを生成する関数
+    （インデックスの切り替え後も、参照先が変わっていない回答は引き続き利用する）
+
+    Returns:
+        AnswerCache: 回答キャッシュ
+    """
+    return AnswerCache()
+
+
+@st.cache_resource(show_spinner=False)
+def get_single_flight():
+    """
+    プロセス内で共有する、実行中の呼び出しの共有（同じモード・同じ質問の回答生成を1回にまとめる）を生成する関数
+
+    Returns:
+        SingleFlight: 実行中の呼び出しの共有
+    """
+    return SingleFlight()
+
+
+@st.cache_resource(show_spinner=False)
+def get_query_condenser():
+    """
+    プロセス内で共有する、検索に使う質問文の書き換え（書き換え結果の保持を含む）を生成する関数
+    CONDENSE_METHODが"llm"の場合は、書き換え用の安価なチャットモデルを使う
+    （疑似モデルを使う場合は、ルールによる書き換えを行う）
+
+    Returns:
+        QueryCondenser: 質問文の書き換え
+    """
+    if ct.CONDENSE_METHOD != "llm" or os.getenv("LLM_BACKEND", ct.LLM_BACKEND) == "fake":
+        return QueryCondenser()
+    llm = ChatOpenAI(
+        api_key=os.getenv("OPENAI_API_KEY"),
+        model=ct.CONDENSE_MODEL_NAME,
+        temperature=0,
+        base_url=http_clients.get_openai_base_url(),
+        http_client=http_clients.get_openai_http_client(),
+        timeout=ct.OPENAI_REQUEST_TIMEOUT,
+        max_retries=ct.OPENAI_MAX_RETRIES
+    )
+    return QueryCondenser(llm=llm)
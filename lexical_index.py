@@ -0,0 +1,243 @@
+"""
+このファイルは、ベクターストアと同じチャンクに対するBM25の転置インデックスを定義するファイルです。
+日本語は文字bigram、英数字（製品コード・略語など）は単語単位でトークン化するため、
+形態素解析の辞書なしで、Embeddingでは拾いにくい固有名詞・コードの一致を検索できます。
+"""
+
+############################################################
+# 1. ライブラリの読み込み
+############################################################
+# 環境変数・ファイルパスを操作するモジュール
+import os
+# 文字列の正規化を行うためのモジュール
+import unicodedata
+# 正規表現を扱うためのモジュール
+import re
+# 数値計算を行うためのモジュール
+import math
+# JSONデータを扱うためのモジュール
+import json
+# SQLiteを扱うためのモジュール
+import sqlite3
+# 排他制御を行うためのモジュール
+import threading
+# 出現回数を数えるためのモジュール
+from collections import Counter
+# 上位k件を効率よく取り出すためのモジュール
+import heapq
+# LangChainのDocumentクラス
+from langchain_core.documents import Document
+# 固定値・変数を定義しているファイル
+import constants as ct
+
+
+############################################################
+# 2. トークン化
+############################################################
+
+# 英数字の連続（製品コード・略語など）と、それ以外の文字（日本語など）の連続を取り出す
+# 空白・記号は区切りとして扱う
+TOKEN_PATTERN = re.compile(r"[a-z0-9][a-z0-9\-_.]*|[^\sa-z0-9\W]+")
+
+
+def tokenize(text):
+    """
+    検索用にテキストをトークンに分割する関数
+    - 英数字の連続: そのまま1トークン
+    - 日本語などの連続: 文字bigram（1文字のみの場合はその文字）
+
+    Args:
+        text: トークン化するテキスト
+
+    Returns:
+        list: トークンのリスト
+    """
+    text = unicodedata.normalize("NFKC", text).lower()
+    tokens = []
+    for match in TOKEN_PATTERN.finditer(text):
+        word = match.group()
+        if word.isascii():
+            tokens.append(word.strip("-_."))
+        elif len(word) == 1:
+            tokens.append(word)
+        else:
+            tokens.extend(word[i:i + 2] for i in range(len(word) - 1))
+    return [token for token in tokens if token]
+
+
+############################################################
+# 3. 転置インデックス
+############################################################
+
+class LexicalIndex:
+    """
+    チャンクIDをキーにしたBM25の転置インデックス
+    チャンク本文と語ごとの出現回数をSQLiteに保存し、検索時に質問の語の行のみを読み込む
+    追加・削除はsave()まで1つのトランザクションにまとめ、保存時は前回の保存以降の変更のみを書き込む
+    """
+
+    def __init__(self, path=None):
+        """
+        Args:
+            path: 保存先のファイルパス（Noneの場合はメモリ上にのみ作成する）
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path or ":memory:", check_same_thread=False)
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS documents (chunk_id TEXT PRIMARY KEY, text TEXT NOT NULL, "
+            "metadata TEXT NOT NULL, length INTEGER NOT NULL);"
+            # 検索時に文書の表を引かずに済むよう、チャンクの長さも語の行に持たせる
+            "CREATE TABLE IF NOT EXISTS postings (term TEXT NOT NULL, chunk_id TEXT NOT NULL, "
+            "tf INTEGER NOT NULL, length INTEGER NOT NULL, PRIMARY KEY (term, chunk_id)) WITHOUT ROWID;"
+            "CREATE INDEX IF NOT EXISTS postings_chunk ON postings (chunk_id);"
+        )
+        self._conn.commit()
+        self._doc_count, self._total_length = self._conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(length), 0) FROM documents"
+        ).fetchone()
+
+    @classmethod
+    def open(cls, path):
+        """
+        保存済みのインデックスを開く（存在しない場合は空のインデックスを作成する）
+
+        Args:
+            path: 保存先のファイルパス
+
+        Returns:
+            LexicalIndex: 転置インデックス
+        """
+        return cls(path)
+
+    def save(self):
+        """前回の保存以降の追加・削除を書き込む"""
+        with self._lock:
+            self._conn.commit()
+
+    def close(self):
+        """SQLiteの接続を閉じる（保存していない変更は破棄される）"""
+        with self._lock:
+            self._conn.close()
+
+    def __len__(self):
+        return self._doc_count
+
+    def add(self, chunk_id, text, metadata):
+        """
+        チャンクを追加する（同じIDのチャンクがあれば置き換える）
+
+        Args:
+            chunk_id: チャンクID
+            text: チャンク本文
+            metadata: チャンクのメタデータ
+        """
+        term_counts = Counter(tokenize(text))
+        length = sum(term_counts.values())
+        with self._lock:
+            self._remove(chunk_id)
+            self._conn.execute(
+                "INSERT INTO documents (chunk_id, text, metadata, length) VALUES (?, ?, ?, ?)",
+                (chunk_id, text, json.dumps(metadata, ensure_ascii=False), length)
+            )
+            self._conn.executemany(
+                "INSERT INTO postings (term, chunk_id, tf, length) VALUES (?, ?, ?, ?)",
+                [(term, chunk_id, count, length) for term, count in term_counts.items()]
+            )
+            self._doc_count += 1
+            self._total_length += length
+
+    def remove(self, chunk_id):
+        """
+        チャンクを削除する
+
+        Args:
+            chunk_id: チャンクID
+        """
+        with self._lock:
+            self._remove(chunk_id)
+
+    def _remove(self, chunk_id):
+        """チャンクを削除する（ロックを取得した状態で呼ぶ）"""
+        row = self._conn.execute("SELECT length FROM documents WHERE chunk_id = ?", (chunk_id,)).fetchone()
+        if row is None:
+            return
+        self._conn.execute("DELETE FROM documents WHERE chunk_id = ?", (chunk_id,))
+        self._conn.execute("DELETE FROM postings WHERE chunk_id = ?", (chunk_id,))
+        self._doc_count -= 1
+        self._total_length -= row[0]
+
+    def clear(self):
+        """全てのチャンクを削除する"""
+        with self._lock:
+            self._conn.execute("DELETE FROM documents")
+            self._conn.execute("DELETE FROM postings")
+            self._doc_count = 0
+            self._total_length = 0
+
+    def search(self, query, k):
+        """
+        BM25のスコアが高い順にチャンクを検索する
+
+        Args:
+            query: 検索クエリ
+            k: 取得件数
+
+        Returns:
+            list: （チャンクID, スコア）のリスト（スコアの高い順）
+        """
+        doc_count = self._doc_count
+        if doc_count == 0:
+            return []
+        avg_length = self._total_length / doc_count
+        k1, b = ct.LEXICAL_BM25_K1, ct.LEXICAL_BM25_B
+
+        scores = {}
+        with self._lock:
+            for term in set(tokenize(query)):
+                df = self._conn.execute("SELECT COUNT(*) FROM postings WHERE term = ?", (term,)).fetchone()[0]
+                # ほぼ全てのチャンクに出現する語は、スコアへの寄与が小さいため読み飛ばす
+                if df == 0 or df / doc_count > ct.LEXICAL_MAX_DF_RATIO:
+                    continue
+                idf = math.log(1 + (doc_count - df + 0.5) / (df + 0.5))
+                for chunk_id, tf, length in self._conn.execute(
+                    "SELECT chunk_id, tf, length FROM postings WHERE term = ?", (term,)
+                ):
+                    score = idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * length / avg_length))
+                    scores[chunk_id] = scores.get(chunk_id, 0.0) + score
+
+        return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+
+    def get_document(self, chunk_id):
+        """
+        チャンクIDからDocumentを作成する
+
+        Args:
+            chunk_id: チャンクID
+
+        Returns:
+            Document: チャンク本文とメタデータ
+
+        Raises:
+            KeyError: チャンクIDが登録されていない場合
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT text, metadata FROM documents WHERE chunk_id = ?", (chunk_id,)
+            ).fetchone()
+        if row is None:
+            raise KeyError(chunk_id)
+        return Document(page_content=row[0], metadata=json.loads(row[1]))
+
+
+def get_lexical_index_path(persist_directory):
+    """
+    ベクターストアに対応する転置インデックスのファイルパスを返す関数
+
+    Args:
+        persist_directory: ベクターストアの保存先ディレクトリ
+
+    Returns:
+        str: 転置インデックスのファイルパス
+    """
+    return os.path.join(persist_directory, ct.LEXICAL_INDEX_FILE)
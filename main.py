@@ -5,8 +5,6 @@
 ############################################################
 # 1. ライブラリの読み込み
 ############################################################
-# 「.env」ファイルから環境変数を読み込むための関数
-from dotenv import load_dotenv
 # ログ出力を行うためのモジュール
 import logging
 # streamlitアプリの表示を担当するモジュール
@@ -19,53 +17,49 @@ from initialize import initialize
 import components as cn
 # （自作）変数（定数）がまとめて定義・管理されているモジュール
 import constants as ct
+# （自作）処理段ごとの所要時間を記録するトレース
+import tracing
+# （自作）外部サービス・インデックスの状態を確認するヘルスチェック
+import health
+# （自作）外部APIの呼び出しを制御するモジュール（混雑時の例外の判定に使用）
+import concurrency
+# （自作）会話ログを一定の件数に抑えて保持するモジュール
+import conversation_history
 
-import os
-import requests
-import logging
-import streamlit as st
-from dotenv import load_dotenv
 
-# ① .env 読み込み
-load_dotenv()
+############################################################
+# 2. 設定関連
+############################################################
+# ブラウザタブの表示文言を設定
+st.set_page_config(page_title=ct.APP_NAME)
+
+# ログ出力を行うためのロガーの設定
+logger = logging.getLogger(ct.LOGGER_NAME)
 
-# ② トークン読み込み確認
-token = os.getenv("NOTION_INTEGRATION_TOKEN")
-st.write("▶︎ 読み込まれた Notion トークン：", token)
-if not token:
-    st.error("‼️ 環境変数が読み込まれていません。`.env` を確認してください。")
-    st.stop()
 
-# ③ /users/me で認証チェック（詳細表示付き）
-def check_notion_auth():
-    token = os.getenv("NOTION_INTEGRATION_TOKEN")
-    st.write("▶︎ 読み込まれた Notion トークン：", token)
-    url = "https://api.notion.com/v1/users/me"
-    headers = {
-        "Authorization": f"Bearer {token}",
-        "Notion-Version": "2022-06-28",
-    }
-    resp = requests.get(url, headers=headers)
-    st.write("▶︎ ステータスコード：", resp.status_code)
-    st.write("▶︎ レスポンステキスト：", resp.text)
-    if resp.status_code != 200:
-        st.error(f"❌ Notion 認証エラー ({resp.status_code}) が発生しました。")
-        st.stop()
-
-# 3. 認証チェックを実行
-check_notion_auth()
-
-# 以下、Streamlitアプリの初期化処理など
-st.set_page_config(page_title="My App")
-logger = logging.getLogger("my_app")
-from initialize import initialize
+############################################################
+# 3. 初期化処理
+############################################################
 try:
+    # 初期化処理（「initialize.py」の「initialize」関数を実行）
     initialize()
 except Exception as e:
-    logger.error(f"初期化失敗: {e}")
-    st.error(f"アプリ初期化エラー: {e}")
+    # エラーログの出力
+    logger.error(f"{ct.INITIALIZE_ERROR_MESSAGE}\n{e}")
+    # エラーメッセージの画面表示
+    st.error(f"{ct.INITIALIZE_ERROR_MESSAGE}\n\nエラー詳細: {str(e)}", icon=ct.ERROR_ICON)
+    # 後続の処理を中断
     st.stop()
 
+# 外部サービス・インデックスの状態確認（結果はキャッシュされ、再実行のたびに通信は行わない）
+# 回答は構築済みのインデックスから行えるため、問題があっても警告の表示にとどめる
+health_status = health.get_health_status()
+if not health_status["ok"]:
+    st.warning(
+        "\n\n".join(result["detail"] for result in health_status["checks"].values() if not result["ok"]),
+        icon=ct.WARNING_ICON
+    )
+
 # アプリ起動時のログファイルへの出力
 if not "initialized" in st.session_state:
     st.session_state.initialized = True
@@ -104,6 +98,14 @@ except Exception as e:
 # 6. チャット入力の受け付け
 ############################################################
 chat_message = st.chat_input(ct.CHAT_INPUT_HELPER_TEXT)
+# 表示するユーザーメッセージ（通常は入力内容と同じ）
+user_message = chat_message
+# 検索結果の要約ボタンが押された場合は、その質問をLLMで要約する
+summarize = False
+if not chat_message and st.session_state.get("summary_query"):
+    chat_message = st.session_state.pop("summary_query")
+    user_message = ct.SUMMARIZE_REQUEST_MESSAGE.format(query=chat_message)
+    summarize = True
 
 
 ############################################################
@@ -113,12 +115,20 @@ if chat_message:
     # ==========================================
     # 7-1. ユーザーメッセージの表示
     # ==========================================
-    # ユーザーメッセージのログ出力
-    logger.info({"message": chat_message, "application_mode": st.session_state.mode})
+    # 処理段ごとの所要時間の記録を開始
+    trace = tracing.RequestTrace(chat_message, st.session_state.mode)
+    # ユーザーメッセージのログ出力（JSONの1行として出力。トレースIDで回答・処理時間と対応付ける）
+    logger.info({
+        "event": "user_message",
+        "trace_id": trace.trace_id,
+        "application_mode": st.session_state.mode,
+        "message": chat_message,
+        "summarize": summarize,
+    })
 
     # ユーザーメッセージを表示
     with st.chat_message("user"):
-        st.markdown(chat_message)
+        st.markdown(user_message)
 
     # ==========================================
     # 7-2. LLMからの回答取得
@@ -129,10 +139,21 @@ if chat_message:
     with st.spinner(ct.SPINNER_TEXT):
         try:
             # 画面読み込み時に作成したRetrieverを使い、Chainを実行
-            llm_response = utils.get_llm_response(chat_message)
+            # （ストリーミング時は検索までを行い、回答は表示時に逐次受け取る）
+            llm_response = utils.get_llm_response(
+                chat_message, stream=ct.STREAMING_ENABLED, trace=trace, summarize=summarize
+            )
+        except concurrency.BusyError as e:
+            # 混雑によりLLMの呼び出しを待ちきれなかった場合は、エラーではなく混雑中である旨を表示
+            logger.warning(f"{ct.LLM_BUSY_MESSAGE}\n{e}")
+            trace.finish(error=e)
+            st.warning(ct.LLM_BUSY_MESSAGE, icon=ct.WARNING_ICON)
+            # 後続の処理を中断
+            st.stop()
         except Exception as e:
             # エラーログの出力
             logger.error(f"{ct.GET_LLM_RESPONSE_ERROR_MESSAGE}\n{e}")
+            trace.finish(error=e)
             # エラーメッセージの画面表示
             st.error(f"{ct.GET_LLM_RESPONSE_ERROR_MESSAGE}\n\nエラー詳細: {str(e)}", icon=ct.ERROR_ICON)
             # 後続の処理を中断
@@ -143,25 +164,37 @@ if chat_message:
     # ==========================================
     with st.chat_message("assistant"):
         try:
-            # ==========================================
-            # モードが「社内文書検索」の場合
-            # ==========================================
-            if st.session_state.mode == ct.ANSWER_MODE_1:
-                # 入力内容と関連性が高い社内文書のありかを表示
-                content = cn.display_search_llm_response(llm_response)
-
-            # ==========================================
-            # モードが「社内問い合わせ」の場合
-            # ==========================================
-            elif st.session_state.mode == ct.ANSWER_MODE_2:
-                # 入力に対しての回答と、参照した文書のありかを表示
-                content = cn.display_contact_llm_response(llm_response)
+            # 表示にかかった時間を記録（ストリーミング時はLLMの回答生成を待つ時間を含む）
+            with trace.span("render"):
+                # ==========================================
+                # モードが「社内文書検索」の場合
+                # ==========================================
+                if st.session_state.mode == ct.ANSWER_MODE_1:
+                    # 入力内容と関連性が高い社内文書のありかを表示
+                    content = cn.display_search_llm_response(llm_response)
+
+                # ==========================================
+                # モードが「社内問い合わせ」の場合
+                # ==========================================
+                elif st.session_state.mode == ct.ANSWER_MODE_2:
+                    # 入力に対しての回答と、参照した文書のありかを表示
+                    content = cn.display_contact_llm_response(llm_response)
             
             # AIメッセージのログ出力
-            logger.info({"message": content, "application_mode": st.session_state.mode})
+            logger.info({
+                "event": "assistant_message",
+                "trace_id": trace.trace_id,
+                "application_mode": st.session_state.mode,
+                "message": content,
+            })
+            # 処理段ごとの所要時間を出力（設定により画面にも表示）
+            trace_record = trace.finish()
+            if ct.TRACE_DEBUG_PANEL:
+                cn.display_trace(trace_record)
         except Exception as e:
             # エラーログの出力
             logger.error(f"{ct.DISP_ANSWER_ERROR_MESSAGE}\n{e}")
+            trace.finish(error=e)
             # エラーメッセージの画面表示
             st.error(utils.build_error_message(ct.DISP_ANSWER_ERROR_MESSAGE), icon=ct.ERROR_ICON)
             # 後続の処理を中断
@@ -170,7 +203,7 @@ if chat_message:
     # ==========================================
     # 7-4. 会話ログへの追加
     # ==========================================
-    # 表示用の会話ログにユーザーメッセージを追加
-    st.session_state.messages.append({"role": "user", "content": chat_message})
+    # 表示用の会話ログにユーザーメッセージを追加（上限を超えた古いメッセージはディスクに書き出す）
+    conversation_history.append_message("user", user_message)
     # 表示用の会話ログにAIメッセージを追加
-    st.session_state.messages.append({"role": "assistant", "content": content})
\ No newline at end of file
+    conversation_history.append_message("assistant", content)
\ No newline at end of file
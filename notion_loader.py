@@ -0,0 +1,333 @@
+"""
+このファイルは、Notionデータベースのページを非同期・並列に読み込むローダーを定義するファイルです。
+データベースの問い合わせはページングで全件を取得し、ブロックの取得は同時実行数と
+リクエスト間隔を制限したうえで並列に行います。429応答の「Retry-After」にも従い、
+通信エラーも同じ間隔でリトライします。
+読み込んだページは完成した順にDocumentとして返すため、全件をメモリに溜め込みません。
+"""
+
+############################################################
+# 1. ライブラリの読み込み
+############################################################
+# 非同期処理を行うためのモジュール
+import asyncio
+# スレッドを扱うためのモジュール（同期処理からの呼び出しに使用）
+import threading
+# スレッド間でデータを受け渡すためのモジュール
+import queue
+# ログ出力を行うためのモジュール
+import logging
+# HTTPリクエストを行うためのモジュール（通信エラーの判定に使用）
+import httpx
+# （自作）外部サービスとの通信に使うHTTPクライアント
+import http_clients
+# LangChainのDocumentクラス
+from langchain_core.documents import Document
+# 固定値・変数を定義しているファイル
+import constants as ct
+
+# ロガーの設定
+logger = logging.getLogger(ct.LOGGER_NAME)
+
+
+############################################################
+# 2. リクエスト間隔の制御
+############################################################
+
+class AsyncRateLimiter:
+    """
+    リクエストの間隔を一定以上に保つ非同期のレートリミッター
+    429応答を受けた場合は、全てのリクエストを指定時間停止する
+    """
+
+    def __init__(self, requests_per_second):
+        """
+        Args:
+            requests_per_second: 1秒あたりのリクエスト数の上限
+        """
+        self.interval = 1.0 / requests_per_second
+        self._next_time = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        """次のリクエストを送ってよい時刻まで待つ"""
+        async with self._lock:
+            now = asyncio.get_running_loop().time()
+            wait = self._next_time - now
+            if wait > 0:
+                await asyncio.sleep(wait)
+                now = self._next_time
+            self._next_time = now + self.interval
+
+    def pause(self, seconds):
+        """
+        全てのリクエストを指定時間停止する
+
+        Args:
+            seconds: 停止する秒数
+        """
+        resume_time = asyncio.get_running_loop().time() + seconds
+        self._next_time = max(self._next_time, resume_time)
+
+
+############################################################
+# 3. Notionデータベースのローダー
+############################################################
+
+class AsyncNotionDBLoader:
+    """
+    Notionデータベースの非同期ローダー
+    - retrieve_page_summaries(): データベースの全ページの概要（プロパティ・最終更新日時）を取得
+    - lazy_load_pages(page_summaries): ページ本文を並列に読み込み、完成した順にDocumentを返す
+    """
+
+    def __init__(self, integration_token, database_id, base_url=None,
+                 request_timeout_sec=ct.NOTION_REQUEST_TIMEOUT,
+                 max_concurrency=ct.NOTION_MAX_CONCURRENCY,
+                 requests_per_second=ct.NOTION_REQUESTS_PER_SECOND,
+                 max_retries=ct.NOTION_MAX_RETRIES):
+        """
+        Args:
+            integration_token: Notion統合トークン
+            database_id: NotionデータベースID
+            base_url: Notion APIのベースURL（テスト用のローカルサーバーを指定できる）
+            request_timeout_sec: リクエストのタイムアウト（秒）
+            max_concurrency: 同時に送るリクエスト数の上限
+            requests_per_second: 1秒あたりのリクエスト数の上限
+            max_retries: 429・5xx応答時・通信エラー時のリトライ回数
+        """
+        if not integration_token:
+            raise ValueError("integration_token must be provided")
+        if not database_id:
+            raise ValueError("database_id must be provided")
+        self.database_id = database_id
+        self.base_url = base_url or ct.NOTION_API_BASE_URL
+        self.headers = {
+            "Authorization": f"Bearer {integration_token}",
+            "Content-Type": "application/json",
+            "Notion-Version": ct.NOTION_API_VERSION,
+        }
+        self.request_timeout_sec = request_timeout_sec
+        self.max_concurrency = max_concurrency
+        self.requests_per_second = requests_per_second
+        self.max_retries = max_retries
+
+    # ==========================================
+    # 同期処理からの呼び出し
+    # ==========================================
+    def retrieve_page_summaries(self):
+        """
+        データベースの全ページの概要を取得する
+
+        Returns:
+            list: ページ概要のリスト
+        """
+        return asyncio.run(self._with_client(self._aretrieve_page_summaries))
+
+    def lazy_load_pages(self, page_summaries):
+        """
+        ページ本文を並列に読み込み、完成した順にDocumentを返すジェネレーター
+        読み込みは別スレッドのイベントループで行い、受け渡しのキューで先読みの量を制限する
+
+        Args:
+            page_summaries: 読み込むページの概要のリスト
+
+        Yields:
+            Document: ページ本文とメタデータ
+        """
+        results = queue.Queue(maxsize=self.max_concurrency * 2)
+        done = object()
+        stop = threading.Event()
+
+        async def produce(client):
+            async for doc in self._alazy_load_pages(client, page_summaries):
+                # 受け取り側が追いつくまで待つ（読み込みを中断された場合は終了）
+                while not stop.is_set():
+                    try:
+                        await asyncio.to_thread(results.put, doc, True, 0.5)
+                        break
+                    except queue.Full:
+                        continue
+                if stop.is_set():
+                    return
+
+        def run():
+            try:
+                asyncio.run(self._with_client(produce))
+                results.put(done)
+            except BaseException as e:
+                results.put(e)
+
+        worker = threading.Thread(target=run, daemon=True)
+        worker.start()
+        try:
+            while True:
+                item = results.get()
+                if item is done:
+                    break
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            stop.set()
+
+    def load(self):
+        """
+        データベースの全ページを読み込む
+
+        Returns:
+            list: Documentのリスト
+        """
+        return list(self.lazy_load_pages(self.retrieve_page_summaries()))
+
+    # ==========================================
+    # 非同期処理
+    # ==========================================
+    async def _with_client(self, func):
+        """HTTPクライアントとレートリミッターを用意して非同期処理を実行する"""
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._rate_limiter = AsyncRateLimiter(self.requests_per_second)
+        async with http_clients.create_notion_async_client(
+            self.base_url,
+            self.headers,
+            self.request_timeout_sec
+        ) as client:
+            return await func(client)
+
+    async def _aretrieve_page_summaries(self, client):
+        """データベースの問い合わせをページングしながら全件取得する"""
+        pages = []
+        payload = {"page_size": 100}
+        while True:
+            data = await self._request(client, "POST", f"/databases/{self.database_id}/query", json=payload)
+            pages.extend(data.get("results", []))
+            if not data.get("has_more"):
+                return pages
+            payload["start_cursor"] = data.get("next_cursor")
+
+    async def _alazy_load_pages(self, client, page_summaries):
+        """ページ本文を並列に読み込み、完成した順に返す（同時に読み込むページ数は一定に保つ）"""
+        summaries = iter(page_summaries)
+        window = self.max_concurrency * 2
+        pending = set()
+        try:
+            while True:
+                # 読み込み中のページ数が上限になるまで、次のページの読み込みを開始
+                while len(pending) < window:
+                    summary = next(summaries, None)
+                    if summary is None:
+                        break
+                    pending.add(asyncio.create_task(self._aload_page(client, summary)))
+                if not pending:
+                    return
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    yield task.result()
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def _aload_page(self, client, page_summary):
+        """1ページ分の本文を読み込み、Documentにする"""
+        page_id = page_summary["id"]
+        metadata = parse_properties(page_summary.get("properties", {}))
+        metadata["id"] = page_id
+        content = await self._aload_blocks(client, page_id)
+        return Document(page_content=content, metadata=metadata)
+
+    async def _aload_blocks(self, client, block_id, num_tabs=0):
+        """ブロックとその子ブロックのテキストを読み込む（子ブロックは並列に取得）"""
+        blocks = []
+        params = {"page_size": 100}
+        while True:
+            data = await self._request(client, "GET", f"/blocks/{block_id}/children", params=params)
+            blocks.extend(data.get("results", []))
+            if not data.get("has_more"):
+                break
+            params = {"page_size": 100, "start_cursor": data.get("next_cursor")}
+
+        children = await asyncio.gather(*[
+            self._aload_blocks(client, block["id"], num_tabs + 1) if block.get("has_children") else _empty()
+            for block in blocks
+        ])
+
+        lines = []
+        for block, children_text in zip(blocks, children):
+            block_obj = block.get(block["type"], {})
+            if "rich_text" not in block_obj:
+                continue
+            texts = ["\t" * num_tabs + rich_text["text"]["content"]
+                     for rich_text in block_obj["rich_text"] if "text" in rich_text]
+            if children_text:
+                texts.append(children_text)
+            lines.append("\n".join(texts))
+        return "\n".join(lines)
+
+    async def _request(self, client, method, path, **kwargs):
+        """同時実行数・リクエスト間隔を守り、429・5xx応答と通信エラーはリトライしながらリクエストする"""
+        for attempt in range(self.max_retries + 1):
+            backoff = ct.NOTION_RETRY_BASE_DELAY * (2 ** attempt)
+            try:
+                async with self._semaphore:
+                    await self._rate_limiter.acquire()
+                    response = await client.request(method, path, **kwargs)
+            except httpx.TransportError as e:
+                if attempt == self.max_retries:
+                    raise
+                logger.warning(f"Notion APIとの通信に失敗したため{backoff:.1f}秒後にリトライします: {e}")
+                self._rate_limiter.pause(backoff)
+                continue
+
+            if response.status_code == 429 or response.status_code >= 500:
+                if attempt == self.max_retries:
+                    response.raise_for_status()
+                retry_after = float(response.headers.get("Retry-After", backoff))
+                logger.warning(f"Notion APIが{response.status_code}を返したため{retry_after:.1f}秒後にリトライします")
+                self._rate_limiter.pause(retry_after)
+                continue
+
+            response.raise_for_status()
+            return response.json()
+
+
+async def _empty():
+    """子ブロックのないブロック用の空の結果"""
+    return ""
+
+
+############################################################
+# 4. プロパティの変換
+############################################################
+
+def parse_properties(properties):
+    """
+    Notionのページプロパティをメタデータの辞書に変換する関数
+    （キーはプロパティ名の小文字。LangChainのNotionDBLoaderと同じ形式）
+
+    Args:
+        properties: Notion APIのページプロパティ
+
+    Returns:
+        dict: メタデータ
+    """
+    metadata = {}
+    for prop_name, prop_data in properties.items():
+        prop_type = prop_data.get("type")
+        value = prop_data.get(prop_type)
+
+        if prop_type in ("rich_text", "title"):
+            value = value[0]["plain_text"] if value else None
+        elif prop_type == "multi_select":
+            value = [item["name"] for item in value] if value else []
+        elif prop_type in ("select", "status"):
+            value = value["name"] if value else None
+        elif prop_type == "people":
+            value = [item.get("name") for item in value] if value else []
+        elif prop_type == "unique_id":
+            value = f'{value["prefix"]}-{value["number"]}' if value else None
+        elif prop_type not in ("url", "date", "last_edited_time", "created_time",
+                               "checkbox", "email", "number"):
+            value = None
+
+        metadata[prop_name.lower()] = value
+    return metadata
@@ -0,0 +1,477 @@
+"""
+このファイルは、Notionデータベースとベクターストアの差分同期を行う関数を定義するファイルです。
+ページごとのマニフェスト（ページID、最終更新日時、内容のハッシュ値、チャンクID）を保持し、
+前回の同期以降に更新されたページのチャンクのみを削除・再登録します。
+"""
+
+############################################################
+# 1. ライブラリの読み込み
+############################################################
+# 環境変数・ファイルパスを操作するモジュール
+import os
+# ハッシュ値を計算するためのモジュール
+import hashlib
+# JSONデータを扱うためのモジュール
+import json
+# 処理時間を扱うためのモジュール
+import time
+# ログ出力を行うためのモジュール
+import logging
+# （自作）Notionデータベースの非同期ローダー
+from notion_loader import AsyncNotionDBLoader
+# （自作）外部サービスとの通信に使うHTTPクライアント（接続先のURLの取得に使用）
+import http_clients
+# （自作）処理段をスレッドと上限付きキューでつなぐパイプライン
+import pipeline
+# LangChainのTextSplitterを使用するためのモジュール
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+# 固定値・変数を定義しているファイル
+import constants as ct
+
+# ロガーの設定
+logger = logging.getLogger(ct.LOGGER_NAME)
+
+
+############################################################
+# 2. ローダー・テキスト分割の生成
+############################################################
+
+def create_notion_loader(notion_integration_token, notion_database_id):
+    """
+    Notionデータベースのローダーを生成する関数
+
+    Args:
+        notion_integration_token: Notion統合トークン
+        notion_database_id: NotionデータベースID
+
+    Returns:
+        AsyncNotionDBLoader: Notionデータベースのローダー
+    """
+    return AsyncNotionDBLoader(
+        integration_token=notion_integration_token,
+        database_id=notion_database_id,
+        base_url=http_clients.get_notion_base_url()
+    )
+
+
+def create_text_splitter(chunk_size=None, chunk_overlap=None):
+    """
+    ドキュメントをチャンクに分割するTextSplitterを生成する関数
+
+    Args:
+        chunk_size: チャンクサイズ（省略時はCHUNK_SIZE）
+        chunk_overlap: チャンクオーバーラップ（省略時はCHUNK_OVERLAP）
+
+    Returns:
+        RecursiveCharacterTextSplitter: テキスト分割のインスタンス
+    """
+    return RecursiveCharacterTextSplitter(
+        chunk_size=ct.CHUNK_SIZE if chunk_size is None else chunk_size,
+        chunk_overlap=ct.CHUNK_OVERLAP if chunk_overlap is None else chunk_overlap
+    )
+
+
+############################################################
+# 3. マニフェストの読み書き
+############################################################
+
+def get_manifest_path(persist_directory):
+    """
+    ベクターストアに対応するマニフェストファイルのパスを返す関数
+
+    Args:
+        persist_directory: ベクターストアの保存先ディレクトリ
+
+    Returns:
+        str: マニフェストファイルのパス
+    """
+    return os.path.join(persist_directory, ct.SYNC_MANIFEST_FILE)
+
+
+def load_manifest(manifest_path):
+    """
+    マニフェストを読み込む関数（存在しない場合はNoneを返す）
+
+    Args:
+        manifest_path: マニフェストファイルのパス
+
+    Returns:
+        dict: マニフェスト（pages）
+    """
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_manifest(manifest_path, manifest):
+    """
+    マニフェストを保存する関数
+    一時ファイルに書き込んでから置き換えることで、書き込み途中の状態を残さない
+
+    Args:
+        manifest_path: マニフェストファイルのパス
+        manifest: 保存するマニフェスト
+    """
+    tmp_path = f"{manifest_path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    os.replace(tmp_path, manifest_path)
+
+
+############################################################
+# 4. 差分同期
+############################################################
+
+def find_changes(page_summaries, pages):
+    """
+    ページ一覧とマニフェストを比べ、公開中のページと最終更新日時が変わったページを求める関数
+
+    Args:
+        page_summaries: Notion APIから取得したページ概要のリスト
+        pages: マニフェストのページ情報
+
+    Returns:
+        tuple: （公開中のページIDの集合, ページIDと最終更新日時が変わったページ概要の辞書）
+    """
+    live_page_ids = set()
+    changed_summaries = {}
+    for page_summary in page_summaries:
+        page_id = page_summary["id"]
+        if page_summary.get("archived") or page_summary.get("in_trash"):
+            continue
+        live_page_ids.add(page_id)
+        entry = pages.get(page_id)
+        if entry and entry["last_edited_time"] == page_summary.get("last_edited_time"):
+            continue
+        changed_summaries[page_id] = page_summary
+    return live_page_ids, changed_summaries
+
+
+def has_changes(page_summaries, manifest):
+    """
+    マニフェストの作成後に、追加・更新・アーカイブ・削除されたページがあるかを返す関数
+
+    Args:
+        page_summaries: Notion APIから取得したページ概要のリスト
+        manifest: マニフェスト（Noneの場合は常にTrue）
+
+    Returns:
+        bool: 変更がある場合はTrue
+    """
+    if manifest is None:
+        return True
+    live_page_ids, changed_summaries = find_changes(page_summaries, manifest["pages"])
+    return bool(changed_summaries) or bool(set(manifest["pages"]) - live_page_ids)
+
+
+def sync_vectorstore(vectorstore, notion_loader, text_splitter, manifest_path, full_rebuild=False,
+                     on_progress=None, lexical_index=None, page_summaries=None):
+    """
+    Notionデータベースの内容をベクターストアへ差分同期する関数
+    - 新規・更新ページ: 古いチャンクを削除し、新しいチャンクを登録
+    - 内容に変化のないページ: 最終更新日時のみ更新（再Embeddingしない）
+    - アーカイブ・削除されたページ: チャンクを削除
+
+    Args:
+        vectorstore: 同期先のベクターストア
+        notion_loader: Notionデータベースのローダー
+        text_splitter: チャンク分割に使うTextSplitter
+        manifest_path: マニフェストファイルのパス
+        full_rebuild: Trueの場合、既存のチャンクを全て破棄して再構築する
+        on_progress: 変更のあったページを1件処理するごとに（処理済み件数, 件数）で呼ばれる関数
+        lexical_index: ベクターストアと同じ内容に保つ転置インデックス（任意）
+        page_summaries: 取得済みのページ一覧（省略時はローダーで取得する）
+
+    Returns:
+        dict: 同期結果の件数（added, updated, unchanged, deleted）
+    """
+    manifest = None if full_rebuild else load_manifest(manifest_path)
+
+    # マニフェストがない場合、由来の分からない既存チャンクを全て破棄してから同期する
+    if manifest is None:
+        existing_ids = vectorstore.get(include=[])["ids"]
+        if existing_ids:
+            vectorstore.delete(ids=existing_ids)
+            logger.info(f"マニフェストがないため既存の{len(existing_ids)}件のチャンクを削除しました")
+        if lexical_index is not None:
+            lexical_index.clear()
+        manifest = {"pages": {}}
+
+    pages = manifest["pages"]
+    stats = {"added": 0, "updated": 0, "unchanged": 0, "deleted": 0}
+
+    # ページ一覧（プロパティと最終更新日時のみ）を取得し、最終更新日時が変わったページを抽出
+    # 一覧は前回の同期日時で絞り込まずに全件取得する（一覧に現れないことでページの削除を検知するため）
+    if page_summaries is None:
+        page_summaries = notion_loader.retrieve_page_summaries()
+    live_page_ids, changed_summaries = find_changes(page_summaries, pages)
+
+    # 変更のあったページのみ本文を読み込み、「読み込み → 分割 → Embedding」の各段を
+    # 別スレッドで並行して進める（段の間のキューは上限付きのため、メモリ使用量は一定）
+    embeddings = vectorstore.embeddings
+    batches = pipeline.run_pipeline(
+        notion_loader.lazy_load_pages(list(changed_summaries.values())),
+        lambda docs: split_pages(docs, changed_summaries, pages, text_splitter),
+        lambda split: embed_pages(split, embeddings)
+    )
+
+    # 登録はバッチ単位で行い（削除・登録ともバッチごとに1回）、一定間隔ごとに保存（コミット）する
+    # 中断した場合は、最後にコミットしたバッチまでの内容がマニフェストに残るため、次回はその続きから処理される
+    processed = 0
+    last_commit = time.monotonic()
+    for batch in batches:
+        stale_ids, chunk_ids, chunks, vectors = [], [], [], []
+        for page in batch:
+            if page["chunks"] is None:
+                continue
+            entry = pages.get(page["page_id"])
+            # 同じIDのチャンクは登録時に置き換わるため、チャンク数が減った分のみ削除する
+            new_ids = set(page["chunk_ids"])
+            if entry:
+                stale_ids.extend(chunk_id for chunk_id in entry["chunk_ids"] if chunk_id not in new_ids)
+            chunk_ids.extend(page["chunk_ids"])
+            chunks.extend(page["chunks"])
+            vectors.extend(page["vectors"])
+        if stale_ids:
+            delete_chunks(vectorstore, lexical_index, stale_ids)
+        upsert_chunks(vectorstore, lexical_index, chunk_ids, chunks, vectors)
+
+        for page in batch:
+            entry = pages.get(page["page_id"])
+            if page["chunks"] is None:
+                # 最終更新日時のみ変わり、内容が同一の場合はEmbeddingし直さない
+                entry["last_edited_time"] = page["last_edited_time"]
+                stats["unchanged"] += 1
+            else:
+                pages[page["page_id"]] = {
+                    "last_edited_time": page["last_edited_time"],
+                    "content_hash": page["content_hash"],
+                    "chunk_ids": page["chunk_ids"],
+                }
+                stats["updated" if entry else "added"] += 1
+            processed += 1
+            if on_progress:
+                on_progress(processed, len(changed_summaries))
+
+        if time.monotonic() - last_commit >= ct.INGEST_COMMIT_INTERVAL:
+            commit_sync(vectorstore, lexical_index, manifest_path, manifest)
+            last_commit = time.monotonic()
+
+    # データベースから消えた（アーカイブ・削除された）ページのチャンクをまとめて削除
+    removed_ids = []
+    for page_id in set(pages) - live_page_ids:
+        removed_ids.extend(pages.pop(page_id)["chunk_ids"])
+        stats["deleted"] += 1
+    if removed_ids:
+        delete_chunks(vectorstore, lexical_index, removed_ids)
+
+    commit_sync(vectorstore, lexical_index, manifest_path, manifest)
+
+    logger.info(
+        f"ベクターストアを同期しました: 追加{stats['added']}件、更新{stats['updated']}件、"
+        f"変更なし{stats['unchanged']}件、削除{stats['deleted']}件"
+    )
+    return stats
+
+
+def split_pages(docs, changed_summaries, pages, text_splitter):
+    """
+    読み込んだページをチャンクに分割する（パイプラインの段）
+
+    Args:
+        docs: 読み込んだページのDocumentのイテレーター
+        changed_summaries: ページIDとページ概要の辞書
+        pages: マニフェストのページ情報
+        text_splitter: チャンク分割に使うTextSplitter
+
+    Yields:
+        dict: ページID・最終更新日時・内容のハッシュ値・チャンク（内容が同一の場合はNone）・チャンクID
+    """
+    for doc in docs:
+        page_summary = changed_summaries[doc.metadata["id"]]
+        page_id = page_summary["id"]
+        doc = prepare_page_document(doc, page_summary)
+        content_hash = compute_content_hash(doc)
+        page = {
+            "page_id": page_id,
+            "last_edited_time": page_summary.get("last_edited_time"),
+            "content_hash": content_hash,
+            "chunks": None,
+            "chunk_ids": [],
+        }
+
+        entry = pages.get(page_id)
+        if not (entry and entry["content_hash"] == content_hash):
+            chunks = text_splitter.split_documents([doc])
+            for i, chunk in enumerate(chunks):
+                chunk.metadata["chunk_index"] = i
+                # ページ単位の情報は取り込み時に記録し、検索時にページを集計し直さずに済むようにする
+                chunk.metadata["chunk_count"] = len(chunks)
+                chunk.metadata["content_hash"] = content_hash
+            page["chunks"] = chunks
+            page["chunk_ids"] = [make_chunk_id(page_id, i) for i in range(len(chunks))]
+        yield page
+
+
+def embed_pages(split_pages, embeddings):
+    """
+    チャンクをEmbeddingする（パイプラインの段）
+    ページ単位でまとめ、チャンク数がINGEST_BATCH_SIZEに達するごとに1バッチとしてEmbeddingする
+
+    Args:
+        split_pages: 分割済みのページのイテレーター
+        embeddings: Embeddingモデル
+
+    Yields:
+        list: Embedding（vectors）を付与したページのリスト
+    """
+    batch = []
+    chunk_count = 0
+    for page in split_pages:
+        batch.append(page)
+        chunk_count += len(page["chunk_ids"])
+        if chunk_count >= ct.INGEST_BATCH_SIZE:
+            yield _embed_batch(batch, embeddings)
+            batch = []
+            chunk_count = 0
+    if batch:
+        yield _embed_batch(batch, embeddings)
+
+
+def _embed_batch(batch, embeddings):
+    """バッチ内の全チャンクをまとめてEmbeddingし、ページごとに振り分ける"""
+    texts = [chunk.page_content for page in batch if page["chunks"] for chunk in page["chunks"]]
+    vectors = iter(embeddings.embed_documents(texts) if texts else [])
+    for page in batch:
+        if page["chunks"] is not None:
+            page["vectors"] = [next(vectors) for _ in page["chunks"]]
+    return batch
+
+
+def upsert_chunks(vectorstore, lexical_index, chunk_ids, chunks, vectors):
+    """
+    Embedding済みのチャンクをベクターストアと転置インデックスに登録する関数
+    （同じIDのチャンクがあれば置き換えるため、中断後の再実行でも重複しない）
+
+    Args:
+        vectorstore: ベクターストア
+        lexical_index: 転置インデックス（Noneの場合はベクターストアのみ）
+        chunk_ids: チャンクIDのリスト
+        chunks: チャンクのDocumentのリスト
+        vectors: チャンクのEmbeddingのリスト
+    """
+    if not chunks:
+        return
+    vectorstore.upsert(
+        ids=chunk_ids,
+        embeddings=vectors,
+        metadatas=[chunk.metadata for chunk in chunks],
+        documents=[chunk.page_content for chunk in chunks]
+    )
+    if lexical_index is not None:
+        for chunk_id, chunk in zip(chunk_ids, chunks):
+            lexical_index.add(chunk_id, chunk.page_content, chunk.metadata)
+
+
+def commit_sync(vectorstore, lexical_index, manifest_path, manifest):
+    """
+    ベクターストア・転置インデックスを保存してからマニフェストを保存する関数
+    （マニフェストに記録されたページは、保存済みであることが保証される）
+
+    Args:
+        vectorstore: ベクターストア
+        lexical_index: 転置インデックス（Noneの場合はベクターストアのみ）
+        manifest_path: マニフェストファイルのパス
+        manifest: マニフェスト
+    """
+    vectorstore.persist()
+    if lexical_index is not None:
+        lexical_index.save()
+    save_manifest(manifest_path, manifest)
+
+
+def make_chunk_id(page_id, chunk_index):
+    """
+    ページIDとチャンク番号からチャンクIDを作成する関数
+
+    Args:
+        page_id: NotionのページID
+        chunk_index: ページ内のチャンク番号
+
+    Returns:
+        str: チャンクID
+    """
+    return f"{page_id}-{chunk_index}"
+
+
+def delete_chunks(vectorstore, lexical_index, chunk_ids):
+    """
+    ベクターストアと転置インデックスからチャンクを削除する関数
+
+    Args:
+        vectorstore: ベクターストア
+        lexical_index: 転置インデックス（Noneの場合はベクターストアのみ）
+        chunk_ids: 削除するチャンクIDのリスト
+    """
+    vectorstore.delete(ids=chunk_ids)
+    if lexical_index is not None:
+        for chunk_id in chunk_ids:
+            lexical_index.remove(chunk_id)
+
+
+def prepare_page_document(doc, page_summary):
+    """
+    読み込んだページを、ベクターストアに保存できる形式のDocumentにする関数
+
+    Args:
+        doc: ローダーが読み込んだページのDocument
+        page_summary: Notion APIから取得したページ概要
+
+    Returns:
+        Document: ページ本文とメタデータ
+    """
+    metadata = doc.metadata
+    metadata["page_id"] = page_summary["id"]
+    if not metadata.get("url"):
+        metadata["url"] = page_summary.get("url")
+    metadata["last_edited_time"] = page_summary.get("last_edited_time")
+    doc.metadata = sanitize_metadata(metadata)
+    return doc
+
+
+def sanitize_metadata(metadata):
+    """
+    ベクターストアに保存できない値（None・リスト・辞書）を変換する関数
+
+    Args:
+        metadata: Notionのプロパティから作成したメタデータ
+
+    Returns:
+        dict: 文字列・数値・真偽値のみからなるメタデータ
+    """
+    sanitized = {}
+    for key, value in metadata.items():
+        if value is None:
+            continue
+        if isinstance(value, list):
+            value = ", ".join(str(v) for v in value if v is not None)
+        elif isinstance(value, dict):
+            value = json.dumps(value, ensure_ascii=False)
+        sanitized[key] = value
+    return sanitized
+
+
+def compute_content_hash(doc):
+    """
+    ページ本文とメタデータからハッシュ値を計算する関数
+
+    Args:
+        doc: ハッシュ値を計算するDocument
+
+    Returns:
+        str: SHA-256のハッシュ値
+    """
+    metadata = {k: v for k, v in doc.metadata.items() if k != "last_edited_time"}
+    payload = doc.page_content + json.dumps(metadata, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
@@ -0,0 +1,98 @@
+"""
+このファイルは、ジェネレーターの処理段をスレッドと上限付きキューでつなぐパイプラインを定義するファイルです。
+各段は別スレッドで動き、キューの上限によって前段が先に進みすぎないため、
+扱うデータ量が増えても同時にメモリに載る量は一定に保たれます。
+"""
+
+############################################################
+# 1. ライブラリの読み込み
+############################################################
+# スレッドを扱うためのモジュール
+import threading
+# スレッド間でデータを受け渡すためのモジュール
+import queue
+# 固定値・変数を定義しているファイル
+import constants as ct
+
+
+############################################################
+# 2. パイプライン
+############################################################
+
+# 段の終了を後段に伝える目印
+_END = object()
+
+
+class _StageError:
+    """段で発生した例外を後段に伝えるための入れ物"""
+
+    def __init__(self, error):
+        self.error = error
+
+
+def run_pipeline(source, *stages, maxsize=ct.INGEST_QUEUE_SIZE):
+    """
+    入力に対して各段を順に適用し、最終段の出力を返すジェネレーター
+    各段は「入力のイテレーターを受け取り、出力をyieldする関数」で、それぞれ別スレッドで実行される
+    いずれかの段で例外が発生した場合は、呼び出し側で同じ例外が送出される
+
+    Args:
+        source: 入力のイテラブル（取り出しも別スレッドで行う）
+        stages: 各段の関数
+        maxsize: 段と段の間のキューに溜められる件数の上限
+
+    Yields:
+        最終段の出力
+    """
+    stop = threading.Event()
+
+    def put(q, item):
+        # 後段が詰まっている間は待つ（パイプラインが中断された場合は諦める）
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def drain(q):
+        # 前段の出力を順に取り出すイテレーター（パイプラインが中断された場合は終了）
+        while True:
+            try:
+                item = q.get(timeout=0.5)
+            except queue.Empty:
+                if stop.is_set():
+                    return
+                continue
+            if item is _END:
+                return
+            if isinstance(item, _StageError):
+                raise item.error
+            yield item
+
+    def run(func, inbox, outbox):
+        items = drain(inbox) if inbox is not None else iter(source)
+        try:
+            for item in func(items):
+                if not put(outbox, item):
+                    return
+            put(outbox, _END)
+        except BaseException as e:
+            put(outbox, _StageError(e))
+        finally:
+            # 入力がジェネレーターの場合は後始末を行う
+            close = getattr(items, "close", None)
+            if close is not None:
+                close()
+
+    inbox = None
+    for func in [lambda items: items, *stages]:
+        outbox = queue.Queue(maxsize=maxsize)
+        threading.Thread(target=run, args=(func, inbox, outbox), daemon=True).start()
+        inbox = outbox
+
+    try:
+        yield from drain(inbox)
+    finally:
+        stop.set()
@@ -0,0 +1,173 @@
+"""
+このファイルは、会話の流れを踏まえて、検索に使う独立した質問文を作る仕組みを定義するファイルです。
+「契約社員の場合は？」のように直前の話題を前提とした質問は、そのままでは関連文書を検索できないため、
+直近の会話から話題を補った質問文に書き換えます。
+書き換えは既定ではルールで行い（外部APIを使わない）、設定によりチャットモデル（安価なモデル）で行います。
+結果は（会話履歴のハッシュ, 質問文）ごとに保持し、同じ会話・同じ質問では書き換えを繰り返しません。
+"""
+
+############################################################
+# 1. ライブラリの読み込み
+############################################################
+# ハッシュ値を計算するためのモジュール
+import hashlib
+# 排他制御を行うためのモジュール
+import threading
+# ログ出力を行うためのモジュール
+import logging
+# 挿入順を保持する辞書（LRUの管理に使用）
+from collections import OrderedDict
+# （自作）回答キャッシュのキーと同じ質問文の正規化を行う関数
+from answer_cache import normalize_query
+# （自作）外部APIの呼び出しを制御するモジュール（流量制御）
+import concurrency
+# 固定値・変数を定義しているファイル
+import constants as ct
+
+# ロガーの設定
+logger = logging.getLogger(ct.LOGGER_NAME)
+
+
+############################################################
+# 2. 会話履歴の切り出し
+############################################################
+
+def get_recent_history(messages, max_turns=ct.CONDENSE_HISTORY_TURNS, max_chars=ct.CONDENSE_HISTORY_MESSAGE_CHARS):
+    """
+    会話ログから、書き換えに使う直近の会話を切り出す関数
+    （アシスタントの初期メッセージなど、ユーザーの発言より前のメッセージは含めない）
+
+    Args:
+        messages: 会話ログ（role, contentを持つ辞書のリスト）
+        max_turns: 使用するユーザーの発言数の上限
+        max_chars: 1メッセージあたりの文字数の上限
+
+    Returns:
+        tuple: （role, 本文）のタプル（古い順）
+    """
+    recent = []
+    user_turns = 0
+    for message in reversed(messages):
+        if message["role"] == "user":
+            if user_turns >= max_turns:
+                break
+            user_turns += 1
+        recent.append((message["role"], str(message["content"])[:max_chars]))
+    recent.reverse()
+    # ユーザーの発言より前にあるアシスタントのメッセージ（初期メッセージなど）は除く
+    while recent and recent[0][0] != "user":
+        recent.pop(0)
+    return tuple(recent)
+
+
+def is_follow_up(query):
+    """
+    直前の話題を前提とした質問（単独では検索できない質問）かを判定する関数
+
+    Args:
+        query: ユーザーからの質問文
+
+    Returns:
+        bool: 直前の話題を前提とした質問の場合はTrue
+    """
+    normalized = normalize_query(query)
+    if normalized.startswith(tuple(ct.CONDENSE_FOLLOWUP_PREFIXES)):
+        return True
+    return normalized.endswith(tuple(ct.CONDENSE_FOLLOWUP_SUFFIXES))
+
+
+############################################################
+# 3. 質問文の書き換え
+############################################################
+
+class QueryCondenser:
+    """
+    直近の会話を踏まえて、検索に使う独立した質問文を作る仕組み
+    - heuristic: 直前の話題を前提とした質問の場合のみ、直近の単独で検索できる質問文を前に補う
+    - llm: チャットモデルに会話と質問を渡し、独立した質問文に書き換えさせる
+      （モデルを呼び出せない・失敗した場合はheuristicで書き換える）
+    """
+
+    def __init__(self, llm=None, method=ct.CONDENSE_METHOD, max_entries=ct.CONDENSE_CACHE_MAX_ENTRIES):
+        """
+        Args:
+            llm: 書き換えに使うチャットモデル（methodが"llm"の場合）
+            method: 書き換えの方式（"heuristic" または "llm"）
+            max_entries: 書き換え結果を保持する最大件数（超えた場合は最後に使われたのが古いものから削除）
+        """
+        self.llm = llm
+        self.method = method if llm is not None else "heuristic"
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def condense(self, query, messages):
+        """
+        検索に使う質問文を返す
+
+        Args:
+            query: ユーザーからの質問文
+            messages: 質問より前の会話ログ（role, contentを持つ辞書のリスト）
+
+        Returns:
+            str: 検索に使う質問文（書き換えが不要な場合は元の質問文）
+        """
+        history = get_recent_history(messages)
+        if not history:
+            return query
+
+        key = (self._hash_history(history), normalize_query(query))
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+
+        if self.method == "llm":
+            condensed = self._condense_with_llm(query, history)
+        else:
+            condensed = self._condense_with_rules(query, history)
+
+        with self._lock:
+            self._entries[key] = condensed
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return condensed
+
+    def _condense_with_rules(self, query, history):
+        """直前の話題を前提とした質問の場合、直近の単独で検索できる質問文を前に補う"""
+        if not is_follow_up(query):
+            return query
+        user_queries = [content for role, content in history if role == "user"]
+        # 続けて話題を前提とした質問をしている場合は、話題を示した元の質問までさかのぼる
+        topic = user_queries[0]
+        for content in reversed(user_queries):
+            if not is_follow_up(content):
+                topic = content
+                break
+        return f"{topic} {query}"
+
+    def _condense_with_llm(self, query, history):
+        """チャットモデルで独立した質問文に書き換える"""
+        transcript = "\n".join(
+            f"{'ユーザー' if role == 'user' else 'アシスタント'}: {content}" for role, content in history
+        )
+        prompt = ct.CONDENSE_PROMPT_TEMPLATE.format(history=transcript, question=query)
+        try:
+            with concurrency.get_limiter("chat").limit():
+                condensed = self.llm.invoke(prompt).content.strip()
+        except Exception as e:
+            logger.warning(f"質問文の書き換えに失敗したため、ルールで書き換えます: {e}")
+            return self._condense_with_rules(query, history)
+        return condensed or query
+
+    def _hash_history(self, history):
+        """書き換えに使う会話のハッシュ値を求める"""
+        digest = hashlib.sha256()
+        for role, content in history:
+            digest.update(f"{role}\0{content}\0".encode("utf-8"))
+        return digest.hexdigest()
@@ -0,0 +1,128 @@
+"""
+このファイルは、検索結果を並べ替える（リランキングする）Retrieverを定義するファイルです。
+多めに取得した候補を、質問の語がどれだけ本文・タイトルに含まれるかなどの特徴量で採点し直して上位k件を返します。
+採点は1回の質問ごとに時間の上限（RERANK_TIME_BUDGET_MS）を設け、超えた場合は元の検索順のまま返します。
+"""
+
+############################################################
+# 1. ライブラリの読み込み
+############################################################
+# 処理時間を計測するためのモジュール
+import time
+# ログ出力を行うためのモジュール
+import logging
+# 型ヒントを扱うためのモジュール
+from typing import Any, List
+# LangChainのRetrieverの基底クラス
+from langchain_core.retrievers import BaseRetriever
+# LangChainのDocumentクラス
+from langchain_core.documents import Document
+# （自作）転置インデックスと同じ規則でテキストをトークンに分割する関数
+from lexical_index import tokenize
+# （自作）検索候補から上位k件の異なるページを選ぶ関数
+from retrievers import select_by_page
+# 固定値・変数を定義しているファイル
+import constants as ct
+
+# ロガーの設定
+logger = logging.getLogger(ct.LOGGER_NAME)
+
+
+############################################################
+# 2. 特徴量による採点
+############################################################
+
+class FeatureReranker:
+    """
+    候補のチャンクを以下の特徴量の重み付き和で採点するリランカー（外部API・モデルを使わない）
+    - retrieval: 検索時のスコア（メタデータの「score」。ない場合は検索順から求める）
+    - coverage: 質問の語のうち、本文に含まれる語の割合
+    - title: 質問の語のうち、ページのタイトルに含まれる語の割合
+    """
+
+    def __init__(self, weights=None):
+        """
+        Args:
+            weights: 特徴量ごとの重み（省略時はRERANK_WEIGHTS）
+        """
+        self.weights = weights or ct.RERANK_WEIGHTS
+
+    def prepare(self, query):
+        """
+        質問ごとに1度だけ行う前処理
+
+        Args:
+            query: ユーザーからの質問文
+
+        Returns:
+            set: 質問の語
+        """
+        return set(tokenize(query))
+
+    def score(self, query_terms, doc, rank, candidate_count):
+        """
+        候補のチャンクを採点する
+
+        Args:
+            query_terms: prepare()で求めた質問の語
+            doc: 候補のチャンク
+            rank: 検索時の順位（0始まり）
+            candidate_count: 候補の件数
+
+        Returns:
+            float: スコア（高いほど関連度が高い）
+        """
+        retrieval_score = doc.metadata.get("score")
+        if retrieval_score is None:
+            retrieval_score = 1 - rank / candidate_count
+        if query_terms:
+            coverage = len(query_terms & set(tokenize(doc.page_content))) / len(query_terms)
+            title = len(query_terms & set(tokenize(doc.metadata.get("title") or ""))) / len(query_terms)
+        else:
+            coverage = title = 0.0
+        return (
+            self.weights["retrieval"] * retrieval_score
+            + self.weights["coverage"] * coverage
+            + self.weights["title"] * title
+        )
+
+
+############################################################
+# 3. リランキングを行うRetriever
+############################################################
+
+class RerankingRetriever(BaseRetriever):
+    """
+    元のRetrieverで多めに取得した候補をリランキングし、上位k件の異なるページのチャンクを返すRetriever
+    採点が時間の上限を超えた場合は、採点を打ち切って元の検索順の上位k件を返す
+    """
+
+    base_retriever: BaseRetriever
+    reranker: Any
+    k: int = ct.RETRIEVER_K
+    time_budget_ms: float = ct.RERANK_TIME_BUDGET_MS
+
+    def _get_relevant_documents(self, query: str, *, run_manager: Any = None) -> List[Document]:
+        candidates = self.base_retriever.invoke(query)
+        started = time.perf_counter()
+        deadline = started + self.time_budget_ms / 1000
+
+        # 候補を順に採点し、時間の上限を超えた時点で元の検索順に戻す
+        query_terms = self.reranker.prepare(query)
+        scored = []
+        for rank, doc in enumerate(candidates):
+            if time.perf_counter() > deadline:
+                logger.warning(
+                    f"リランキングが時間の上限（{self.time_budget_ms}ミリ秒）を超えたため、検索順のまま返します"
+                    f"（{rank}/{len(candidates)}件を採点済み）"
+                )
+                return select_by_page(candidates, self.k)
+            scored.append((self.reranker.score(query_terms, doc, rank, len(candidates)), rank, doc))
+
+        # スコアが同じ場合は元の検索順を優先する
+        scored.sort(key=lambda item: (-item[0], item[1]))
+        logger.debug(f"リランキング: {len(candidates)}件を{(time.perf_counter() - started) * 1000:.1f}ミリ秒で採点しました")
+        return select_by_page([
+            Document(page_content=doc.page_content, metadata={**doc.metadata, "rerank_score": score})
+            for score, _, doc in scored
+        ], self.k)
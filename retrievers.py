@@ -0,0 +1,176 @@
+"""
+このファイルは、アプリで使用するRetrieverを定義するファイルです。
+"""
+
+############################################################
+# 1. ライブラリの読み込み
+############################################################
+# 型ヒントを扱うためのモジュール
+from typing import Any, List
+# LangChainのRetrieverの基底クラス
+from langchain_core.retrievers import BaseRetriever
+# LangChainのDocumentクラス
+from langchain_core.documents import Document
+# （自作）Notionとベクターストアの差分同期を行うモジュール（チャンクIDの作成に使用）
+import notion_sync
+# 固定値・変数を定義しているファイル
+import constants as ct
+
+
+############################################################
+# 2. 検索結果の統合
+############################################################
+
+def get_chunk_id(doc):
+    """
+    検索結果のDocumentからチャンクIDを求める関数
+
+    Args:
+        doc: 検索結果のDocument
+
+    Returns:
+        str: チャンクID（ページ情報のないDocumentは本文をIDとして扱う）
+    """
+    page_id = doc.metadata.get("page_id")
+    chunk_index = doc.metadata.get("chunk_index")
+    if page_id is None or chunk_index is None:
+        return doc.page_content
+    return notion_sync.make_chunk_id(page_id, chunk_index)
+
+
+def get_page_key(doc):
+    """
+    検索結果のDocumentが属するページを識別するキーを返す関数
+    （ページID・URL・タイトルは取り込み時にチャンクのメタデータに記録済み）
+
+    Args:
+        doc: 検索結果のDocument
+
+    Returns:
+        str: ページID（ない場合はURL、それもない場合はタイトル）
+    """
+    metadata = doc.metadata
+    return metadata.get("page_id") or metadata.get("url") or metadata.get("title", "")
+
+
+def select_by_page(documents, k, max_chunks_per_page=ct.RETRIEVER_MAX_CHUNKS_PER_PAGE):
+    """
+    関連度順の検索候補から、上位k件の異なるページを選び、ページごとに上限件数までのチャンクを返す関数
+    選んだチャンクのメタデータの「page_hits」には、候補のうちそのページのチャンク数を記録する
+    （候補がすでに絞り込まれている場合は、絞る前に記録されたチャンク数の方が多ければそちらを残す）
+
+    Args:
+        documents: 関連度の高い順に並んだ検索候補（Documentのリスト。多めに取得しておく）
+        k: 選ぶページ数
+        max_chunks_per_page: ページごとに返すチャンク数の上限
+
+    Returns:
+        list: 選んだチャンク（Documentのリスト。関連度の高い順）
+    """
+    hits = {}
+    for doc in documents:
+        key = get_page_key(doc)
+        hits[key] = hits.get(key, 0) + 1
+
+    selected = []
+    counts = {}
+    for doc in documents:
+        key = get_page_key(doc)
+        if key not in counts:
+            if len(counts) >= k:
+                continue
+            counts[key] = 0
+        if counts[key] >= max_chunks_per_page:
+            continue
+        counts[key] += 1
+        selected.append(Document(
+            page_content=doc.page_content,
+            metadata={**doc.metadata, "page_hits": max(hits[key], doc.metadata.get("page_hits", 0))}
+        ))
+    return selected
+
+
+def reciprocal_rank_fusion(rankings, rrf_k=ct.RRF_K):
+    """
+    複数の検索結果の順位をReciprocal Rank Fusionで統合する関数
+
+    Args:
+        rankings: チャンクIDのリスト（順位順）のリスト
+        rrf_k: 順位のスコアを平滑化する定数
+
+    Returns:
+        list: （チャンクID, スコア）のリスト（スコアの高い順）
+    """
+    scores = {}
+    for ranking in rankings:
+        for rank, chunk_id in enumerate(ranking, 1):
+            scores[chunk_id] = scores.get(chunk_id, 0.0) + 1.0 / (rrf_k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+############################################################
+# 3. ハイブリッド検索のRetriever
+############################################################
+
+class HybridRetriever(BaseRetriever):
+    """
+    ベクトル検索とBM25の転置インデックス検索を組み合わせるRetriever
+    それぞれ多めに取得した結果をReciprocal Rank Fusionで統合し、上位k件の異なるページのチャンクを返す
+    （統合後のスコアは、両方の検索で1位の場合を1.0とした値としてメタデータの「score」に記録する）
+    """
+
+    vectorstore: Any
+    lexical_index: Any
+    k: int = ct.RETRIEVER_K
+    fetch_k: int = ct.HYBRID_FETCH_K
+    max_chunks_per_page: int = ct.RETRIEVER_MAX_CHUNKS_PER_PAGE
+
+    def _get_relevant_documents(self, query: str, *, run_manager: Any = None) -> List[Document]:
+        # ベクトル検索
+        vector_docs = self.vectorstore.similarity_search(query, k=self.fetch_k)
+        vector_ids = [get_chunk_id(doc) for doc in vector_docs]
+        documents = dict(zip(vector_ids, vector_docs))
+
+        # 転置インデックス検索
+        lexical_ids = [chunk_id for chunk_id, _ in self.lexical_index.search(query, self.fetch_k)]
+        for chunk_id in lexical_ids:
+            if chunk_id not in documents:
+                documents[chunk_id] = self.lexical_index.get_document(chunk_id)
+
+        # 順位を統合し、上位k件の異なるページのチャンクを返す
+        rankings = [vector_ids, lexical_ids]
+        fused = reciprocal_rank_fusion(rankings)
+        max_score = len(rankings) / (ct.RRF_K + 1)
+        candidates = [
+            Document(
+                page_content=documents[chunk_id].page_content,
+                metadata={**documents[chunk_id].metadata, "score": score / max_score}
+            )
+            for chunk_id, score in fused
+        ]
+        return select_by_page(candidates, self.k, self.max_chunks_per_page)
+
+
+############################################################
+# 4. ベクトル検索のRetriever
+############################################################
+
+class VectorRetriever(BaseRetriever):
+    """
+    ベクトル検索のみを行うRetriever
+    多めに取得した結果から、上位k件の異なるページのチャンクを返す
+    （類似度を0〜1に換算した値をメタデータの「score」に記録する）
+    """
+
+    vectorstore: Any
+    k: int = ct.RETRIEVER_K
+    fetch_k: int = ct.RETRIEVER_FETCH_K
+    max_chunks_per_page: int = ct.RETRIEVER_MAX_CHUNKS_PER_PAGE
+
+    def _get_relevant_documents(self, query: str, *, run_manager: Any = None) -> List[Document]:
+        results = self.vectorstore.similarity_search_with_relevance_scores(query, k=self.fetch_k)
+        candidates = [
+            Document(page_content=doc.page_content, metadata={**doc.metadata, "score": score})
+            for doc, score in results
+        ]
+        return select_by_page(candidates, self.k, self.max_chunks_per_page)
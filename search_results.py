@@ -0,0 +1,145 @@
+"""
+このファイルは、LLMを使わずに検索結果を一覧表示するための関数を定義するファイルです。
+検索結果のチャンクをNotionのページ単位にまとめ、質問の語を強調した抜粋と関連度のスコアを付けます。
+"""
+
+############################################################
+# 1. ライブラリの読み込み
+############################################################
+# 文字列の正規化を行うためのモジュール
+import unicodedata
+# 正規表現を扱うためのモジュール
+import re
+# （自作）転置インデックスと同じ規則で質問をトークンに分割する関数
+from lexical_index import tokenize
+# （自作）検索結果が属するページを識別するキーを返す関数
+from retrievers import get_page_key
+# 固定値・変数を定義しているファイル
+import constants as ct
+
+
+############################################################
+# 2. ページ単位のまとめ
+############################################################
+
+def group_by_page(documents):
+    """
+    検索結果をページ単位にまとめる関数（ページの順位は、そのページで最も上位のチャンクの順位）
+    Retrieverがページごとのチャンク数を絞っている場合は、絞る前の候補のチャンク数（page_hits）を使う
+
+    Args:
+        documents: 関連度の高い順に並んだ検索結果（Documentのリスト）
+
+    Returns:
+        list: （ページを代表するDocument, そのページのチャンク数）のリスト（関連度の高い順）
+    """
+    pages = {}
+    for doc in documents:
+        key = get_page_key(doc)
+        if key in pages:
+            pages[key][1] += 1
+        else:
+            pages[key] = [doc, 1]
+    return [(doc, max(count, doc.metadata.get("page_hits", 1))) for doc, count in pages.values()]
+
+
+############################################################
+# 3. 抜粋の作成
+############################################################
+
+MARKDOWN_SPECIAL_PATTERN = re.compile(r"([\\`*_\[\]<>#|~])")
+
+
+def build_snippet(text, query, length=ct.SEARCH_SNIPPET_LENGTH):
+    """
+    本文から質問の語を最も多く含む部分を抜き出し、該当箇所を太字にしたMarkdownを作成する関数
+
+    Args:
+        text: チャンクの本文
+        query: ユーザーからの質問文
+        length: 抜粋の文字数
+
+    Returns:
+        str: 抜粋（Markdown）
+    """
+    # 転置インデックスと同じ正規化を行い、改行は空白にまとめる
+    text = re.sub(r"\s+", " ", unicodedata.normalize("NFKC", text)).strip()
+    spans = _find_matches(text.lower(), set(tokenize(query)))
+
+    # 一致箇所を最も多く含む範囲を選ぶ（一致がない場合は先頭から）
+    start = 0
+    best = 0
+    for span_start, _ in spans:
+        window_start = max(span_start - length // 4, 0)
+        covered = sum(1 for s, e in spans if s >= window_start and e <= window_start + length)
+        if covered > best:
+            start, best = window_start, covered
+    end = min(start + length, len(text))
+    start = max(min(start, end - length), 0)
+
+    parts = []
+    position = start
+    for span_start, span_end in spans:
+        if span_end <= start or span_start >= end:
+            continue
+        span_start, span_end = max(span_start, start), min(span_end, end)
+        parts.append(_escape(text[position:span_start]))
+        parts.append(f"**{_escape(text[span_start:span_end])}**")
+        position = span_end
+    parts.append(_escape(text[position:end]))
+
+    prefix = "…" if start > 0 else ""
+    suffix = "…" if end < len(text) else ""
+    return prefix + "".join(parts) + suffix
+
+
+def _find_matches(text, tokens):
+    """本文中のトークンの出現位置を求め、重なる・隣接する位置をまとめる"""
+    spans = []
+    for token in tokens:
+        for match in re.finditer(re.escape(token), text):
+            spans.append((match.start(), match.end()))
+    spans.sort()
+
+    merged = []
+    for start, end in spans:
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def _escape(text):
+    """Markdownの記号として解釈される文字をエスケープする"""
+    return MARKDOWN_SPECIAL_PATTERN.sub(r"\\\1", text)
+
+
+############################################################
+# 4. 検索結果の一覧
+############################################################
+
+def build_search_results(documents, query):
+    """
+    検索結果からページ単位の一覧を作成する関数
+
+    Args:
+        documents: 関連度の高い順に並んだ検索結果（Documentのリスト）
+        query: ユーザーからの質問文
+
+    Returns:
+        list: ページごとの辞書（name, url, page, content, snippet, score, hits）のリスト
+    """
+    results = []
+    for doc, hits in group_by_page(documents):
+        metadata = doc.metadata
+        results.append({
+            "name": metadata.get("title", "不明なタイトル"),
+            "url": metadata.get("url", ""),
+            "page": metadata.get("page", ""),
+            "content": doc.page_content[:200] + "..." if len(doc.page_content) > 200 else doc.page_content,
+            "snippet": build_snippet(doc.page_content, query),
+            "score": metadata.get("score"),
+            "hits": hits,
+        })
+    return results
@@ -0,0 +1,443 @@
+"""
+このファイルは、セッションごとの会話ログ・状態（モードなど）を保存するセッションストアを定義するファイルです。
+どちらも同じメソッドで扱え、SESSION_STORE_BACKENDで切り替えます。
+- "sqlite": SQLite（WALモード）のファイルに保存する。アプリの再起動後も会話を続けられ、
+  同じファイルを参照する複数のプロセス（レプリカ）から読み書きできる。
+  書き込みはまとめて（SESSION_STORE_FLUSH_INTERVAL秒ごと、またはSESSION_STORE_BATCH_SIZE件ごと）別スレッドで行う。
+- "memory": プロセス内のメモリに保存する（開発・ベンチマーク用。再起動すると失われる）
+会話ログはセッションごとに0から振った連番で保存し、セッションIDと連番の主キーで範囲を読み込みます。
+"""
+
+############################################################
+# 1. ライブラリの読み込み
+############################################################
+# 環境変数・ファイルパスを操作するモジュール
+import os
+# 排他制御・スレッドを扱うためのモジュール
+import threading
+# 処理時間を扱うためのモジュール
+import time
+# プロセス終了時の処理を登録するためのモジュール
+import atexit
+# JSONデータを扱うためのモジュール
+import json
+# SQLiteを扱うためのモジュール
+import sqlite3
+# ログ出力を行うためのモジュール
+import logging
+# 固定値・変数を定義しているファイル
+import constants as ct
+
+# ロガーの設定
+logger = logging.getLogger(ct.LOGGER_NAME)
+
+
+############################################################
+# 2. セッションストアの選択
+############################################################
+
+def get_backend():
+    """
+    使用するセッションストアの種類を返す関数（環境変数「SESSION_STORE_BACKEND」で上書きできる）
+
+    Returns:
+        str: "sqlite" または "memory"
+    """
+    return os.getenv("SESSION_STORE_BACKEND", ct.SESSION_STORE_BACKEND)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_session_store():
+    """
+    プロセスで共有するセッションストアを返す関数
+    （プロセスの終了時に、まだ書き込んでいない内容を書き込む）
+
+    Returns:
+        SQLiteSessionStore | MemorySessionStore: セッションストア
+    """
+    global _store
+    with _store_lock:
+        if _store is None:
+            if get_backend() == "memory":
+                _store = MemorySessionStore()
+            else:
+                _store = SQLiteSessionStore(ct.SESSION_STORE_PATH)
+                atexit.register(_store.close)
+        return _store
+
+
+############################################################
+# 3. メモリのセッションストア
+############################################################
+
+class MemorySessionStore:
+    """
+    プロセス内のメモリに保存するセッションストア
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._messages = {}
+        self._states = {}
+        self._updated = {}
+
+    def append_messages(self, session_id, messages):
+        """
+        会話ログの末尾にメッセージを追加する
+
+        Args:
+            session_id: セッションID
+            messages: 追加するメッセージ（role, contentを持つ辞書）のリスト
+        """
+        with self._lock:
+            self._messages.setdefault(session_id, []).extend(
+                {"role": message["role"], "content": message["content"]} for message in messages
+            )
+            self._updated[session_id] = time.time()
+
+    def get_messages(self, session_id, start, end):
+        """
+        会話ログの指定した範囲のメッセージを返す
+
+        Args:
+            session_id: セッションID
+            start: 最初のメッセージの連番（0始まり）
+            end: 最後のメッセージの次の連番
+
+        Returns:
+            list: メッセージ（role, contentを持つ辞書）のリスト（古い順）
+        """
+        with self._lock:
+            return [dict(message) for message in self._messages.get(session_id, [])[start:end]]
+
+    def count_messages(self, session_id):
+        """
+        会話ログのメッセージ数を返す
+
+        Args:
+            session_id: セッションID
+
+        Returns:
+            int: メッセージ数
+        """
+        with self._lock:
+            return len(self._messages.get(session_id, []))
+
+    def set_state(self, session_id, key, value):
+        """
+        セッションの状態（モードなど、JSONにできる値）を保存する
+
+        Args:
+            session_id: セッションID
+            key: 状態の名前
+            value: 状態の値
+        """
+        with self._lock:
+            self._states.setdefault(session_id, {})[key] = json.loads(json.dumps(value))
+            self._updated[session_id] = time.time()
+
+    def get_state(self, session_id):
+        """
+        セッションの状態を全て返す
+
+        Args:
+            session_id: セッションID
+
+        Returns:
+            dict: 状態の名前と値
+        """
+        with self._lock:
+            return dict(self._states.get(session_id, {}))
+
+    def delete_session(self, session_id):
+        """
+        セッションの会話ログ・状態を削除する
+
+        Args:
+            session_id: セッションID
+        """
+        with self._lock:
+            self._messages.pop(session_id, None)
+            self._states.pop(session_id, None)
+            self._updated.pop(session_id, None)
+
+    def purge_expired(self, max_age):
+        """
+        最後の更新から一定時間を過ぎたセッションを削除する
+
+        Args:
+            max_age: 保持する時間（秒）
+
+        Returns:
+            int: 削除したセッション数
+        """
+        expires_before = time.time() - max_age
+        with self._lock:
+            expired = [session_id for session_id, updated in self._updated.items() if updated < expires_before]
+        for session_id in expired:
+            self.delete_session(session_id)
+        return len(expired)
+
+    def flush(self):
+        """まだ書き込んでいない内容を書き込む（メモリのセッションストアでは何もしない）"""
+
+    def close(self):
+        """セッションストアを閉じる（メモリのセッションストアでは何もしない）"""
+
+
+############################################################
+# 4. SQLiteのセッションストア
+############################################################
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS sessions_updated_at ON sessions (updated_at);
+CREATE TABLE IF NOT EXISTS messages (
+    session_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (session_id, seq)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS session_state (
+    session_id TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    PRIMARY KEY (session_id, key)
+) WITHOUT ROWID;
+"""
+
+
+class SQLiteSessionStore:
+    """
+    SQLite（WALモード）のファイルに保存するセッションストア
+    書き込みはバッファに積んで呼び出し元にすぐ戻り、別スレッドが1つのトランザクションにまとめて書き込む
+    読み込みの前には、まだ書き込んでいない内容を書き込む（自分の書き込みは必ず読める）
+    メッセージの連番は書き込み時にデータベース上で振るため、複数のプロセスから同じセッションに追加しても重ならない
+    """
+
+    def __init__(self, path, batch_size=ct.SESSION_STORE_BATCH_SIZE, flush_interval=ct.SESSION_STORE_FLUSH_INTERVAL):
+        """
+        Args:
+            path: データベースファイルのパス
+            batch_size: この件数の書き込みが溜まった時点で、待たずに書き込む
+            flush_interval: 書き込みを溜めておく時間の上限（秒）
+        """
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._local = threading.local()
+        self._pending = []
+        self._pending_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._closed = False
+
+        conn = self._connect()
+        conn.executescript(SCHEMA)
+        self._writer = threading.Thread(target=self._run_writer, daemon=True)
+        self._writer.start()
+
+    def _connect(self):
+        """スレッドごとの接続を返す（SQLiteの接続はスレッド間で共有しない）"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=ct.SESSION_STORE_BUSY_TIMEOUT, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _enqueue(self, operation):
+        """書き込みをバッファに積む（件数が上限に達した場合は書き込みスレッドを起こす）"""
+        with self._pending_lock:
+            self._pending.append(operation)
+            full = len(self._pending) >= self.batch_size
+        if full:
+            self._wake.set()
+
+    def append_messages(self, session_id, messages):
+        """
+        会話ログの末尾にメッセージを追加する
+
+        Args:
+            session_id: セッションID
+            messages: 追加するメッセージ（role, contentを持つ辞書）のリスト
+        """
+        now = time.time()
+        for message in messages:
+            self._enqueue(("append", session_id, message["role"], message["content"], now))
+
+    def get_messages(self, session_id, start, end):
+        """
+        会話ログの指定した範囲のメッセージを返す
+
+        Args:
+            session_id: セッションID
+            start: 最初のメッセージの連番（0始まり）
+            end: 最後のメッセージの次の連番
+
+        Returns:
+            list: メッセージ（role, contentを持つ辞書）のリスト（古い順）
+        """
+        self.flush()
+        rows = self._connect().execute(
+            "SELECT role, content FROM messages WHERE session_id = ? AND seq >= ? AND seq < ? ORDER BY seq",
+            (session_id, start, end)
+        ).fetchall()
+        return [{"role": role, "content": content} for role, content in rows]
+
+    def count_messages(self, session_id):
+        """
+        会話ログのメッセージ数を返す
+
+        Args:
+            session_id: セッションID
+
+        Returns:
+            int: メッセージ数
+        """
+        self.flush()
+        row = self._connect().execute(
+            "SELECT MAX(seq) FROM messages WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        return 0 if row[0] is None else row[0] + 1
+
+    def set_state(self, session_id, key, value):
+        """
+        セッションの状態（モードなど、JSONにできる値）を保存する
+
+        Args:
+            session_id: セッションID
+            key: 状態の名前
+            value: 状態の値
+        """
+        self._enqueue(("state", session_id, key, json.dumps(value, ensure_ascii=False), time.time()))
+
+    def get_state(self, session_id):
+        """
+        セッションの状態を全て返す
+
+        Args:
+            session_id: セッションID
+
+        Returns:
+            dict: 状態の名前と値
+        """
+        self.flush()
+        rows = self._connect().execute(
+            "SELECT key, value FROM session_state WHERE session_id = ?", (session_id,)
+        ).fetchall()
+        return {key: json.loads(value) for key, value in rows}
+
+    def delete_session(self, session_id):
+        """
+        セッションの会話ログ・状態を削除する
+
+        Args:
+            session_id: セッションID
+        """
+        self._enqueue(("delete", session_id))
+
+    def purge_expired(self, max_age):
+        """
+        最後の更新から一定時間を過ぎたセッションを削除する
+
+        Args:
+            max_age: 保持する時間（秒）
+
+        Returns:
+            int: 削除したセッション数
+        """
+        self.flush()
+        expires_before = time.time() - max_age
+        with self._write_lock:
+            conn = self._connect()
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                expired = [row[0] for row in conn.execute(
+                    "SELECT session_id FROM sessions WHERE updated_at < ?", (expires_before,)
+                )]
+                for session_id in expired:
+                    self._delete(conn, session_id)
+                conn.execute("COMMIT")
+            except BaseException:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                raise
+        return len(expired)
+
+    def flush(self):
+        """まだ書き込んでいない内容を、1つのトランザクションで書き込む"""
+        # 書き込みの順序を保つため、バッファの取り出しから書き込みまでを1つのロックで行う
+        with self._write_lock:
+            with self._pending_lock:
+                operations, self._pending = self._pending, []
+            if not operations:
+                return
+            conn = self._connect()
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                touched = {}
+                for operation in operations:
+                    kind, session_id = operation[0], operation[1]
+                    if kind == "append":
+                        _, _, role, content, created_at = operation
+                        conn.execute(
+                            "INSERT INTO messages (session_id, seq, role, content, created_at) "
+                            "SELECT ?, COALESCE(MAX(seq) + 1, 0), ?, ?, ? FROM messages WHERE session_id = ?",
+                            (session_id, role, content, created_at, session_id)
+                        )
+                        touched[session_id] = created_at
+                    elif kind == "state":
+                        _, _, key, value, updated_at = operation
+                        conn.execute(
+                            "INSERT OR REPLACE INTO session_state (session_id, key, value) VALUES (?, ?, ?)",
+                            (session_id, key, value)
+                        )
+                        touched[session_id] = updated_at
+                    else:
+                        self._delete(conn, session_id)
+                        touched.pop(session_id, None)
+                conn.executemany(
+                    "INSERT OR REPLACE INTO sessions (session_id, updated_at) VALUES (?, ?)",
+                    list(touched.items())
+                )
+                conn.execute("COMMIT")
+            except BaseException:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                # 書き込めなかった内容はバッファに戻し、次の書き込みで再度試みる
+                with self._pending_lock:
+                    self._pending[:0] = operations
+                raise
+
+    def _delete(self, conn, session_id):
+        """セッションの行を全て削除する（トランザクション内で呼ぶ）"""
+        conn.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+        conn.execute("DELETE FROM session_state WHERE session_id = ?", (session_id,))
+        conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+
+    def _run_writer(self):
+        """一定時間ごと（または件数が上限に達した時点）に、溜まった書き込みを行う"""
+        while not self._closed:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except sqlite3.Error as e:
+                logger.warning(f"セッションストアへの書き込みに失敗しました（次回再試行します）: {e}")
+
+    def close(self):
+        """書き込みスレッドを止め、まだ書き込んでいない内容を書き込む"""
+        self._closed = True
+        self._wake.set()
+        self.flush()
@@ -0,0 +1,11 @@
+"""
+このファイルは、テストの共通設定を定義するファイルです。
+アプリのモジュールはリポジトリ直下に置かれているため、リポジトリ直下をインポートの検索先に追加します。
+"""
+
+# 環境変数・ファイルパスを操作するモジュール
+import os
+# インポートの検索先を操作するためのモジュール
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,89 @@
+"""
+このファイルは、answer_cache.py（回答キャッシュ）のテストを定義するファイルです。
+"""
+
+# 処理時間を扱うためのモジュール
+import time
+# テストフレームワーク
+import pytest
+# （自作）回答キャッシュ
+from answer_cache import AnswerCache, normalize_query
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, "monotonic", lambda: now[0])
+    return now
+
+
+def put(cache, query, fingerprints=None, mode="社内文書検索", query_vector=None):
+    cache.put(mode, query, f"{query}の回答", [], fingerprints or {}, query_vector=query_vector)
+
+
+def manifest(**content_hashes):
+    return {"pages": {page_id: {"content_hash": content_hash} for page_id, content_hash in content_hashes.items()}}
+
+
+def test_normalized_queries_share_an_entry():
+    cache = AnswerCache()
+    put(cache, "有給休暇の申請方法は？")
+    assert normalize_query("  有給休暇の申請方法は?") == normalize_query("有給休暇の申請方法は？")
+    assert cache.get("社内文書検索", "有給休暇の申請方法は") == {"answer": "有給休暇の申請方法は？の回答", "sources": []}
+    # モードが違う場合は別の質問として扱う
+    assert cache.get("社内問い合わせ", "有給休暇の申請方法は？") is None
+
+
+def test_entries_expire_after_ttl(clock):
+    cache = AnswerCache(ttl=60)
+    put(cache, "経費精算の締め日")
+    clock[0] += 60
+    assert cache.get("社内文書検索", "経費精算の締め日") is not None
+    clock[0] += 1
+    assert cache.get("社内文書検索", "経費精算の締め日") is None
+    assert cache.stats() == {"entries": 0, "hits": 1, "misses": 1, "hit_rate": 0.5}
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = AnswerCache(max_entries=2)
+    put(cache, "q1")
+    put(cache, "q2")
+    assert cache.get("社内文書検索", "q1") is not None
+    put(cache, "q3")
+    assert cache.get("社内文書検索", "q2") is None
+    assert cache.get("社内文書検索", "q1") is not None
+    assert cache.get("社内文書検索", "q3") is not None
+
+
+def test_similar_query_matches_above_the_threshold(clock):
+    cache = AnswerCache(similarity_threshold=0.9, ttl=60)
+    put(cache, "VPNの接続方法", query_vector=[1.0, 0.0])
+    put(cache, "VPNの接続方法", mode="社内問い合わせ", query_vector=[0.0, 1.0])
+
+    hit = cache.get("社内文書検索", "VPNにつなぐには", query_vector=[0.95, 0.1])
+    assert hit["answer"] == "VPNの接続方法の回答"
+    assert cache.get("社内文書検索", "経費精算の締め日", query_vector=[0.5, 0.5]) is None
+    # 期限切れのエントリは類似一致の対象にしない
+    clock[0] += 61
+    assert cache.get("社内文書検索", "VPNにつなぐには", query_vector=[0.95, 0.1]) is None
+
+
+def test_sync_index_drops_only_answers_citing_changed_pages():
+    cache = AnswerCache()
+    put(cache, "changed", {"p1": "h1"})
+    put(cache, "removed", {"p2": "h2"})
+    put(cache, "unchanged", {"p3": "h3"})
+    put(cache, "mixed", {"p3": "h3", "p1": "h1"})
+    cache.sync_index("gen-1", manifest(p1="h1", p2="h2", p3="h3"))
+    assert cache.stats()["entries"] == 4
+
+    # 引用していないページ（p4）の追加・変更は、回答に影響しない
+    assert cache.sync_index("gen-2", manifest(p1="h1-new", p3="h3", p4="h4")) == 3
+    assert cache.get("社内文書検索", "unchanged") is not None
+    for query in ("changed", "removed", "mixed"):
+        assert cache.get("社内文書検索", query) is None
+
+    # 同じ世代では照合し直さない
+    put(cache, "changed", {"p1": "h1"})
+    assert cache.sync_index("gen-2", manifest()) == 0
+    assert cache.get("社内文書検索", "changed") is not None
@@ -0,0 +1,164 @@
+"""
+このファイルは、concurrency.py（同じ呼び出しの共有・流量制御）のテストを定義するファイルです。
+"""
+
+# 排他制御・スレッドを扱うためのモジュール
+import threading
+# テストフレームワーク
+import pytest
+# （自作）外部APIの呼び出しを制御するモジュール
+from concurrency import BusyError, RequestLimiter, SharedStream, SingleFlight
+
+
+############################################################
+# SingleFlight
+############################################################
+
+def test_single_flight_shares_one_execution():
+    single_flight = SingleFlight()
+    started, finish = threading.Event(), threading.Event()
+    calls = []
+
+    def func():
+        calls.append(1)
+        started.set()
+        finish.wait(5)
+        return "answer"
+
+    # 共有を保持するため、後から来た呼び出しがリーダーの終了後に届いても同じ結果を受け取る
+    leader = threading.Thread(target=lambda: single_flight.do("q", func, hold=True))
+    leader.start()
+    started.wait(5)
+    results = []
+    followers = [threading.Thread(target=lambda: results.append(single_flight.do("q", func))) for _ in range(3)]
+    for thread in followers:
+        thread.start()
+    finish.set()
+    for thread in [leader, *followers]:
+        thread.join(5)
+
+    assert calls == [1]
+    assert results == [("answer", False)] * 3
+    single_flight.release("q")
+    assert len(single_flight) == 0
+
+
+def test_single_flight_shares_errors_and_retries_afterwards():
+    single_flight = SingleFlight()
+    started, finish = threading.Event(), threading.Event()
+
+    def fail():
+        started.set()
+        finish.wait(5)
+        raise ValueError("boom")
+
+    errors = []
+
+    def call():
+        try:
+            single_flight.do("q", fail)
+        except ValueError as e:
+            errors.append(str(e))
+
+    threads = [threading.Thread(target=call)]
+    threads[0].start()
+    started.wait(5)
+    threads.append(threading.Thread(target=call))
+    threads[1].start()
+    finish.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert errors == ["boom", "boom"]
+    assert single_flight.do("q", lambda: "ok") == ("ok", True)
+
+
+def test_single_flight_hold_shares_until_released():
+    single_flight = SingleFlight()
+    assert single_flight.do("q", lambda: "first", hold=True) == ("first", True)
+    assert single_flight.do("q", lambda: "second") == ("first", False)
+    single_flight.release("q")
+    assert single_flight.do("q", lambda: "second") == ("second", True)
+
+
+############################################################
+# SharedStream
+############################################################
+
+def test_shared_stream_replays_parts_to_late_subscribers():
+    release = threading.Event()
+    finished = threading.Event()
+
+    def source():
+        yield "a"
+        yield "b"
+        release.wait(5)
+        yield "c"
+
+    stream = SharedStream(source(), on_finish=finished.set)
+    early = stream.subscribe()
+    assert next(early) == "a"
+    release.set()
+    assert list(early) == ["b", "c"]
+    assert list(stream.subscribe()) == ["a", "b", "c"]
+    assert finished.wait(5)
+
+
+def test_shared_stream_raises_source_errors_after_delivered_parts():
+    def source():
+        yield "a"
+        raise RuntimeError("stream broken")
+
+    stream = SharedStream(source())
+    received = []
+    with pytest.raises(RuntimeError, match="stream broken"):
+        for part in stream.subscribe():
+            received.append(part)
+    assert received == ["a"]
+
+
+############################################################
+# RequestLimiter
+############################################################
+
+def test_limiter_rejects_when_concurrency_wait_times_out():
+    limiter = RequestLimiter("test", max_concurrency=1, requests_per_minute=6000, burst=10, timeout=0.05)
+    limiter.acquire()
+    with pytest.raises(BusyError):
+        limiter.acquire()
+    limiter.release()
+    with limiter.limit():
+        pass
+
+    stats = limiter.stats()
+    assert stats["rejected"] == 1
+    assert stats["completed"] == 2
+    assert stats["in_flight"] == 0 and stats["queued"] == 0
+
+
+def test_limiter_rejects_when_queue_is_full():
+    limiter = RequestLimiter("test", max_concurrency=1, requests_per_minute=6000, burst=10, max_queue=1)
+    limiter.acquire()
+    waiter = threading.Thread(target=lambda: (limiter.acquire(), limiter.release()))
+    waiter.start()
+    for _ in range(200):
+        if limiter.stats()["queued"] == 1:
+            break
+        threading.Event().wait(0.005)
+
+    with pytest.raises(BusyError):
+        limiter.acquire()
+    limiter.release()
+    waiter.join(5)
+    assert limiter.stats()["max_queued"] == 1
+
+
+def test_limiter_token_bucket_limits_bursts():
+    limiter = RequestLimiter("test", max_concurrency=10, requests_per_minute=60, burst=2, timeout=0.1)
+    for _ in range(2):
+        with limiter.limit():
+            pass
+    # 容量を使い切った後は、次のトークンの補充（1秒後）を期限内に待てないため断る
+    with pytest.raises(BusyError):
+        limiter.acquire()
+    assert limiter.stats()["in_flight"] == 0
@@ -0,0 +1,68 @@
+"""
+このファイルは、context_builder.py（コンテキストの組み立て）のテストを定義するファイルです。
+トークナイザーはネットワークなしで使える文字数の見積もり（CharacterEncoding）に差し替えて検証します。
+"""
+
+# テストフレームワーク
+import pytest
+# LangChainのDocumentクラス
+from langchain_core.documents import Document
+# （自作）コンテキストの組み立て
+import context_builder
+from context_builder import CharacterEncoding, build_context, merge_adjacent_chunks
+
+
+@pytest.fixture(autouse=True)
+def character_encoding(monkeypatch):
+    monkeypatch.setattr(context_builder, "get_encoding", lambda model_name=None: CharacterEncoding())
+
+
+def doc(text, page_id=None, chunk_index=None):
+    return Document(page_content=text, metadata={"page_id": page_id, "chunk_index": chunk_index})
+
+
+def test_character_encoding_estimates_and_round_trips():
+    encoding = CharacterEncoding()
+    assert len(encoding.encode("abcdefgh")) == 2
+    assert len(encoding.encode("有給休暇")) == 4
+    text = "VPNの接続方法 for remote work"
+    assert encoding.decode(encoding.encode(text)) == text
+
+
+def test_get_encoding_falls_back_when_tokenizer_cannot_be_loaded(monkeypatch):
+    def fail(*args, **kwargs):
+        raise ConnectionError("offline")
+
+    monkeypatch.undo()
+    monkeypatch.setattr(context_builder.tiktoken, "encoding_for_model", fail)
+    context_builder.get_encoding.cache_clear()
+    try:
+        assert isinstance(context_builder.get_encoding("offline-model"), CharacterEncoding)
+    finally:
+        context_builder.get_encoding.cache_clear()
+
+
+def test_build_context_packs_by_relevance_within_limit():
+    context, tokens = build_context([doc("あ" * 6, "p1"), doc("い" * 6, "p2"), doc("う" * 3, "p3")], max_tokens=10)
+    # 2件目は収まらないため読み飛ばし、収まる3件目を詰める（区切りの改行は1トークン）
+    assert context == "あ" * 6 + "\n\n" + "う" * 3
+    assert tokens == 10
+
+
+def test_build_context_truncates_only_the_most_relevant_document():
+    context, tokens = build_context([doc("あ" * 20, "p1"), doc("い" * 3, "p2")], max_tokens=8)
+    assert context == "あ" * 8
+    assert tokens == 8
+
+
+def test_build_context_skips_near_duplicates():
+    text = "有給休暇は入社半年後に10日付与されます。"
+    context, _ = build_context([doc(text, "p1"), doc(text + "。", "p2")], max_tokens=100)
+    assert context == text
+
+
+def test_adjacent_chunks_are_merged_without_overlap():
+    head = "有給休暇は入社半年後に付与されます。付与日数は勤続年数に応じて"
+    tail = "付与日数は勤続年数に応じて増え、最大20日です。"
+    merged = merge_adjacent_chunks([doc(tail, "p1", 1), doc("別のページ", "p2", 0), doc(head, "p1", 0)])
+    assert merged == ["有給休暇は入社半年後に付与されます。付与日数は勤続年数に応じて増え、最大20日です。", "別のページ"]
@@ -0,0 +1,80 @@
+"""
+このファイルは、embedding_cache.py（Embeddingキャッシュ）のテストを定義するファイルです。
+"""
+
+# SQLiteを扱うためのモジュール
+import sqlite3
+# テストフレームワーク
+import pytest
+# LangChainのEmbeddingsの基底クラス
+from langchain_core.embeddings import Embeddings
+# （自作）Embeddingキャッシュ
+from embedding_cache import CachedEmbeddings
+# 固定値・変数を定義しているファイル
+import constants as ct
+
+
+class CountingEmbeddings(Embeddings):
+    """Embeddingしたテキストを記録するEmbeddingモデル"""
+
+    def __init__(self):
+        self.calls = []
+
+    def embed_documents(self, texts):
+        self.calls.append(list(texts))
+        return [[float(len(text)), 1.0] for text in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+@pytest.fixture
+def cache_path(tmp_path):
+    return str(tmp_path / "embedding_cache.sqlite3")
+
+
+def last_used(cache_path):
+    with sqlite3.connect(cache_path) as conn:
+        return sorted(row[0] for row in conn.execute("SELECT last_used FROM embeddings"))
+
+
+def test_documents_are_embedded_once_and_reused(cache_path):
+    model = CountingEmbeddings()
+    cache = CachedEmbeddings(model, "test", cache_path)
+    assert cache.embed_documents(["a", "bb", "a"]) == [[1.0, 1.0], [2.0, 1.0], [1.0, 1.0]]
+    assert cache.embed_documents(["bb", "ccc"]) == [[2.0, 1.0], [3.0, 1.0]]
+    assert model.calls == [["a", "bb"], ["ccc"]]
+
+    # 別のプロセスで開き直しても、保存済みのEmbeddingを使う
+    reopened_model = CountingEmbeddings()
+    reopened = CachedEmbeddings(reopened_model, "test", cache_path)
+    assert reopened.embed_documents(["a", "ccc"]) == [[1.0, 1.0], [3.0, 1.0]]
+    assert reopened_model.calls == []
+
+
+def test_lookups_defer_last_used_updates(cache_path, monkeypatch):
+    monkeypatch.setattr(ct, "EMBEDDING_CACHE_TOUCH_BATCH", 3)
+    cache = CachedEmbeddings(CountingEmbeddings(), "test", cache_path)
+    cache.embed_documents(["a", "b", "c"])
+    saved = last_used(cache_path)
+
+    # 見つからないキーのみの問い合わせや、件数がたまるまでの利用では書き込まない
+    cache._get_many(["missing"])
+    cache.embed_documents(["a", "b"])
+    assert last_used(cache_path) == saved
+    cache.embed_documents(["c"])
+    assert last_used(cache_path) != saved
+
+    cache.embed_documents(["a"])
+    cache.flush()
+    assert max(last_used(cache_path)) > max(saved)
+
+
+def test_query_embeddings_use_only_the_in_memory_lru(cache_path):
+    model = CountingEmbeddings()
+    cache = CachedEmbeddings(model, "test", cache_path, query_cache_size=2)
+    for query in ["q1", "q2", "q1", "q3", "q2"]:
+        cache.embed_query(query)
+    # q2はq3の追加時に最も古いため追い出され、もう一度Embeddingする
+    assert model.calls == [["q1"], ["q2"], ["q3"], ["q2"]]
+    assert last_used(cache_path) == []
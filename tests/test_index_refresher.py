@@ -0,0 +1,147 @@
+"""
+このファイルは、index_refresher.py（インデックスの差し替え）とindex_store.py（世代の公開・削除）のテストを定義するファイルです。
+"""
+
+# 環境変数・ファイルパスを操作するモジュール
+import os
+# テストフレームワーク
+import pytest
+# （自作）インデックスの世代管理を行うモジュール
+import index_store
+# （自作）検索に使うインデックスの保持・定期更新
+from index_refresher import ActiveIndex, IndexRefresher
+# （自作）Notionとベクターストアの差分同期を行うモジュール
+import notion_sync
+# （自作）ローカルのEmbeddingモデル
+from embedding_cache import LocalHashEmbeddings
+# （自作）Notion APIの代わりにフィクスチャを返すローダー
+from fixture_loader import FixtureNotionLoader
+# 固定値・変数を定義しているファイル
+import constants as ct
+
+
+@pytest.fixture(autouse=True)
+def index_root(tmp_path, monkeypatch):
+    monkeypatch.setattr(ct, "CHROMA_DIR", str(tmp_path))
+    os.makedirs(index_store.get_generations_dir())
+    return tmp_path
+
+
+def make_generation(generation):
+    os.makedirs(os.path.join(index_store.get_generations_dir(), generation))
+    return os.path.join(index_store.get_generations_dir(), generation)
+
+
+def make_refresher(active_index, load_index=None, build_index=None):
+    return IndexRefresher(
+        get_active_index=lambda: active_index,
+        load_index=load_index or (lambda index_dir: {"index_dir": index_dir}),
+        build_index=build_index,
+        interval=60
+    )
+
+
+def test_swap_replaces_the_snapshot_and_returns_the_previous_one():
+    active_index = ActiveIndex({"index_dir": "old"})
+    held = active_index.current
+    assert active_index.swap({"index_dir": "new"}) is held
+    assert active_index.current == {"index_dir": "new"}
+    # 差し替え前に受け取った組は、そのまま使い続けられる
+    assert held == {"index_dir": "old"}
+
+
+def test_refresher_swaps_to_the_published_generation():
+    old_dir = make_generation("20260101000000")
+    new_dir = make_generation("20260102000000")
+    index_store.publish_generation("20260101000000")
+    active_index = ActiveIndex({"index_dir": old_dir})
+    refresher = make_refresher(active_index)
+
+    assert not refresher.run_once()
+    index_store.publish_generation("20260102000000")
+    assert refresher.run_once()
+    assert active_index.current["index_dir"] == new_dir
+
+
+def test_refresher_keeps_the_current_index_when_loading_fails():
+    old_dir = make_generation("20260101000000")
+    make_generation("20260102000000")
+    index_store.publish_generation("20260102000000")
+    active_index = ActiveIndex({"index_dir": old_dir})
+
+    def fail(index_dir):
+        raise OSError("broken")
+
+    assert not make_refresher(active_index, load_index=fail).run_once()
+    assert active_index.current["index_dir"] == old_dir
+
+
+def test_refresher_builds_only_when_the_published_generation_is_old():
+    current_dir = make_generation("20260101000000")
+    index_store.publish_generation("20260101000000")
+    calls = []
+
+    def build():
+        calls.append(1)
+        raise index_store.BuildInProgressError("busy")
+
+    refresher = make_refresher(ActiveIndex({"index_dir": current_dir}), build_index=build)
+    refresher.run_once()
+    assert calls == []
+
+    set_age(ct.INDEX_CURRENT_FILE, 120)
+    # 別のプロセスが構築中の場合は見送り、例外は外に出さない
+    refresher.run_once()
+    assert calls == [1]
+
+    # 変更がないことを確認した直後は、公開が古くても構築しない
+    index_store.record_checked()
+    refresher.run_once()
+    assert calls == [1]
+    set_age(ct.INDEX_CHECKED_FILE, 120)
+    refresher.run_once()
+    assert calls == [1, 1]
+
+
+def set_age(file_name, seconds):
+    path = os.path.join(ct.CHROMA_DIR, file_name)
+    modified_at = os.path.getmtime(path) - seconds
+    os.utime(path, (modified_at, modified_at))
+
+
+def test_incremental_refresh_without_changes_does_not_publish(monkeypatch):
+    monkeypatch.setenv("VECTOR_STORE_BACKEND", "local")
+    pages = [
+        {"id": f"p{i}", "title": f"ページ{i}", "last_edited_time": "2026-01-01T00:00:00Z", "content": f"本文{i}"}
+        for i in range(3)
+    ]
+    embeddings = LocalHashEmbeddings()
+    splitter = notion_sync.create_text_splitter()
+    first = index_store.refresh_index(embeddings, FixtureNotionLoader(pages), splitter)
+    assert first["published"]
+
+    result = index_store.refresh_index(embeddings, FixtureNotionLoader(pages), splitter)
+    assert not result["published"]
+    assert result["generation"] == first["generation"]
+    assert result["chunk_count"] == first["chunk_count"]
+    assert os.listdir(index_store.get_generations_dir()) == [first["generation"]]
+    assert os.path.exists(os.path.join(ct.CHROMA_DIR, ct.INDEX_CHECKED_FILE))
+
+    # 削除したページがある場合は新しい世代を公開する
+    result = index_store.refresh_index(embeddings, FixtureNotionLoader(pages[:2]), splitter)
+    assert result["published"] and result["stats"]["deleted"] == 1
+    assert index_store.get_current_generation() == result["generation"] != first["generation"]
+
+
+def test_prune_keeps_the_newest_generations_and_the_published_one(monkeypatch):
+    monkeypatch.setattr(ct, "INDEX_KEEP_GENERATIONS", 2)
+    for day in range(1, 6):
+        make_generation(f"2026010{day}000000")
+    index_store.publish_generation("20260101000000")
+
+    index_store.prune_generations()
+
+    assert sorted(os.listdir(index_store.get_generations_dir())) == [
+        "20260101000000", "20260104000000", "20260105000000"
+    ]
+    assert index_store.get_current_generation() == "20260101000000"
@@ -0,0 +1,67 @@
+"""
+このファイルは、lexical_index.py（BM25の転置インデックス）のテストを定義するファイルです。
+"""
+
+# テストフレームワーク
+import pytest
+# （自作）BM25の転置インデックス
+from lexical_index import LexicalIndex, tokenize
+
+
+def test_tokenize_uses_bigrams_for_japanese_and_words_for_ascii():
+    assert tokenize("有給休暇") == ["有給", "給休", "休暇"]
+    assert tokenize("VPN-01の設定") == ["vpn-01", "の設", "設定"]
+    assert tokenize("ＶＰＮ　接続") == ["vpn", "接続"]
+    assert tokenize("字") == ["字"]
+    assert tokenize("…、。") == []
+
+
+def make_index(index=None):
+    index = index if index is not None else LexicalIndex()
+    index.add("a", "有給休暇の申請は勤怠システムから行います。", {"title": "有給休暇"})
+    index.add("b", "VPN-01の接続手順を説明します。", {"title": "VPN"})
+    index.add("c", "経費精算の締め日は毎月25日です。", {"title": "経費"})
+    index.add("d", "勤怠システムの使い方。", {"title": "勤怠"})
+    return index
+
+
+def test_search_ranks_matching_chunks_by_bm25():
+    index = make_index()
+    assert [chunk_id for chunk_id, _ in index.search("有給休暇の申請", 2)][0] == "a"
+    assert [chunk_id for chunk_id, _ in index.search("vpn-01", 5)] == ["b"]
+    assert index.search("存在しない語", 5) == []
+
+
+def test_remove_and_replace_update_postings():
+    index = make_index()
+    index.remove("b")
+    assert index.search("vpn-01", 5) == []
+    index.add("a", "VPN-01の再設定", {})
+    assert [chunk_id for chunk_id, _ in index.search("vpn-01", 5)] == ["a"]
+    assert index.search("有給休暇", 5) == []
+    assert len(index) == 3
+
+
+def test_save_and_open_round_trip(tmp_path):
+    path = str(tmp_path / "lexical.sqlite3")
+    index = make_index(LexicalIndex.open(path))
+    index.save()
+    reopened = LexicalIndex.open(path)
+    assert len(reopened) == 4
+    assert reopened.search("経費精算", 1) == index.search("経費精算", 1)
+    assert reopened.get_document("c").metadata == {"title": "経費"}
+
+
+def test_changes_are_written_only_when_saved(tmp_path):
+    path = str(tmp_path / "lexical.sqlite3")
+    index = make_index(LexicalIndex.open(path))
+    index.save()
+    index.remove("a")
+    index.add("e", "新しいチャンク", {})
+    # 保存前に中断した変更は、開き直すと残っていない
+    index.close()
+    reopened = LexicalIndex.open(path)
+    assert len(reopened) == 4
+    assert [chunk_id for chunk_id, _ in reopened.search("有給休暇", 1)] == ["a"]
+    with pytest.raises(KeyError):
+        reopened.get_document("e")
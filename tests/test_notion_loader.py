@@ -0,0 +1,134 @@
+"""
+このファイルは、notion_loader.py（Notionデータベースの非同期ローダー）のテストを定義するファイルです。
+Notion APIはhttpx.MockTransportで置き換え、ネットワークに接続せずに検証します。
+"""
+
+# 非同期処理を行うためのモジュール
+import asyncio
+# JSONデータを扱うためのモジュール
+import json
+# HTTPリクエストを行うためのモジュール
+import httpx
+# テストフレームワーク
+import pytest
+# （自作）外部サービスとの通信に使うHTTPクライアント
+import http_clients
+# （自作）Notionデータベースの非同期ローダー
+from notion_loader import AsyncNotionDBLoader
+# 固定値・変数を定義しているファイル
+import constants as ct
+
+
+def make_loader(monkeypatch, handler, **kwargs):
+    def create_client(base_url, headers, timeout=None):
+        return httpx.AsyncClient(base_url=base_url, headers=headers, transport=httpx.MockTransport(handler))
+
+    monkeypatch.setattr(http_clients, "create_notion_async_client", create_client)
+    kwargs.setdefault("requests_per_second", 1000)
+    return AsyncNotionDBLoader("token", "db", base_url="https://notion.test/v1", **kwargs)
+
+
+def block(block_id, text, has_children=False):
+    return {
+        "id": block_id,
+        "type": "paragraph",
+        "has_children": has_children,
+        "paragraph": {"rich_text": [{"text": {"content": text}}]},
+    }
+
+
+def page_summary(page_id):
+    return {
+        "id": page_id,
+        "last_edited_time": "2026-01-01T00:00:00.000Z",
+        "properties": {"タイトル": {"type": "title", "title": [{"plain_text": f"ページ{page_id}"}]}},
+    }
+
+
+def test_pages_and_blocks_are_read_across_all_result_pages(monkeypatch):
+    cursors = []
+
+    def handler(request):
+        if request.url.path == "/v1/databases/db/query":
+            cursor = json.loads(request.content).get("start_cursor")
+            cursors.append(cursor)
+            if cursor is None:
+                return httpx.Response(200, json={"results": [page_summary("p1"), page_summary("p2")],
+                                                 "has_more": True, "next_cursor": "c1"})
+            return httpx.Response(200, json={"results": [page_summary("p3")], "has_more": False})
+        if request.url.path == "/v1/blocks/p1/children":
+            if "start_cursor" not in request.url.params:
+                return httpx.Response(200, json={"results": [block("b1", "一行目", has_children=True)],
+                                                 "has_more": True, "next_cursor": "c2"})
+            return httpx.Response(200, json={"results": [block("b2", "三行目")], "has_more": False})
+        if request.url.path == "/v1/blocks/b1/children":
+            return httpx.Response(200, json={"results": [block("b3", "二行目")], "has_more": False})
+        return httpx.Response(404)
+
+    loader = make_loader(monkeypatch, handler)
+    summaries = loader.retrieve_page_summaries()
+    assert [summary["id"] for summary in summaries] == ["p1", "p2", "p3"]
+    assert cursors == [None, "c1"]
+
+    docs = list(loader.lazy_load_pages(summaries[:1]))
+    assert docs[0].page_content == "一行目\n\t二行目\n三行目"
+    assert docs[0].metadata == {"タイトル": "ページp1", "id": "p1"}
+
+
+def test_blocks_are_fetched_concurrently_within_the_limit(monkeypatch):
+    in_flight = 0
+    max_in_flight = 0
+
+    async def handler(request):
+        nonlocal in_flight, max_in_flight
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        await asyncio.sleep(0.02)
+        in_flight -= 1
+        page_id = request.url.path.split("/")[3]
+        return httpx.Response(200, json={"results": [block(f"{page_id}-b", page_id)], "has_more": False})
+
+    loader = make_loader(monkeypatch, handler, max_concurrency=3)
+    docs = list(loader.lazy_load_pages([page_summary(f"p{i}") for i in range(9)]))
+
+    assert sorted(doc.page_content for doc in docs) == sorted(f"p{i}" for i in range(9))
+    assert 1 < max_in_flight <= 3
+
+
+def test_all_requests_pause_for_retry_after_on_429(monkeypatch):
+    request_times = []
+
+    def handler(request):
+        request_times.append(asyncio.get_running_loop().time())
+        if len(request_times) == 1:
+            return httpx.Response(429, headers={"Retry-After": "0.2"})
+        return httpx.Response(200, json={"results": [block("b", "本文")], "has_more": False})
+
+    loader = make_loader(monkeypatch, handler, max_concurrency=1)
+    docs = list(loader.lazy_load_pages([page_summary("p1"), page_summary("p2")]))
+
+    assert sorted(doc.metadata["id"] for doc in docs) == ["p1", "p2"]
+    # 429を受けた後は、リトライ以外のリクエストもRetry-Afterの間は送らない
+    assert len(request_times) == 3
+    assert min(request_times[1:]) - request_times[0] >= 0.2
+
+
+def test_transport_errors_are_retried_with_backoff(monkeypatch):
+    monkeypatch.setattr(ct, "NOTION_RETRY_BASE_DELAY", 0.05)
+    attempts = []
+
+    def handler(request):
+        attempts.append(request.url.path)
+        if len(attempts) == 1:
+            raise httpx.ConnectError("connection reset", request=request)
+        return httpx.Response(200, json={"results": [page_summary("p1")], "has_more": False})
+
+    loader = make_loader(monkeypatch, handler)
+    assert [summary["id"] for summary in loader.retrieve_page_summaries()] == ["p1"]
+    assert len(attempts) == 2
+
+    def fail(request):
+        raise httpx.ConnectError("connection refused", request=request)
+
+    with pytest.raises(httpx.ConnectError):
+        make_loader(monkeypatch, fail, max_retries=1).retrieve_page_summaries()
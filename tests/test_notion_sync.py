@@ -0,0 +1,155 @@
+"""
+このファイルは、notion_sync.py（Notionとベクターストアの差分同期）のテストを定義するファイルです。
+Notion APIはフィクスチャのローダー、EmbeddingモデルはローカルのLocalHashEmbeddingsで置き換えて検証します。
+"""
+
+# テストフレームワーク
+import pytest
+# （自作）Notionとベクターストアの差分同期を行うモジュール
+import notion_sync
+# （自作）ローカルのEmbeddingモデル
+from embedding_cache import LocalHashEmbeddings
+# （自作）Notion APIの代わりにフィクスチャを返すローダー
+from fixture_loader import FixtureNotionLoader
+# （自作）BM25の転置インデックス
+from lexical_index import LexicalIndex, get_lexical_index_path
+# （自作）ベクターストア
+from vector_stores import LocalVectorStore
+# 固定値・変数を定義しているファイル
+import constants as ct
+
+
+class CountingEmbeddings(LocalHashEmbeddings):
+    """Embeddingしたテキストを記録するEmbeddingモデル"""
+
+    def __init__(self):
+        super().__init__()
+        self.texts = []
+
+    def embed_documents(self, texts):
+        self.texts.extend(texts)
+        return super().embed_documents(texts)
+
+
+class RecordingLoader(FixtureNotionLoader):
+    """本文を読み込んだページを記録し、アーカイブ済みのページや読み込みの失敗を再現するローダー"""
+
+    def __init__(self, pages, archived=(), fail_after=None):
+        super().__init__(pages)
+        self.archived = set(archived)
+        self.fail_after = fail_after
+        self.loaded = []
+
+    def retrieve_page_summaries(self):
+        summaries = super().retrieve_page_summaries()
+        for summary in summaries:
+            summary["archived"] = summary["id"] in self.archived
+        return summaries
+
+    def lazy_load_pages(self, page_summaries):
+        for doc in super().lazy_load_pages(page_summaries):
+            if self.fail_after is not None and len(self.loaded) == self.fail_after:
+                raise ConnectionError("Notion API unavailable")
+            self.loaded.append(doc.metadata["id"])
+            yield doc
+
+
+def make_pages(count):
+    return [
+        {
+            "id": f"p{i}",
+            "title": f"ページ{i}",
+            "last_edited_time": "2026-01-01T00:00:00.000Z",
+            "content": f"ページ{i}の本文です。" * 3,
+        }
+        for i in range(count)
+    ]
+
+
+@pytest.fixture
+def index_dir(tmp_path):
+    return str(tmp_path)
+
+
+def sync(index_dir, loader, embeddings=None):
+    vectorstore = LocalVectorStore(index_dir, embeddings or CountingEmbeddings(), index_type="flat")
+    lexical_index = LexicalIndex.open(get_lexical_index_path(index_dir))
+    stats = notion_sync.sync_vectorstore(
+        vectorstore,
+        loader,
+        notion_sync.create_text_splitter(),
+        notion_sync.get_manifest_path(index_dir),
+        lexical_index=lexical_index
+    )
+    return stats, vectorstore, lexical_index
+
+
+def load_pages(index_dir):
+    return notion_sync.load_manifest(notion_sync.get_manifest_path(index_dir))["pages"]
+
+
+def test_pages_with_unchanged_last_edited_time_are_skipped(index_dir):
+    pages = make_pages(3)
+    stats, _, _ = sync(index_dir, RecordingLoader(pages))
+    assert stats == {"added": 3, "updated": 0, "unchanged": 0, "deleted": 0}
+
+    pages[1] = {**pages[1], "last_edited_time": "2026-01-02T00:00:00.000Z", "content": "書き換えた本文"}
+    loader = RecordingLoader(pages)
+    stats, vectorstore, lexical_index = sync(index_dir, loader)
+
+    assert loader.loaded == ["p1"]
+    assert stats == {"added": 0, "updated": 1, "unchanged": 0, "deleted": 0}
+    assert [doc.metadata["id"] for doc, _ in vectorstore.similarity_search_with_score("書き換えた本文", k=1)] == ["p1"]
+    assert [chunk_id for chunk_id, _ in lexical_index.search("書き換えた", 1)] == ["p1-0"]
+
+
+def test_pages_with_the_same_content_hash_are_not_embedded_again(index_dir):
+    pages = make_pages(2)
+    sync(index_dir, RecordingLoader(pages))
+    chunk_ids = load_pages(index_dir)["p0"]["chunk_ids"]
+
+    pages[0] = {**pages[0], "last_edited_time": "2026-01-02T00:00:00.000Z"}
+    embeddings = CountingEmbeddings()
+    stats, _, _ = sync(index_dir, RecordingLoader(pages), embeddings)
+
+    assert stats == {"added": 0, "updated": 0, "unchanged": 1, "deleted": 0}
+    assert embeddings.texts == []
+    entry = load_pages(index_dir)["p0"]
+    assert entry["last_edited_time"] == "2026-01-02T00:00:00.000Z"
+    assert entry["chunk_ids"] == chunk_ids
+
+
+def test_archived_and_missing_pages_are_deleted(index_dir):
+    pages = make_pages(4)
+    sync(index_dir, RecordingLoader(pages))
+
+    stats, vectorstore, lexical_index = sync(index_dir, RecordingLoader(pages[:3], archived={"p2"}))
+
+    assert stats == {"added": 0, "updated": 0, "unchanged": 0, "deleted": 2}
+    assert sorted(load_pages(index_dir)) == ["p0", "p1"]
+    ids = vectorstore.get(include=[])["ids"]
+    assert not [chunk_id for chunk_id in ids if chunk_id.startswith(("p2-", "p3-"))]
+    assert len(lexical_index) == vectorstore.count() == len(ids)
+
+
+def test_interrupted_sync_resumes_from_the_last_commit(index_dir, monkeypatch):
+    # 1ページごとにバッチを作り、バッチごとにコミットする
+    monkeypatch.setattr(ct, "INGEST_BATCH_SIZE", 1)
+    monkeypatch.setattr(ct, "INGEST_COMMIT_INTERVAL", 0)
+    pages = make_pages(5)
+
+    with pytest.raises(ConnectionError):
+        sync(index_dir, RecordingLoader(pages, fail_after=3))
+    committed = set(load_pages(index_dir))
+    assert committed and committed < {page["id"] for page in pages}
+
+    # 別のプロセスで開き直し、コミットされていないページのみを読み込む
+    loader = RecordingLoader(pages)
+    stats, vectorstore, lexical_index = sync(index_dir, loader)
+
+    assert sorted(loader.loaded) == sorted({page["id"] for page in pages} - committed)
+    assert stats["added"] == len(pages) - len(committed)
+    manifest_pages = load_pages(index_dir)
+    assert sorted(manifest_pages) == [page["id"] for page in pages]
+    chunk_count = sum(len(entry["chunk_ids"]) for entry in manifest_pages.values())
+    assert vectorstore.count() == len(lexical_index) == chunk_count
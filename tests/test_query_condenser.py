@@ -0,0 +1,68 @@
+"""
+このファイルは、query_condenser.py（検索に使う質問文の書き換え）のテストを定義するファイルです。
+"""
+
+# テストフレームワーク
+import pytest
+# （自作）検索に使う質問文の書き換え
+from query_condenser import QueryCondenser, get_recent_history, is_follow_up
+
+HISTORY = [
+    {"role": "assistant", "content": "こんにちは！"},
+    {"role": "user", "content": "有給休暇は何日もらえますか？"},
+    {"role": "assistant", "content": "入社半年後に10日付与されます。"},
+]
+
+
+@pytest.mark.parametrize("query", [
+    "経費精算の方法は？",
+    "パスワードを忘れた",
+    "VPNの接続方法",
+    "この会社の福利厚生制度を教えてください",
+    "その他の手当について教えてください",
+])
+def test_standalone_questions_are_not_rewritten(query):
+    assert not is_follow_up(query)
+    assert QueryCondenser().condense(query, HISTORY) == query
+
+
+@pytest.mark.parametrize("query", ["契約社員の場合は？", "じゃあ派遣社員は？", "パートだと？"])
+def test_follow_up_questions_get_previous_topic(query):
+    assert QueryCondenser().condense(query, HISTORY) == f"有給休暇は何日もらえますか？ {query}"
+
+
+def test_chained_follow_up_uses_latest_standalone_question():
+    history = HISTORY + [
+        {"role": "user", "content": "契約社員の場合は？"},
+        {"role": "assistant", "content": "同じです。"},
+    ]
+    assert QueryCondenser().condense("パートだと？", history) == "有給休暇は何日もらえますか？ パートだと？"
+
+
+def test_no_history_returns_query():
+    assert QueryCondenser().condense("契約社員の場合は？", []) == "契約社員の場合は？"
+
+
+def test_history_is_capped_and_starts_with_user_turn():
+    messages = HISTORY * 5
+    history = get_recent_history(messages, max_turns=2, max_chars=5)
+    assert sum(1 for role, _ in history if role == "user") == 2
+    assert history[0][0] == "user"
+    assert all(len(content) <= 5 for _, content in history)
+
+
+def test_results_are_memoized_per_history_and_query():
+    condenser = QueryCondenser()
+    condenser.condense("契約社員の場合は？", HISTORY)
+    condenser.condense("契約社員の場合は？", HISTORY)
+    condenser.condense("契約社員の場合は？", HISTORY[:2])
+    assert (condenser.hits, condenser.misses) == (1, 2)
+
+
+def test_llm_failure_falls_back_to_rules():
+    class FailingModel:
+        def invoke(self, prompt):
+            raise RuntimeError("unavailable")
+
+    condenser = QueryCondenser(llm=FailingModel(), method="llm")
+    assert condenser.condense("契約社員の場合は？", HISTORY) == "有給休暇は何日もらえますか？ 契約社員の場合は？"
@@ -0,0 +1,40 @@
+"""
+このファイルは、retrievers.py（検索結果のページ単位の選択・統合）のテストを定義するファイルです。
+"""
+
+# LangChainのDocumentクラス
+from langchain_core.documents import Document
+# （自作）検索結果のページ単位の選択
+from retrievers import reciprocal_rank_fusion, select_by_page
+
+
+def chunk(page_id, chunk_index):
+    return Document(page_content=f"{page_id}-{chunk_index}", metadata={"page_id": page_id, "chunk_index": chunk_index})
+
+
+def contents(documents):
+    return [doc.page_content for doc in documents]
+
+
+def test_select_by_page_keeps_k_distinct_pages_in_relevance_order():
+    candidates = [chunk("a", 0), chunk("a", 1), chunk("b", 0), chunk("a", 2), chunk("c", 0), chunk("d", 0)]
+    selected = select_by_page(candidates, k=2, max_chunks_per_page=1)
+    assert contents(selected) == ["a-0", "b-0"]
+    assert [doc.metadata["page_hits"] for doc in selected] == [3, 1]
+
+
+def test_select_by_page_returns_several_chunks_of_a_page():
+    candidates = [chunk("a", 0), chunk("b", 0), chunk("a", 1), chunk("a", 2), chunk("c", 0)]
+    selected = select_by_page(candidates, k=2, max_chunks_per_page=2)
+    assert contents(selected) == ["a-0", "b-0", "a-1"]
+
+
+def test_select_by_page_keeps_page_hits_counted_before_narrowing():
+    narrowed = [Document(page_content="a-0", metadata={"page_id": "a", "page_hits": 5})]
+    assert select_by_page(narrowed, k=1)[0].metadata["page_hits"] == 5
+
+
+def test_reciprocal_rank_fusion_rewards_agreement_between_rankings():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["b", "d"]], rrf_k=60)
+    assert [chunk_id for chunk_id, _ in fused] == ["b", "a", "d", "c"]
+    assert fused[0][1] == 1 / 62 + 1 / 61
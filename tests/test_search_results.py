@@ -0,0 +1,40 @@
+"""
+このファイルは、search_results.py（LLMを使わない検索結果の一覧）のテストを定義するファイルです。
+"""
+
+# LangChainのDocumentクラス
+from langchain_core.documents import Document
+# （自作）検索結果の一覧
+from search_results import build_search_results, build_snippet, group_by_page
+
+
+def chunk(page_id, text, **metadata):
+    return Document(page_content=text, metadata={"page_id": page_id, "title": f"{page_id}のページ", **metadata})
+
+
+def test_group_by_page_lists_each_page_once_with_its_hits():
+    documents = [chunk("a", "1"), chunk("b", "2"), chunk("a", "3"), chunk("c", "4", page_hits=4)]
+    grouped = group_by_page(documents)
+    assert [(doc.page_content, hits) for doc, hits in grouped] == [("1", 2), ("2", 1), ("4", 4)]
+
+
+def test_build_search_results_uses_the_top_chunk_of_each_page():
+    documents = [chunk("a", "有給休暇の申請方法", score=0.9), chunk("a", "有給休暇の日数", score=0.5)]
+    results = build_search_results(documents, "有給休暇")
+    assert len(results) == 1
+    assert results[0]["name"] == "aのページ"
+    assert results[0]["score"] == 0.9
+    assert results[0]["hits"] == 2
+
+
+def test_build_snippet_highlights_query_terms_and_escapes_markdown():
+    snippet = build_snippet("経費精算は*月末*までに申請してください。", "経費精算")
+    assert snippet.startswith("**経費精算**")
+    assert "\\*月末\\*" in snippet
+
+
+def test_build_snippet_centers_on_the_matches():
+    text = "前置き。" * 50 + "VPNの接続方法は設定画面から行います。" + "後書き。" * 50
+    snippet = build_snippet(text, "VPN 接続", length=40)
+    assert snippet.startswith("…") and snippet.endswith("…")
+    assert "**vpn**" in snippet.lower()
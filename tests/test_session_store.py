@@ -0,0 +1,97 @@
+"""
+このファイルは、session_store.py（セッションごとの会話ログ・状態の保存）のテストを定義するファイルです。
+"""
+
+# SQLiteを扱うためのモジュール
+import sqlite3
+# 排他制御・スレッドを扱うためのモジュール
+import threading
+# テストフレームワーク
+import pytest
+# （自作）セッションストア
+from session_store import MemorySessionStore, SQLiteSessionStore
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        store = MemorySessionStore()
+    else:
+        store = SQLiteSessionStore(str(tmp_path / "sessions.sqlite3"), flush_interval=60)
+    yield store
+    store.close()
+
+
+def messages(*contents):
+    return [{"role": "user", "content": content} for content in contents]
+
+
+def test_messages_are_numbered_in_order_and_read_by_range(store):
+    store.append_messages("s1", messages("a", "b"))
+    store.append_messages("s1", messages("c"))
+    store.append_messages("s2", messages("x"))
+
+    assert store.count_messages("s1") == 3
+    assert [m["content"] for m in store.get_messages("s1", 1, 3)] == ["b", "c"]
+    assert store.get_messages("s2", 0, 10) == messages("x")
+    assert store.count_messages("missing") == 0
+
+
+def test_state_and_delete(store):
+    store.append_messages("s1", messages("a"))
+    store.set_state("s1", "mode", "社内文書検索")
+    store.set_state("s1", "mode", "社内問い合わせ")
+    assert store.get_state("s1") == {"mode": "社内問い合わせ"}
+
+    store.delete_session("s1")
+    assert store.count_messages("s1") == 0
+    assert store.get_state("s1") == {}
+
+
+def test_purge_expired_removes_only_old_sessions(store):
+    store.append_messages("s1", messages("a"))
+    assert store.purge_expired(60) == 0
+    assert store.purge_expired(-1) == 1
+    assert store.count_messages("s1") == 0
+
+
+def test_sqlite_assigns_contiguous_seq_across_connections(tmp_path):
+    # 同じファイルを開いた2つのストア（別プロセスの代わり）から、同じセッションに並行して追加する
+    path = str(tmp_path / "sessions.sqlite3")
+    stores = [SQLiteSessionStore(path, batch_size=7, flush_interval=60) for _ in range(2)]
+
+    def append(store, name):
+        for i in range(50):
+            store.append_messages("s1", messages(f"{name}{i}"))
+        store.flush()
+
+    threads = [threading.Thread(target=append, args=(store, name)) for store, name in zip(stores, "ab")]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+
+    with sqlite3.connect(path) as conn:
+        seqs = [row[0] for row in conn.execute("SELECT seq FROM messages WHERE session_id = 's1' ORDER BY seq")]
+    assert seqs == list(range(100))
+    # 各ストアのメッセージは追加した順に並ぶ
+    contents = [m["content"] for m in stores[0].get_messages("s1", 0, 100)]
+    assert [c for c in contents if c.startswith("a")] == [f"a{i}" for i in range(50)]
+    for store in stores:
+        store.close()
+
+
+def test_sqlite_purge_uses_last_update_time(tmp_path):
+    path = str(tmp_path / "sessions.sqlite3")
+    store = SQLiteSessionStore(path, flush_interval=60)
+    store.append_messages("old", messages("a"))
+    store.append_messages("new", messages("b"))
+    store.set_state("old", "mode", "社内文書検索")
+    store.flush()
+    with sqlite3.connect(path) as conn:
+        conn.execute("UPDATE sessions SET updated_at = updated_at - 3600 WHERE session_id = 'old'")
+
+    assert store.purge_expired(60) == 1
+    assert store.count_messages("old") == 0 and store.get_state("old") == {}
+    assert store.count_messages("new") == 1
+    store.close()
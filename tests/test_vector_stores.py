@@ -0,0 +1,103 @@
+"""
+このファイルは、vector_stores.py（ローカルのベクターストア）のテストを定義するファイルです。
+"""
+
+# JSONデータを扱うためのモジュール
+import json
+# 環境変数・ファイルパスを操作するモジュール
+import os
+# 数値計算を行うためのモジュール
+import numpy as np
+# （自作）ベクターストア
+from vector_stores import LocalVectorStore
+# 固定値・変数を定義しているファイル
+import constants as ct
+
+
+def make_vectors(count, dimensions=16, seed=0):
+    return np.random.default_rng(seed).normal(size=(count, dimensions)).astype(np.float32)
+
+
+def add(store, ids, vectors):
+    store.upsert(ids, vectors, [{"source": chunk_id} for chunk_id in ids], [f"本文 {chunk_id}" for chunk_id in ids])
+
+
+def segment_files(path):
+    return sorted(name for name in os.listdir(path) if name.startswith("vectors-"))
+
+
+def top_id(store, vector):
+    return store.similarity_search_by_vector_with_score(vector, k=1)[0][0].metadata["source"]
+
+
+def test_persist_appends_a_segment_without_rewriting_saved_vectors(tmp_path):
+    store = LocalVectorStore(str(tmp_path), None, index_type="flat")
+    vectors = make_vectors(20)
+    add(store, [f"c{i}" for i in range(10)], vectors[:10])
+    store.persist()
+    first = segment_files(tmp_path)
+    first_mtime = os.path.getmtime(tmp_path / first[0])
+
+    store.delete(["c0", "c1"])
+    add(store, ["c2"] + [f"c{i}" for i in range(10, 20)], vectors[[2] + list(range(10, 20))])
+    store.persist()
+
+    files = segment_files(tmp_path)
+    assert len(files) == 2 and first[0] in files
+    assert os.path.getmtime(tmp_path / first[0]) == first_mtime
+    assert store.count() == 18
+    # 削除・置き換えた行は検索結果に出ない
+    results = store.similarity_search_by_vector_with_score(vectors[0], k=20)
+    ids = [doc.metadata["source"] for doc, _ in results]
+    assert "c0" not in ids and "c1" not in ids and ids.count("c2") == 1
+    assert top_id(store, vectors[15]) == "c15"
+
+
+def test_count_includes_unsaved_changes(tmp_path):
+    store = LocalVectorStore(str(tmp_path), None, index_type="flat")
+    vectors = make_vectors(5)
+    add(store, ["a", "b", "c"], vectors[:3])
+    store.persist()
+    store.delete(["a", "missing"])
+    add(store, ["b", "d"], vectors[3:5])
+    assert store.count() == 3
+    assert sorted(store.get(include=[])["ids"]) == ["b", "c", "d"]
+
+
+def test_compact_merges_segments_and_builds_ivf(tmp_path, monkeypatch):
+    monkeypatch.setattr(ct, "LOCAL_VECTOR_IVF_MIN_ROWS", 50)
+    monkeypatch.setattr(ct, "LOCAL_VECTOR_IVF_NPROBE", 100)
+    store = LocalVectorStore(str(tmp_path), None, index_type="ivf")
+    vectors = make_vectors(300)
+    for start in range(0, 300, 100):
+        add(store, [f"c{i}" for i in range(start, start + 100)], vectors[start:start + 100])
+        store.persist()
+    store.delete([f"c{i}" for i in range(0, 300, 3)])
+    store.persist()
+    assert len(segment_files(tmp_path)) == 3
+
+    store.compact()
+
+    assert len(segment_files(tmp_path)) == 1
+    assert len([name for name in os.listdir(tmp_path) if name.startswith("ivf-centroids-")]) == 1
+    reopened = LocalVectorStore(str(tmp_path), None, index_type="ivf")
+    assert reopened.count() == 200
+    for i in (1, 2, 100, 299):
+        assert top_id(reopened, vectors[i]) == f"c{i}"
+    assert "c3" not in reopened.get(include=[])["ids"]
+
+
+def test_compact_without_changes_keeps_the_segment(tmp_path):
+    store = LocalVectorStore(str(tmp_path), None, index_type="flat")
+    add(store, ["a", "b"], make_vectors(2))
+    store.compact()
+    files = segment_files(tmp_path)
+    store.compact()
+    assert segment_files(tmp_path) == files
+
+
+def test_store_of_previous_format_is_not_opened(tmp_path):
+    with open(tmp_path / ct.LOCAL_VECTOR_MANIFEST_FILE, "w", encoding="utf-8") as f:
+        json.dump({"version": "old", "count": 1, "dimensions": 16, "index_type": "flat"}, f)
+    assert not LocalVectorStore.exists(str(tmp_path))
+    assert LocalVectorStore(str(tmp_path), None).count() == 0
@@ -0,0 +1,138 @@
+"""
+このファイルは、リクエストごとのトレース（logs/trace.jsonl）を集計し、処理段ごとの所要時間の
+パーセンタイル（p50/p95/p99）を表示するコマンドです。
+
+使い方:
+    python trace_report.py                      # logs/trace.jsonl を集計
+    python trace_report.py path/to/trace.jsonl  # 指定したファイルを集計
+    python trace_report.py --mode 社内問い合わせ  # 指定したモードのリクエストのみ集計
+"""
+
+############################################################
+# 1. ライブラリの読み込み
+############################################################
+# 環境変数・ファイルパスを操作するモジュール
+import os
+# コマンドライン引数を扱うためのモジュール
+import argparse
+# JSONデータを扱うためのモジュール
+import json
+# 数値計算を行うためのモジュール
+import math
+# 標準出力・終了コードを扱うためのモジュール
+import sys
+# 固定値・変数を定義しているファイル
+import constants as ct
+
+
+############################################################
+# 2. 集計処理
+############################################################
+
+def load_traces(paths, mode=None):
+    """
+    トレースのファイルを読み込む関数（壊れた行は読み飛ばす）
+
+    Args:
+        paths: トレースのファイルパスのリスト
+        mode: 指定した場合、このモードのトレースのみを返す
+
+    Returns:
+        list: トレースのリスト
+    """
+    traces = []
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    trace = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if mode is None or trace.get("mode") == mode:
+                    traces.append(trace)
+    return traces
+
+
+def percentile(sorted_values, p):
+    """
+    昇順に並んだ値のパーセンタイルを求める関数（nearest-rank法）
+
+    Args:
+        sorted_values: 昇順に並んだ値のリスト
+        p: パーセンタイル（0〜100）
+
+    Returns:
+        float: パーセンタイルの値
+    """
+    rank = max(math.ceil(p / 100 * len(sorted_values)), 1)
+    return sorted_values[rank - 1]
+
+
+def summarize(traces):
+    """
+    処理段ごとの所要時間のパーセンタイルを集計する関数
+
+    Args:
+        traces: トレースのリスト
+
+    Returns:
+        dict: 処理段名と集計結果（count, p50, p95, p99, max）の辞書
+    """
+    durations = {}
+    for trace in traces:
+        for name, ms in trace.get("spans_ms", {}).items():
+            durations.setdefault(name, []).append(ms)
+
+    summary = {}
+    for name, values in durations.items():
+        values.sort()
+        summary[name] = {
+            "count": len(values),
+            "p50": percentile(values, 50),
+            "p95": percentile(values, 95),
+            "p99": percentile(values, 99),
+            "max": values[-1],
+        }
+    return summary
+
+
+############################################################
+# 3. メイン処理
+############################################################
+
+def main():
+    """トレースを集計して表示する関数"""
+    parser = argparse.ArgumentParser(description="リクエストごとのトレースを集計します")
+    parser.add_argument("paths", nargs="*", help="トレースのファイル（省略時はログディレクトリのトレース）")
+    parser.add_argument("--mode", help="集計対象のモード")
+    parser.add_argument("--json", action="store_true", help="集計結果をJSONで出力する")
+    args = parser.parse_args()
+
+    paths = args.paths or [os.path.join(ct.LOG_DIR, ct.TRACE_LOG_FILE)]
+    missing = [path for path in paths if not os.path.exists(path)]
+    if missing:
+        sys.exit(f"トレースのファイルが見つかりません: {', '.join(missing)}")
+
+    traces = load_traces(paths, args.mode)
+    if not traces:
+        sys.exit("集計対象のトレースがありません。")
+    summary = summarize(traces)
+
+    if args.json:
+        print(json.dumps(summary, ensure_ascii=False, indent=2))
+        return
+
+    # 結果の表示
+    cache_hits = sum(1 for trace in traces if trace.get("answer_cache_hit"))
+    errors = sum(1 for trace in traces if trace.get("error"))
+    print(f"リクエスト数: {len(traces)}（回答キャッシュのヒット: {cache_hits}件 / エラー: {errors}件）")
+    print(f"{'処理':<22}{'件数':>6}{'p50(ms)':>11}{'p95(ms)':>11}{'p99(ms)':>11}{'max(ms)':>11}")
+    for name, stats in sorted(summary.items(), key=lambda item: item[1]["p50"]):
+        print(
+            f"{name:<22}{stats['count']:>6}{stats['p50']:>11.1f}"
+            f"{stats['p95']:>11.1f}{stats['p99']:>11.1f}{stats['max']:>11.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+"""
+このファイルは、1回の質問に対する各処理段の所要時間を記録するトレースを定義するファイルです。
+検索・コンテキスト構築・プロンプト作成・LLM（最初のトークンまでの時間と全体）・表示の時間に加え、
+トークン数やキャッシュのヒット有無を1リクエスト1行のJSONとしてログディレクトリに出力します。
+"""
+
+############################################################
+# 1. ライブラリの読み込み
+############################################################
+# 処理時間を計測するためのモジュール
+import time
+# 日付・時刻を扱うためのモジュール
+import datetime
+# 一意なIDを作成するためのモジュール
+import uuid
+# JSONデータを扱うためのモジュール
+import json
+# ログ出力を行うためのモジュール
+import logging
+# with文で使う処理を定義するためのモジュール
+from contextlib import contextmanager
+# （自作）ログ出力の設定を行うモジュール
+import app_logging
+# 固定値・変数を定義しているファイル
+import constants as ct
+
+
+############################################################
+# 2. トレースの出力先
+############################################################
+
+def get_trace_logger():
+    """
+    トレースをJSON Lines形式で出力するロガーを取得する関数
+    （出力先の設定は、アプリのログと同じくプロセスにつき1度だけ行われる）
+
+    Returns:
+        logging.Logger: トレース用のロガー
+    """
+    app_logging.configure_logging()
+    return logging.getLogger(ct.TRACE_LOGGER_NAME)
+
+
+############################################################
+# 3. リクエストのトレース
+############################################################
+
+class RequestTrace:
+    """
+    1回の質問に対する処理段ごとの所要時間（ミリ秒）と属性を記録するトレース
+    - span(name): with文で囲んだ処理の所要時間を記録
+    - mark(name): リクエスト開始からの経過時間を記録（最初のトークンが届いた時点など）
+    - set(**attributes): トークン数・キャッシュのヒット有無などを記録
+    - finish(): 全体の所要時間を記録してログに出力
+    """
+
+    def __init__(self, query, mode):
+        """
+        Args:
+            query: ユーザーからの質問文
+            mode: 回答モード
+        """
+        self.trace_id = uuid.uuid4().hex
+        self.started_at = datetime.datetime.now(datetime.timezone.utc).isoformat()
+        self.mode = mode
+        self.query_length = len(query)
+        self.spans = {}
+        self.attributes = {}
+        self.finished = False
+        self._started = time.perf_counter()
+
+    @contextmanager
+    def span(self, name):
+        """
+        with文で囲んだ処理の所要時間を記録する（同じ名前の処理は合算する）
+
+        Args:
+            name: 処理段の名前
+        """
+        started = time.perf_counter()
+        try:
+            yield self
+        finally:
+            self.add_span(name, time.perf_counter() - started)
+
+    def add_span(self, name, seconds):
+        """
+        処理段の所要時間を記録する（同じ名前の処理は合算する）
+
+        Args:
+            name: 処理段の名前
+            seconds: 所要時間（秒）
+        """
+        self.spans[name] = self.spans.get(name, 0.0) + seconds * 1000
+
+    def mark(self, name):
+        """
+        リクエスト開始からの経過時間を記録する（既に記録済みの場合は何もしない）
+
+        Args:
+            name: 記録する時点の名前
+        """
+        if name not in self.spans:
+            self.spans[name] = (time.perf_counter() - self._started) * 1000
+
+    def set(self, **attributes):
+        """
+        トレースに属性を記録する
+
+        Args:
+            attributes: 記録する属性
+        """
+        self.attributes.update(attributes)
+
+    def finish(self, error=None):
+        """
+        全体の所要時間を記録し、トレースをログに出力する（2回目以降の呼び出しは無視する）
+
+        Args:
+            error: 処理が失敗した場合のエラー内容
+
+        Returns:
+            dict: 出力したトレース
+        """
+        if self.finished:
+            return self.to_dict()
+        self.finished = True
+        self.spans["total"] = (time.perf_counter() - self._started) * 1000
+        if error is not None:
+            self.attributes["error"] = str(error)
+        record = self.to_dict()
+        get_trace_logger().info(json.dumps(record, ensure_ascii=False))
+        return record
+
+    def to_dict(self):
+        """
+        トレースを辞書に変換する
+
+        Returns:
+            dict: トレースID・開始日時・モード・処理段ごとの所要時間（ミリ秒）・属性
+        """
+        return {
+            "trace_id": self.trace_id,
+            "started_at": self.started_at,
+            "mode": self.mode,
+            "query_length": self.query_length,
+            "spans_ms": {name: round(ms, 2) for name, ms in self.spans.items()},
+            **self.attributes,
+        }
+
+
+@contextmanager
+def span(trace, name):
+    """
+    トレースがある場合のみ所要時間を記録するwith文用の関数
+    （トレースを渡さない呼び出し元でも同じコードで使えるようにする）
+
+    Args:
+        trace: トレース（Noneの場合は何も記録しない）
+        name: 処理段の名前
+    """
+    if trace is None:
+        yield None
+        return
+    with trace.span(name):
+        yield trace
@@ -9,6 +9,8 @@
 import streamlit as st
 # ログ出力を行うためのモジュール
 import logging
+# 処理時間を計測するためのモジュール
+import time
 # 定数ファイルをインポート
 import constants as ct
 # LangChainのRAGモジュールをインポート
@@ -18,6 +20,20 @@ from langchain.prompts import PromptTemplate
 from langchain.chains import create_retrieval_chain
 # JSONデータを扱うためのモジュール
 import json
+# （自作）プロセス内で共有するリソース・回答キャッシュ・実行中の呼び出しの共有・質問文の書き換えを取得する関数
+from initialize import get_shared_resources, get_active_index, get_answer_cache, get_single_flight, get_query_condenser
+# （自作）回答キャッシュのキーと同じ質問文の正規化を行う関数
+from answer_cache import normalize_query
+# （自作）外部APIの呼び出しを制御するモジュール（同じ質問の共有・流量制御）
+import concurrency
+# （自作）Notionとベクターストアの差分同期を行うモジュール（マニフェストの読み込みに使用）
+import notion_sync
+# （自作）検索結果からコンテキストを組み立てる関数・トークン数を数える関数
+from context_builder import build_context, count_tokens
+# （自作）処理段ごとの所要時間を記録するトレース
+import tracing
+# （自作）検索結果をページ単位の一覧にする関数・ページ単位にまとめる関数
+from search_results import build_search_results, group_by_page
 
 # ロガーの設定
 logger = logging.getLogger(ct.LOGGER_NAME)
@@ -40,22 +56,144 @@ def build_error_message(message):
     return f"エラーが発生しました: {message}\n管理者にお問い合わせください。"
 
 
-def get_llm_response(query):
+def get_llm_response(query, stream=False, trace=None, summarize=False):
     """
     ユーザーの質問に対してLLMの回答を取得する関数
+    同じモード・同じ質問の呼び出しが実行中の場合は、新たに検索・LLM呼び出しを行わずにその結果を共有する
+    （ストリーミング時は、実行中の回答を最初の断片から受け取る）
+    社内文書検索モードでSEARCH_FAST_PATH_ENABLEDの場合は、LLMを使わずに検索結果の一覧を返す
+    CONDENSE_ENABLEDの場合は、直近の会話を踏まえて書き換えた質問文で検索する
+    （回答のプロンプト・回答キャッシュには元の質問文を使う）
     
     Args:
         query: ユーザーからの質問文
+        stream: Trueの場合、回答をトークン単位で返すジェネレーターとして返す
+                （関連文書の検索はこの関数内で完了している）
+        trace: 処理段ごとの所要時間・トークン数を記録するトレース（任意）
+        summarize: Trueの場合、社内文書検索モードでも検索結果をLLMに要約させる
         
     Returns:
         dict: LLMからの回答と参照情報を含む辞書
     """
-    # セッション状態からLLMとRetrieverを取得
-    llm = st.session_state.llm
-    retriever = st.session_state.retriever
+    mode = st.session_state.mode
+    # 検索に使う質問文（書き換えない場合は元の質問文）
+    retrieval_query = query
+    if ct.CONDENSE_ENABLED:
+        with tracing.span(trace, "condense"):
+            retrieval_query = get_query_condenser().condense(query, st.session_state.get("messages", []))
+        if retrieval_query != query:
+            logger.info(f"検索に使う質問文を書き換えました: {retrieval_query}")
+            if trace:
+                trace.set(condensed_query=retrieval_query)
+
+    if mode == ct.ANSWER_MODE_1 and ct.SEARCH_FAST_PATH_ENABLED and not summarize:
+        return get_search_response(query, trace=trace, retrieval_query=retrieval_query)
+
+    single_flight = get_single_flight()
+    # 書き換えた場合、同じ質問文でも会話によって検索結果が異なるため、検索に使う質問文もキーに含める
+    key = (mode, normalize_query(query), normalize_query(retrieval_query), stream)
+
+    # ストリーミング時は、回答を配信し終えるまで後から来た同じ質問にも共有する
+    response, leader = single_flight.do(
+        key,
+        lambda: generate_llm_response(
+            query, mode, stream, trace,
+            on_finish=lambda: single_flight.release(key),
+            retrieval_query=retrieval_query
+        ),
+        hold=stream
+    )
+    answer = response["answer"]
+    if not leader:
+        logger.info("実行中の同じ質問の回答を共有します")
+        if trace:
+            trace.set(coalesced=True)
+    elif stream and not isinstance(answer, concurrency.SharedStream):
+        # 回答キャッシュにヒットした場合など、配信する回答がない場合はすぐに共有を終える
+        single_flight.release(key)
+
+    if isinstance(answer, concurrency.SharedStream):
+        return {**response, "answer": answer.subscribe()}
+    return response
+
+
+def get_search_response(query, trace=None, retrieval_query=None):
+    """
+    LLMを使わずに、検索結果をページ単位の一覧として返す関数
+    
+    Args:
+        query: ユーザーからの質問文（抜粋の強調に使う）
+        trace: 処理段ごとの所要時間を記録するトレース（任意）
+        retrieval_query: 検索に使う質問文（省略時は質問文）
+        
+    Returns:
+        dict: 一覧の見出し（answer）、ページごとの抜粋・スコアを含む参照情報（sources）、
+              質問文（query）、検索結果のみであることの目印（search_only）を含む辞書
+    """
+    retriever = get_active_index()["retriever"]
+    with tracing.span(trace, "retrieval"):
+        retrieval_results = retriever.invoke(retrieval_query or query)
+    with tracing.span(trace, "search_results"):
+        results = build_search_results(retrieval_results, query)
+    logger.info(f"検索結果: {len(retrieval_results)}件のドキュメント（{len(results)}ページ）が見つかりました")
+    if trace:
+        trace.set(retrieved_documents=len(retrieval_results), result_pages=len(results), search_only=True)
+
+    if not results:
+        answer = ct.NO_RELEVANT_DOCUMENTS_MESSAGE
+    else:
+        answer = ct.SEARCH_RESULTS_MESSAGE.format(count=len(results))
+    return {
+        "answer": answer,
+        "sources": results,
+        "query": query,
+        "search_only": True
+    }
+
+
+def generate_llm_response(query, mode, stream=False, trace=None, on_finish=None, retrieval_query=None):
+    """
+    検索とLLM呼び出しを行って回答を生成する関数
+    LLMの呼び出しはプロセスで共有する流量制御の範囲内で行い、待ちきれない場合はBusyErrorを送出する
+    
+    Args:
+        query: ユーザーからの質問文
+        mode: 回答モード
+        stream: Trueの場合、回答を配信するSharedStreamを返す
+        trace: 処理段ごとの所要時間・トークン数を記録するトレース（任意）
+        on_finish: ストリーミング時、回答の配信が終わった後に呼ぶ関数
+        retrieval_query: 会話を踏まえて書き換えた、検索に使う質問文（省略時は質問文）
+                         書き換えた場合は回答が会話に依存するため、回答キャッシュを使わない
+        
+    Returns:
+        dict: LLMからの回答（ストリーミング時はSharedStream）と参照情報を含む辞書
+    """
+    retrieval_query = retrieval_query or query
+    use_answer_cache = ct.ANSWER_CACHE_ENABLED and retrieval_query == query
+    # プロセス内で共有しているLLMとRetrieverを取得
+    # （インデックスが差し替えられても、この質問は取得した時点のインデックスで最後まで処理する）
+    resources = get_shared_resources()
+    index = get_active_index()
+    llm = resources["llm"]
+    retriever = index["retriever"]
+
+    # 回答キャッシュを確認（ヒットした場合は検索・LLM呼び出しを行わない）
+    if use_answer_cache:
+        with tracing.span(trace, "answer_cache"):
+            answer_cache = get_answer_cache()
+            sync_answer_cache(answer_cache, index["index_dir"])
+            query_vector = None
+            if ct.ANSWER_CACHE_SIMILARITY_THRESHOLD is not None:
+                query_vector = resources["embeddings"].embed_query(query)
+            cached_response = answer_cache.get(mode, query, query_vector)
+        if trace:
+            trace.set(answer_cache_hit=cached_response is not None)
+        if cached_response is not None:
+            logger.info(f"回答キャッシュにヒットしました（ヒット率: {answer_cache.stats()['hit_rate']:.1%}）")
+            return cached_response
     
     # モードに応じたプロンプトテンプレートを選択
-    if st.session_state.mode == ct.ANSWER_MODE_1:
+    if mode == ct.ANSWER_MODE_1:
         # 社内文書検索モード用プロンプト
         prompt_template = PromptTemplate.from_template(ct.SEARCH_PROMPT_TEMPLATE)
     else:
@@ -63,12 +201,13 @@ def get_llm_response(query):
         prompt_template = PromptTemplate.from_template(ct.CONTACT_PROMPT_TEMPLATE)
     
     # Retrieverを使って関連ドキュメントを取得
-    retrieval_results = retriever.invoke(query)
+    with tracing.span(trace, "retrieval"):
+        retrieval_results = retriever.invoke(retrieval_query)
     logger.info(f"検索結果: {len(retrieval_results)}件のドキュメントが見つかりました")
     
-    # 検索結果からソース情報を抽出
+    # 検索結果からソース情報を抽出（同じページの複数のチャンクは1件にまとめる）
     sources = []
-    for doc in retrieval_results:
+    for doc, _ in group_by_page(retrieval_results):
         # メタデータからソース情報を取得
         metadata = doc.metadata
         source_info = {
@@ -79,14 +218,18 @@ def get_llm_response(query):
         }
         sources.append(source_info)
     
-    # コンテキストを構築
-    context = "\n\n".join([doc.page_content for doc in retrieval_results])
+    # コンテキストを構築（隣接チャンクの結合・重複の除外を行い、トークン数の上限に収める）
+    with tracing.span(trace, "context_build"):
+        context, context_tokens = build_context(retrieval_results)
+    logger.info(f"コンテキスト: {context_tokens}トークン")
+    if trace:
+        trace.set(retrieved_documents=len(retrieval_results), context_tokens=context_tokens)
     
     # 検索結果がない場合の処理
     if not context:
         logger.warning("検索結果が見つかりませんでした")
         return {
-            "answer": "申し訳ありませんが、ご質問に関連する情報が見つかりませんでした。\n質問の表現を変えるか、別のトピックについてお尋ねください。",
+            "answer": ct.NO_RELEVANT_DOCUMENTS_MESSAGE,
             "sources": []
         }
     
@@ -95,19 +238,58 @@ def get_llm_response(query):
         "context": context,
         "question": query
     }
+
+    # LLMの呼び出し枠が空くのを待つ（待ちきれない場合はBusyErrorを送出し、画面に混雑中と表示する）
+    limiter = concurrency.get_limiter("chat")
+    if trace:
+        trace.set(llm_queue_depth=limiter.stats()["queued"])
+    with tracing.span(trace, "llm_queue"):
+        limiter.acquire()
+    # ストリーミング時は、呼び出し枠の返却を回答の配信側に任せる
+    handed_over = False
     
     # プロンプトを実行してLLMからの回答を取得
     try:
         # プロンプトからLLMへの入力を生成
-        prompt_content = prompt_template.format(**prompt_input)
+        with tracing.span(trace, "prompt_format"):
+            prompt_content = prompt_template.format(**prompt_input)
         logger.debug(f"プロンプト: {prompt_content}")
+        if trace:
+            trace.set(prompt_tokens=count_tokens(prompt_content), streamed=stream)
+
+        # 回答を回答キャッシュに保存する関数（参照したページの内容ハッシュも記録）
+        def save_to_cache(answer_text):
+            if trace:
+                trace.set(answer_tokens=count_tokens(answer_text))
+            if use_answer_cache:
+                fingerprints = {
+                    doc.metadata.get("page_id"): doc.metadata.get("content_hash")
+                    for doc in retrieval_results
+                }
+                answer_cache.put(mode, query, answer_text, sources, fingerprints, query_vector)
+
+        # ストリーミングの場合、回答は別スレッドで受け取り、表示側（同じ質問をした全員）に逐次配信する
+        if stream:
+            answer_stream = concurrency.SharedStream(
+                release_after(stream_llm_answer(llm, prompt_content, on_complete=save_to_cache, trace=trace), limiter),
+                on_finish=on_finish
+            )
+            handed_over = True
+            return {
+                "answer": answer_stream,
+                "sources": sources
+            }
         
-        # LLMで回答を生成
-        answer = llm.invoke(prompt_content)
+        # LLMで回答を生成（一括で受け取る場合は、最初のトークンまでの時間は全体と同じ）
+        with tracing.span(trace, "llm"):
+            answer = llm.invoke(prompt_content)
+        if trace:
+            trace.mark("time_to_first_token")
         answer_text = answer.content
+        save_to_cache(answer_text)
         
         # モードに応じた回答処理
-        if st.session_state.mode == ct.ANSWER_MODE_1:
+        if mode == ct.ANSWER_MODE_1:
             # 社内文書検索モードの場合、関連文書の一覧を返す
             return {
                 "answer": answer_text,
@@ -122,4 +304,73 @@ def get_llm_response(query):
             
     except Exception as e:
         logger.error(f"LLM呼び出しエラー: {e}")
-        raise Exception(f"LLMからの回答取得に失敗しました: {e}")
\ No newline at end of file
+        raise Exception(f"LLMからの回答取得に失敗しました: {e}")
+    finally:
+        if not handed_over:
+            limiter.release()
+
+
+def release_after(stream, limiter):
+    """
+    ストリームを最後まで（または失敗するまで）返した後に、LLMの呼び出し枠を返却するジェネレーター
+    
+    Args:
+        stream: 回答の断片を返すジェネレーター
+        limiter: 呼び出し枠を取得済みの流量制御
+        
+    Yields:
+        str: 回答の断片
+    """
+    try:
+        yield from stream
+    finally:
+        limiter.release()
+
+
+def stream_llm_answer(llm, prompt_content, on_complete=None, trace=None):
+    """
+    LLMの回答をトークンが届くたびに返すジェネレーター
+    
+    Args:
+        llm: LLMのインスタンス
+        prompt_content: LLMに渡すプロンプト
+        on_complete: 回答を最後まで受け取った後、回答の全文を渡して呼ぶ関数
+        trace: LLMの最初のトークンまでの時間・全体の時間を記録するトレース（任意）
+        
+    Yields:
+        str: 回答の断片
+    """
+    parts = []
+    started = time.perf_counter()
+    try:
+        for chunk in llm.stream(prompt_content):
+            if chunk.content:
+                if trace and not parts:
+                    trace.add_span("llm_first_token", time.perf_counter() - started)
+                    trace.mark("time_to_first_token")
+                parts.append(chunk.content)
+                yield chunk.content
+    except Exception as e:
+        logger.error(f"LLM呼び出しエラー: {e}")
+        raise Exception(f"LLMからの回答取得に失敗しました: {e}")
+    finally:
+        if trace:
+            trace.add_span("llm", time.perf_counter() - started)
+    if on_complete:
+        on_complete("".join(parts))
+
+
+def sync_answer_cache(answer_cache, index_dir):
+    """
+    インデックスが切り替わっていた場合に、参照先のページが更新された回答をキャッシュから破棄する関数
+    
+    Args:
+        answer_cache: 回答キャッシュ
+        index_dir: 現在のインデックスのディレクトリ
+    """
+    if answer_cache.index_version == index_dir:
+        return
+    manifest = notion_sync.load_manifest(notion_sync.get_manifest_path(index_dir))
+    removed = answer_cache.sync_index(index_dir, manifest)
+    if removed:
+        logger.info(f"参照先が更新された{removed}件の回答をキャッシュから破棄しました")
@@ -0,0 +1,663 @@
+"""
+このファイルは、インデックスの世代ディレクトリに保存するベクターストアを定義するファイルです。
+どちらもLangChainのVectorStoreとして扱え、VECTOR_STORE_BACKENDで切り替えます。
+- "chroma": Chroma（従来の保存形式）
+- "local": 正規化したfloat32のベクトルをメモリマップで読み込むローカルのベクターストア
+  ベクトルは起動時に読み込まずOSのページキャッシュから参照するため、起動がコレクションの大きさによらず速く、
+  同じ世代を開いた複数のプロセスで同じメモリを共有します。
+  同期中の保存は追加分のセグメントの書き足しのみとし、セグメントをまとめてIVFを作り直すのは公開前の1度のみです。
+  検索はIVF（クラスタごとに連続して並べたベクトルのうち、近いクラスタのみを走査）か、
+  ベンチマークの基準となる全件走査（flat）を選べます。
+"""
+
+############################################################
+# 1. ライブラリの読み込み
+############################################################
+# 環境変数・ファイルパスを操作するモジュール
+import os
+# 排他制御を行うためのモジュール
+import threading
+# 一意なIDを作成するためのモジュール
+import uuid
+# JSONデータを扱うためのモジュール
+import json
+# SQLiteを扱うためのモジュール
+import sqlite3
+# ログ出力を行うためのモジュール
+import logging
+# 件数を数えるためのモジュール
+from collections import Counter
+# 型ヒントを扱うためのモジュール
+from typing import Any, Iterable, List, Optional, Tuple
+# 数値計算を行うためのモジュール
+import numpy as np
+# LangChainのVectorStoreの基底クラス
+from langchain_core.vectorstores import VectorStore
+# LangChainのDocumentクラス
+from langchain_core.documents import Document
+# LangChainのChromaを使用するためのモジュール
+from langchain_community.vectorstores import Chroma
+# 固定値・変数を定義しているファイル
+import constants as ct
+
+# ロガーの設定
+logger = logging.getLogger(ct.LOGGER_NAME)
+
+# ローカルのベクターストアの保存形式（形式の異なる保存ファイルは開かず、全件再構築させる）
+STORE_FORMAT = 2
+# チャンクID・本文・メタデータとセグメントの一覧を保存するファイル名
+CHUNKS_FILE = "chunks.sqlite3"
+
+
+############################################################
+# 2. ベクターストアの選択
+############################################################
+
+def get_backend():
+    """
+    使用するベクターストアの種類を返す関数（環境変数「VECTOR_STORE_BACKEND」で上書きできる）
+
+    Returns:
+        str: "chroma" または "local"
+    """
+    return os.getenv("VECTOR_STORE_BACKEND", ct.VECTOR_STORE_BACKEND)
+
+
+def open_store(persist_directory, embeddings):
+    """
+    指定したディレクトリのベクターストアを開く関数（VECTOR_STORE_BACKENDの種類で開く）
+
+    Args:
+        persist_directory: ベクターストアの保存先ディレクトリ
+        embeddings: Embeddingモデル
+
+    Returns:
+        VectorStore: ベクターストア
+    """
+    if get_backend() == "local":
+        return LocalVectorStore(persist_directory, embeddings)
+    return ChromaVectorStore(persist_directory=persist_directory, embedding_function=embeddings)
+
+
+def store_exists(persist_directory):
+    """
+    指定したディレクトリに、VECTOR_STORE_BACKENDの種類のベクターストアが保存されているかを返す関数
+
+    Args:
+        persist_directory: ベクターストアの保存先ディレクトリ
+
+    Returns:
+        bool: 保存されている場合はTrue
+    """
+    if get_backend() == "local":
+        return LocalVectorStore.exists(persist_directory)
+    return ChromaVectorStore.exists(persist_directory)
+
+
+############################################################
+# 3. Chroma
+############################################################
+
+class ChromaVectorStore(Chroma):
+    """
+    Chromaに、ベクターストア共通の操作（件数の取得・Embedding済みのチャンクの登録）を加えたもの
+    """
+
+    @staticmethod
+    def exists(persist_directory):
+        """Chromaの保存ファイルがあるかを返す"""
+        return any(
+            os.path.exists(os.path.join(persist_directory, name))
+            for name in ("chroma-collections.parquet", "chroma.sqlite3")
+        )
+
+    def count(self):
+        """
+        登録されているチャンク数を返す
+
+        Returns:
+            int: チャンク数
+        """
+        return self._collection.count()
+
+    def upsert(self, ids, embeddings, metadatas, documents):
+        """
+        Embedding済みのチャンクを登録する（同じIDのチャンクがあれば置き換える）
+
+        Args:
+            ids: チャンクIDのリスト
+            embeddings: Embeddingのリスト
+            metadatas: メタデータのリスト
+            documents: 本文のリスト
+        """
+        self._collection.upsert(ids=ids, embeddings=embeddings, metadatas=metadatas, documents=documents)
+
+    def compact(self):
+        """公開前の整理（Chromaは保存時に索引を更新するため、何もしない）"""
+
+
+############################################################
+# 4. ローカルのベクターストア
+############################################################
+
+class LocalVectorStore(VectorStore):
+    """
+    正規化したfloat32のベクトルをメモリマップで読み込むベクターストア
+    - vectors-<セグメント>.npy: ベクトル（保存のたびに、保存前の登録分を新しいセグメントとして書き足す）
+    - ivf-centroids-<セグメント>.npy / ivf-offsets-<セグメント>.npy: IVFのクラスタの中心と、クラスタごとの行の範囲
+      （compact()でまとめたセグメントのみ持つ。書き足したセグメントは全件走査する）
+    - chunks.sqlite3: チャンクIDごとのセグメント・行番号・本文・メタデータと、セグメントの一覧
+      （削除・置き換えた行は表から消すのみで、ベクトルのファイルは書き換えない。検索では表に残っている行のみを返す）
+    - vector_store.json: 保存形式と検索方式
+    persist()の費用は保存前の登録・削除の件数に比例し、同期中のコミットごとに全件を書き直すことはない
+    compact()で全セグメントを1つにまとめてIVFを作り直す（インデックスの公開前に1度だけ行う）
+    登録・削除はpersist()で保存するまで検索に反映されない（インデックス構築時のみ書き込み、アプリは読み込みのみ）
+    """
+
+    def __init__(self, persist_directory, embedding_function, index_type=None):
+        """
+        Args:
+            persist_directory: 保存先ディレクトリ
+            embedding_function: Embeddingモデル
+            index_type: "ivf"（クラスタで絞り込んで走査）または "flat"（全件走査）。省略時はLOCAL_VECTOR_INDEX
+        """
+        self.persist_directory = persist_directory
+        self._embedding_function = embedding_function
+        self.index_type = index_type or ct.LOCAL_VECTOR_INDEX
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._deleted = {}
+        self._conn = None
+        self._load()
+
+    @staticmethod
+    def exists(persist_directory):
+        """現在の保存形式の保存ファイルがあるかを返す（以前の形式の場合は全件再構築させるためFalse）"""
+        manifest_path = os.path.join(persist_directory, ct.LOCAL_VECTOR_MANIFEST_FILE)
+        if not os.path.exists(manifest_path):
+            return False
+        with open(manifest_path, encoding="utf-8") as f:
+            return json.load(f).get("format") == STORE_FORMAT
+
+    @property
+    def embeddings(self):
+        return self._embedding_function
+
+    # ==========================================
+    # 読み込み
+    # ==========================================
+    def _path(self, name, segment):
+        """セグメントごとのファイルのパスを返す"""
+        base, ext = os.path.splitext(name)
+        return os.path.join(self.persist_directory, f"{base}-{segment}{ext}")
+
+    def _load(self):
+        """保存済みのセグメントを開く（ベクトルはメモリマップで参照し、読み込みはしない）"""
+        if self._conn is not None:
+            self._conn.close()
+        self._conn = None
+        self._segments = []
+        self._count = 0
+
+        if not self.exists(self.persist_directory):
+            return
+        self._conn = sqlite3.connect(os.path.join(self.persist_directory, CHUNKS_FILE), check_same_thread=False)
+        for name, rows, live, ivf in self._conn.execute(
+            "SELECT name, rows, live, ivf FROM segments ORDER BY position"
+        ).fetchall():
+            self._segments.append(self._open_segment(name, rows, live, ivf))
+            self._count += live
+
+    def _open_segment(self, name, rows, live, ivf):
+        """セグメントのベクトル（とIVF）をメモリマップで開く"""
+        segment = {
+            "name": name,
+            "live": live,
+            "vectors": np.load(self._path("vectors.npy", name), mmap_mode="r"),
+            "centroids": None,
+            "offsets": None,
+            # 行を削除したセグメントのみ、表に残っている行の目印を持つ
+            "mask": None,
+        }
+        if ivf:
+            segment["centroids"] = np.load(self._path("ivf-centroids.npy", name), mmap_mode="r")
+            segment["offsets"] = np.load(self._path("ivf-offsets.npy", name), mmap_mode="r")
+        if live < rows:
+            segment["mask"] = np.zeros(rows, dtype=bool)
+            live_rows = self._conn.execute("SELECT row FROM chunks WHERE segment = ?", (name,)).fetchall()
+            segment["mask"][np.fromiter((row for row, in live_rows), dtype=np.int64, count=len(live_rows))] = True
+        return segment
+
+    def _open_for_write(self):
+        """保存ファイルがない場合は作成し、SQLiteの接続を返す"""
+        if self._conn is None:
+            os.makedirs(self.persist_directory, exist_ok=True)
+            conn = sqlite3.connect(os.path.join(self.persist_directory, CHUNKS_FILE), check_same_thread=False)
+            conn.executescript(
+                "CREATE TABLE IF NOT EXISTS segments (name TEXT PRIMARY KEY, rows INTEGER NOT NULL, "
+                "live INTEGER NOT NULL, ivf INTEGER NOT NULL, position INTEGER NOT NULL);"
+                "CREATE TABLE IF NOT EXISTS chunks (id TEXT PRIMARY KEY, segment TEXT NOT NULL, "
+                "row INTEGER NOT NULL, document TEXT NOT NULL, metadata TEXT NOT NULL);"
+                "CREATE UNIQUE INDEX IF NOT EXISTS chunks_location ON chunks (segment, row);"
+            )
+            conn.commit()
+            # 表を作成してから保存形式を記録する（記録があれば、開いた時点で表がそろっている）
+            manifest_path = os.path.join(self.persist_directory, ct.LOCAL_VECTOR_MANIFEST_FILE)
+            tmp_path = f"{manifest_path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"format": STORE_FORMAT, "index_type": self.index_type}, f)
+            os.replace(tmp_path, manifest_path)
+            self._conn = conn
+        return self._conn
+
+    def _locate(self, ids):
+        """保存済みのチャンクIDと（セグメント, 行番号）の辞書を返す（保存されていないIDは含まない）"""
+        found = {}
+        if self._conn is None:
+            return found
+        ids = list(ids)
+        with self._lock:
+            for i in range(0, len(ids), 500):
+                part = ids[i:i + 500]
+                placeholders = ",".join("?" * len(part))
+                for chunk_id, segment, row in self._conn.execute(
+                    f"SELECT id, segment, row FROM chunks WHERE id IN ({placeholders})", part
+                ):
+                    found[chunk_id] = (segment, row)
+        return found
+
+    def _fetch_rows(self, locations):
+        """（セグメント, 行番号）のチャンクID・本文・メタデータを読み込む"""
+        by_segment = {}
+        for segment, row in locations:
+            by_segment.setdefault(segment, []).append(row)
+        found = {}
+        with self._lock:
+            for segment, rows in by_segment.items():
+                for i in range(0, len(rows), 500):
+                    part = rows[i:i + 500]
+                    placeholders = ",".join("?" * len(part))
+                    for row, chunk_id, document, metadata in self._conn.execute(
+                        f"SELECT row, id, document, metadata FROM chunks WHERE segment = ? AND row IN ({placeholders})",
+                        [segment, *part]
+                    ):
+                        found[(segment, row)] = (chunk_id, document, json.loads(metadata))
+        return [found[location] for location in locations]
+
+    # ==========================================
+    # 登録・削除・保存
+    # ==========================================
+    def upsert(self, ids, embeddings, metadatas, documents):
+        """
+        Embedding済みのチャンクを登録する（同じIDのチャンクがあれば置き換える）
+
+        Args:
+            ids: チャンクIDのリスト
+            embeddings: Embeddingのリスト
+            metadatas: メタデータのリスト
+            documents: 本文のリスト
+        """
+        vectors = normalize(np.asarray(embeddings, dtype=np.float32))
+        for chunk_id, vector, metadata, document in zip(ids, vectors, metadatas, documents):
+            self._pending[chunk_id] = (vector, document, metadata or {})
+            self._deleted.pop(chunk_id, None)
+
+    def add_texts(self, texts: Iterable[str], metadatas: Optional[List[dict]] = None,
+                  ids: Optional[List[str]] = None, **kwargs: Any) -> List[str]:
+        texts = list(texts)
+        ids = ids or [uuid.uuid4().hex for _ in texts]
+        metadatas = metadatas or [{} for _ in texts]
+        self.upsert(ids, self._embedding_function.embed_documents(texts), metadatas, texts)
+        return ids
+
+    def delete(self, ids: Optional[List[str]] = None, **kwargs: Any) -> None:
+        """
+        チャンクを削除する（IDを指定しない場合は何もしない）
+
+        Args:
+            ids: 削除するチャンクIDのリスト
+        """
+        ids = list(ids or [])
+        for chunk_id in ids:
+            self._pending.pop(chunk_id, None)
+        self._deleted.update(self._locate(ids))
+
+    def count(self):
+        """
+        登録されているチャンク数を返す（保存前の登録・削除も含む）
+
+        Returns:
+            int: チャンク数
+        """
+        if not self._pending and not self._deleted:
+            return self._count
+        added = len(self._pending) - len(self._locate(self._pending))
+        return self._count - len(self._deleted) + added
+
+    def get(self, ids=None, include=("documents", "metadatas")):
+        """
+        チャンクを取得する（Chromaのgetと同じ形式で返す。保存前の登録・削除も含む）
+
+        Args:
+            ids: 取得するチャンクIDのリスト（省略時は全件）
+            include: 取得する項目（"documents"、"metadatas"）
+
+        Returns:
+            dict: ids・documents・metadatasのリスト
+        """
+        wanted = set(ids) if ids is not None else None
+        result = {"ids": [], "documents": [], "metadatas": []}
+
+        def append(chunk_id, document, metadata):
+            if wanted is not None and chunk_id not in wanted:
+                return
+            result["ids"].append(chunk_id)
+            result["documents"].append(document)
+            result["metadatas"].append(metadata)
+
+        if self._conn is not None:
+            with self._lock:
+                rows = self._conn.execute("SELECT id, document, metadata FROM chunks ORDER BY rowid").fetchall()
+            for chunk_id, document, metadata in rows:
+                if chunk_id not in self._deleted and chunk_id not in self._pending:
+                    append(chunk_id, document, json.loads(metadata))
+        for chunk_id, (_, document, metadata) in self._pending.items():
+            append(chunk_id, document, metadata)
+
+        for key in ("documents", "metadatas"):
+            if key not in include:
+                result[key] = None
+        return result
+
+    def persist(self):
+        """
+        保存前の登録を新しいセグメントとして書き足し、削除・置き換えた行をチャンクの表から消す
+        （保存済みのベクトルは読み込まず、書き直さない。IVFはcompact()で作り直す）
+        """
+        if self._conn is not None and not self._pending and not self._deleted:
+            return
+        conn = self._open_for_write()
+
+        # 置き換える行は、削除と同じく表から消す
+        removed = dict(self._deleted)
+        removed.update(self._locate(self._pending))
+        name = uuid.uuid4().hex[:12] if self._pending else None
+        if name is not None:
+            np.save(self._path("vectors.npy", name), np.stack([vector for vector, _, _ in self._pending.values()]))
+
+        removed_counts = Counter(segment for segment, _ in removed.values())
+        with self._lock, conn:
+            conn.executemany("DELETE FROM chunks WHERE id = ?", [(chunk_id,) for chunk_id in removed])
+            conn.executemany(
+                "UPDATE segments SET live = live - ? WHERE name = ?",
+                [(count, segment) for segment, count in removed_counts.items()]
+            )
+            if name is not None:
+                conn.execute(
+                    "INSERT INTO segments (name, rows, live, ivf, position) "
+                    "SELECT ?, ?, ?, 0, COALESCE(MAX(position) + 1, 0) FROM segments",
+                    (name, len(self._pending), len(self._pending))
+                )
+                conn.executemany(
+                    "INSERT INTO chunks (id, segment, row, document, metadata) VALUES (?, ?, ?, ?, ?)",
+                    [
+                        (chunk_id, name, row, document, json.dumps(metadata, ensure_ascii=False))
+                        for row, (chunk_id, (_, document, metadata)) in enumerate(self._pending.items())
+                    ]
+                )
+
+        # 開いているセグメントに削除を反映し、書き足したセグメントを開く（保存済みのセグメントは開き直さない）
+        segments = {segment["name"]: segment for segment in self._segments}
+        for segment_name, row in removed.values():
+            segment = segments[segment_name]
+            if segment["mask"] is None:
+                segment["mask"] = np.ones(len(segment["vectors"]), dtype=bool)
+            segment["mask"][row] = False
+            segment["live"] -= 1
+        if name is not None:
+            self._segments.append(self._open_segment(name, len(self._pending), len(self._pending), 0))
+        self._count += len(self._pending) - len(removed)
+        self._pending = {}
+        self._deleted = {}
+
+    def compact(self, block_size=8192):
+        """
+        全セグメントを1つにまとめ、削除した行を除いて検索方式に合わせたIVFを作り直す（インデックスの公開前に呼ぶ）
+        ベクトルはセグメントのメモリマップから分割して読み書きするため、全件をメモリに載せない
+
+        Args:
+            block_size: 1回に読み書きする行数
+        """
+        self.persist()
+        if self._conn is None:
+            return
+        ivf = self.index_type == "ivf" and self._count >= ct.LOCAL_VECTOR_IVF_MIN_ROWS
+        if len(self._segments) == 1 and self._segments[0]["mask"] is None \
+                and (self._segments[0]["centroids"] is not None) == ivf:
+            self._remove_unused_files()
+            return
+
+        # 表に残っている行の位置（セグメントの番号, 行番号）を並べる
+        live_rows = [
+            np.flatnonzero(segment["mask"]) if segment["mask"] is not None else np.arange(len(segment["vectors"]))
+            for segment in self._segments
+        ]
+        segment_indexes = np.concatenate(
+            [np.full(len(rows), i, dtype=np.int32) for i, rows in enumerate(live_rows)] or [np.zeros(0, dtype=np.int32)]
+        )
+        rows = np.concatenate(live_rows or [np.zeros(0, dtype=np.int64)])
+        total = len(rows)
+        name = uuid.uuid4().hex[:12]
+
+        if total:
+            # IVFのクラスタは抽出した行で作成し、全行の割り当ては分割して計算する
+            order = np.arange(total)
+            if ivf:
+                rng = np.random.default_rng(0)
+                sample = np.sort(rng.choice(total, min(total, ct.LOCAL_VECTOR_IVF_TRAIN_SAMPLE), replace=False))
+                centroids, _ = train_ivf(
+                    self._gather(segment_indexes[sample], rows[sample]),
+                    cluster_count=max(1, int(np.sqrt(total)))
+                )
+                assignments = np.concatenate([
+                    assign_clusters(self._gather(segment_indexes[i:i + block_size], rows[i:i + block_size]), centroids)
+                    for i in range(0, total, block_size)
+                ])
+                order = np.argsort(assignments, kind="stable")
+                offsets = np.searchsorted(assignments[order], np.arange(len(centroids) + 1)).astype(np.int64)
+                np.save(self._path("ivf-centroids.npy", name), centroids)
+                np.save(self._path("ivf-offsets.npy", name), offsets)
+
+            vectors = np.lib.format.open_memmap(
+                self._path("vectors.npy", name), mode="w+", dtype=np.float32,
+                shape=(total, self._segments[0]["vectors"].shape[1])
+            )
+            for i in range(0, total, block_size):
+                part = order[i:i + block_size]
+                vectors[i:i + len(part)] = self._gather(segment_indexes[part], rows[part])
+            vectors.flush()
+            del vectors
+
+        names = [segment["name"] for segment in self._segments]
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "UPDATE chunks SET segment = ?, row = ? WHERE segment = ? AND row = ?",
+                (
+                    (name, new_row, names[segment_indexes[old_row]], int(rows[old_row]))
+                    for new_row, old_row in enumerate(order.tolist())
+                ) if total else []
+            )
+            self._conn.execute("DELETE FROM segments")
+            if total:
+                self._conn.execute(
+                    "INSERT INTO segments (name, rows, live, ivf, position) VALUES (?, ?, ?, ?, 0)",
+                    (name, total, total, int(ivf))
+                )
+        with self._lock:
+            self._conn.execute("VACUUM")
+        self._load()
+        self._remove_unused_files()
+        logger.info(f"ベクターストアをまとめました: {len(names)}セグメント → {total}件（{'ivf' if ivf else 'flat'}）")
+
+    def _gather(self, segment_indexes, rows):
+        """（セグメントの番号, 行番号）のベクトルを読み込む"""
+        vectors = np.empty((len(rows), self._segments[0]["vectors"].shape[1]), dtype=np.float32)
+        for i, segment in enumerate(self._segments):
+            selected = np.flatnonzero(segment_indexes == i)
+            if len(selected):
+                vectors[selected] = segment["vectors"][rows[selected]]
+        return vectors
+
+    def _remove_unused_files(self):
+        """どのセグメントにも属さないファイル（まとめる前のセグメント、中断した保存の残り）を削除する"""
+        names = {segment["name"] for segment in self._segments}
+        for file_name in os.listdir(self.persist_directory):
+            for prefix in ("vectors-", "ivf-centroids-", "ivf-offsets-"):
+                if file_name.startswith(prefix) and file_name.endswith(".npy") \
+                        and file_name[len(prefix):-len(".npy")] not in names:
+                    os.remove(os.path.join(self.persist_directory, file_name))
+
+    # ==========================================
+    # 検索
+    # ==========================================
+    def search_rows(self, query_vector, k):
+        """
+        クエリのベクトルとコサイン類似度の高い行を検索する
+
+        Args:
+            query_vector: クエリのEmbedding
+            k: 取得件数
+
+        Returns:
+            list: （（セグメント, 行番号）, コサイン類似度）のリスト（類似度の高い順）
+        """
+        if k <= 0:
+            return []
+        query = normalize(np.asarray(query_vector, dtype=np.float32))
+
+        candidates = []
+        for segment in self._segments:
+            rows, scores = self._scan_segment(segment, query)
+            if segment["mask"] is not None:
+                live = segment["mask"][rows]
+                rows, scores = rows[live], scores[live]
+            if len(rows):
+                candidates.append((segment["name"], rows, scores))
+        if not candidates:
+            return []
+
+        scores = np.concatenate([scores for _, _, scores in candidates])
+        locations = [(name, int(row)) for name, rows, _ in candidates for row in rows]
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(locations[i], float(scores[i])) for i in top]
+
+    def _scan_segment(self, segment, query):
+        """セグメントを走査し、（行番号, コサイン類似度）の配列を返す（IVFがある場合は近いクラスタの行のみ）"""
+        vectors = segment["vectors"]
+        if segment["centroids"] is None:
+            return np.arange(len(vectors)), vectors @ query
+
+        nprobe = min(ct.LOCAL_VECTOR_IVF_NPROBE, len(segment["centroids"]))
+        probes = np.argpartition(-(segment["centroids"] @ query), nprobe - 1)[:nprobe]
+        rows, scores = [np.zeros(0, dtype=np.int64)], [np.zeros(0, dtype=np.float32)]
+        for cluster in probes:
+            start, end = int(segment["offsets"][cluster]), int(segment["offsets"][cluster + 1])
+            if end > start:
+                rows.append(np.arange(start, end))
+                scores.append(vectors[start:end] @ query)
+        return np.concatenate(rows), np.concatenate(scores)
+
+    def similarity_search_with_score(self, query: str, k: int = 4, **kwargs: Any) -> List[Tuple[Document, float]]:
+        return self.similarity_search_by_vector_with_score(self._embedding_function.embed_query(query), k)
+
+    def similarity_search_by_vector_with_score(self, embedding: List[float], k: int = 4) -> List[Tuple[Document, float]]:
+        results = self.search_rows(embedding, k)
+        if not results:
+            return []
+        chunks = self._fetch_rows([location for location, _ in results])
+        return [
+            (Document(page_content=document, metadata=metadata), score)
+            for (_, document, metadata), (_, score) in zip(chunks, results)
+        ]
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_by_vector_with_score(embedding, k)]
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k)]
+
+    def _select_relevance_score_fn(self):
+        # ベクトルは正規化済みのため、コサイン類似度をそのまま関連度とする
+        return lambda score: score
+
+    @classmethod
+    def from_texts(cls, texts: List[str], embedding: Any, metadatas: Optional[List[dict]] = None,
+                   persist_directory: Optional[str] = None, **kwargs: Any) -> "LocalVectorStore":
+        store = cls(persist_directory, embedding)
+        store.add_texts(texts, metadatas=metadatas, ids=kwargs.get("ids"))
+        store.compact()
+        return store
+
+
+############################################################
+# 5. ベクトルの計算
+############################################################
+
+def normalize(vectors):
+    """
+    ベクトルをL2ノルムが1になるよう正規化する関数
+
+    Args:
+        vectors: ベクトル（1次元）またはベクトルを並べた行列（2次元）
+
+    Returns:
+        numpy.ndarray: 正規化したベクトル
+    """
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def train_ivf(vectors, cluster_count=None, iterations=ct.LOCAL_VECTOR_IVF_ITERATIONS, seed=0):
+    """
+    IVFのクラスタを球面k-means（コサイン類似度でのk-means）で作成する関数
+
+    Args:
+        vectors: 正規化したベクトルを並べた行列（全行から抽出した行でもよい）
+        cluster_count: クラスタ数（省略時は行数の平方根）
+        iterations: k-meansの反復回数
+        seed: 初期値を選ぶ乱数のシード（同じ内容なら同じクラスタになる）
+
+    Returns:
+        tuple: （クラスタの中心の行列, 行ごとのクラスタ番号）
+    """
+    rng = np.random.default_rng(seed)
+    cluster_count = min(cluster_count or max(1, int(np.sqrt(len(vectors)))), len(vectors))
+    centroids = vectors[rng.choice(len(vectors), cluster_count, replace=False)].copy()
+    for _ in range(iterations):
+        assignments = assign_clusters(vectors, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, vectors)
+        # 行が割り当てられなかったクラスタは、中心をそのまま残す
+        filled = np.bincount(assignments, minlength=cluster_count) > 0
+        centroids[filled] = normalize(sums[filled])
+    return centroids, assign_clusters(vectors, centroids)
+
+
+def assign_clusters(vectors, centroids, block_size=8192):
+    """
+    各行を最も近い（コサイン類似度が高い）クラスタに割り当てる関数（メモリ使用量を抑えるため分割して計算）
+
+    Args:
+        vectors: 正規化したベクトルを並べた行列
+        centroids: クラスタの中心の行列
+        block_size: 1回に計算する行数
+
+    Returns:
+        numpy.ndarray: 行ごとのクラスタ番号
+    """
+    return np.concatenate([
+        np.argmax(vectors[i:i + block_size] @ centroids.T, axis=1)
+        for i in range(0, len(vectors), block_size)
+    ]) if len(vectors) else np.zeros(0, dtype=np.int64)